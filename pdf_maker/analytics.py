@@ -0,0 +1,256 @@
+# analytics.py
+
+"""
+Cohort analytics over many graded sessions, computed with NumPy.
+
+    matrix = GradesMatrix.from_records(records)   # or GradesMatrix.from_store(store)
+    matrix.item_means(), matrix.item_percentiles(), matrix.weakest_items()
+    forces, deltas = matrix.latest_deltas()
+
+A GradesMatrix holds the grades as one sessions × rubric items array (NaN where an
+item was not graded) with the force and date of every session in parallel arrays,
+so every statistic is a handful of array operations instead of a loop over sessions.
+"""
+
+import os
+import sqlite3
+
+import numpy as np
+
+from grades import GRADING_PARTS
+from grades_store import GRADES_DB_PATH, GradesStore, iso_date
+
+# Number of past sessions shown in the trend chart of a report
+REPORT_TREND_SESSIONS = int(os.getenv("REPORT_TREND_SESSIONS", "10"))
+
+def default_items():
+    """
+    Returns the (part, item) columns of the current rubric, part by part.
+    """
+    return [(part, item) for part, items in GRADING_PARTS.items() for item in items]
+
+class GradesMatrix:
+    """
+    Grades of many sessions in columnar form:
+    grades is a float array of shape (sessions, items), with NaN for items a session
+    was not graded on; items lists the (part, item) of each column, with the items
+    of each part next to each other; forces holds an index into force_names and
+    dates a numpy datetime64[D] for every session.
+    """
+
+    def __init__(self, grades, items, forces, force_names, dates):
+        grades = np.asarray(grades, dtype=float)
+        if grades.size:
+            self.grades = grades.reshape(-1, len(items))
+        else:
+            # Nothing to infer the number of sessions from (and reshape(-1, 0) fails)
+            self.grades = np.empty((grades.shape[0] if grades.ndim == 2 else 0, len(items)))
+        self.items = list(items)
+        self.forces = np.asarray(forces, dtype=np.int64)
+        self.force_names = list(force_names)
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+
+        self.parts = list(dict.fromkeys(part for part, _ in self.items))
+        part_of_item = np.array([self.parts.index(part) for part, _ in self.items], dtype=np.int64)
+        if np.any(np.diff(part_of_item) < 0):
+            raise ValueError("The items of each part must be in adjacent columns")
+        # Column where each part's items start, for np.add.reduceat
+        self._part_starts = np.searchsorted(part_of_item, np.arange(len(self.parts)))
+        # Which grades exist, and the grades with 0 for the missing ones, shared by the statistics below
+        self._graded = ~np.isnan(self.grades)
+        self._filled = np.where(self._graded, self.grades, 0.0)
+
+    def __len__(self):
+        return len(self.grades)
+
+    @classmethod
+    def from_records(cls, records, items=None):
+        """
+        Builds the matrix from session dicts as taken by GradesStore.add_sessions:
+        {"grades_data": ..., "force_name": ..., "date": ...}. Items missing from
+        `items` (by default the current rubric) are ignored.
+        """
+        items = items or default_items()
+        part_items = {}
+        for part, item in items:
+            part_items.setdefault(part, []).append(item)
+
+        # All grades in one flat list, session by session, converted to an array at once
+        values = []
+        for record in records:
+            grades_data = record["grades_data"]
+            for part, names in part_items.items():
+                grades = grades_data.get(part, {}).get("items", {})
+                if list(grades) == names:
+                    # Usually a part has exactly the rubric's items, in order
+                    values.extend(grades.values())
+                else:
+                    values.extend(grades.get(item, np.nan) for item in names)
+        force_codes = {}
+        forces = [force_codes.setdefault(record["force_name"], len(force_codes)) for record in records]
+        dates = [iso_date(record["date"]) for record in records]
+        return cls(np.array(values, dtype=float).reshape(len(records), len(items)), items, forces, list(force_codes), dates)
+
+    @classmethod
+    def from_store(cls, store, force_name=None, since=None, until=None):
+        """
+        Loads the matching sessions of a GradesStore, oldest session id first.
+        """
+        rubric = store.rubric_items()
+        # Keep each part's items together, in the order the parts were first seen
+        part_order = {part: index for index, part in enumerate(dict.fromkeys(part for _, part, _ in rubric))}
+        rubric.sort(key=lambda row: (part_order[row[1]], row[0]))
+        items = [(part, item) for _, part, item in rubric]
+        column_of_item = np.full(max((row[0] for row in rubric), default=0) + 1, -1, dtype=np.int64)
+        column_of_item[np.array([row[0] for row in rubric], dtype=np.int64)] = np.arange(len(rubric))
+
+        sessions = store.packed_sessions(force_name, since, until)
+        force_codes = {}
+        forces = [force_codes.setdefault(row[0], len(force_codes)) for row in sessions]
+        dates = [row[1] for row in sessions]
+
+        # Unpack the grades of all sessions at once: the item ids and grades of every
+        # session one after the other, and the session each of them belongs to
+        item_ids = np.frombuffer(b"".join(row[2] for row in sessions), dtype=np.intc)
+        values = np.frombuffer(b"".join(row[3] for row in sessions), dtype=np.float64)
+        counts = np.array([len(row[3]) for row in sessions], dtype=np.int64) // values.itemsize
+        grades = np.full((len(sessions), len(items)), np.nan)
+        grades[np.repeat(np.arange(len(sessions)), counts), column_of_item[item_ids]] = values
+        return cls(grades, items, forces, list(force_codes), dates)
+
+    def select(self, mask):
+        """
+        Returns a matrix of the sessions where the boolean mask (or index array) selects them.
+        """
+        return GradesMatrix(self.grades[mask], self.items, self.forces[mask], self.force_names, self.dates[mask])
+
+    def force(self, force_name):
+        """
+        Returns the matrix of one force's sessions, oldest first.
+        """
+        if force_name not in self.force_names:
+            return self.select(np.zeros(len(self), dtype=bool))
+        selected = np.flatnonzero(self.forces == self.force_names.index(force_name))
+        return self.select(selected[np.argsort(self.dates[selected], kind="stable")])
+
+    def item_means(self):
+        """
+        Mean grade of every item (NaN for items nobody was graded on).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._filled.sum(axis=0) / self._graded.sum(axis=0)
+
+    def item_stds(self):
+        """
+        Standard deviation (population) of the grades of every item.
+        """
+        deviations = np.where(self._graded, self.grades - self.item_means(), 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.einsum("ij,ij->j", deviations, deviations) / self._graded.sum(axis=0))
+
+    def item_percentiles(self, percentiles=(25, 50, 75)):
+        """
+        Array of shape (len(percentiles), items) with the percentiles of every item's grades.
+        """
+        if self._graded.all():
+            # np.percentile partitions all columns at once; the NaN-aware version goes column by column
+            return np.percentile(self.grades, percentiles, axis=0)
+        return np.nanpercentile(self.grades, percentiles, axis=0)
+
+    def part_averages(self):
+        """
+        Array of shape (sessions, parts) with the average of each part in each session,
+        like the "average" of grades.summarize_grades (unrounded).
+        """
+        sums = np.add.reduceat(self._filled, self._part_starts, axis=1)
+        counts = np.add.reduceat(self._graded, self._part_starts, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def final_grades(self):
+        """
+        Final grade of every session: the mean of its part averages.
+        """
+        averages = self.part_averages()
+        graded = ~np.isnan(averages)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(graded, averages, 0.0).sum(axis=1) / graded.sum(axis=1)
+
+    def latest_deltas(self):
+        """
+        Change of every item between each force's last two sessions.
+        Returns (force indexes, array of shape (forces, items)); the deltas of forces
+        with a single session, and of items missing from either session, are NaN.
+        """
+        if not len(self):
+            return np.array([], dtype=np.int64), np.empty((0, len(self.items)))
+        order = np.lexsort((np.arange(len(self)), self.dates, self.forces))
+        forces = self.forces[order]
+        # Last session of each force in (force, date) order, and the one before it
+        last = np.flatnonzero(np.append(forces[1:] != forces[:-1], True))
+        previous = last - 1
+        has_previous = (previous >= 0) & (forces[np.maximum(previous, 0)] == forces[last])
+        deltas = self.grades[order[last]] - self.grades[order[np.maximum(previous, 0)]]
+        deltas[~has_previous] = np.nan
+        return forces[last], deltas
+
+    def weakest_items(self, count=3):
+        """
+        Returns the (part, item, mean grade) of the `count` items with the lowest mean, lowest first.
+        """
+        means = self.item_means()
+        order = np.argsort(np.where(np.isnan(means), np.inf, means), kind="stable")[:count]
+        return [(*self.items[index], float(means[index])) for index in order if not np.isnan(means[index])]
+
+    def period_trend(self, period="M"):
+        """
+        Mean part averages and final grade per calendar period ("D", "W", "M" or "Y").
+        Returns (periods as datetime64, array of shape (periods, parts), final grade per period).
+        """
+        periods, inverse = np.unique(self.dates.astype(f"datetime64[{period}]"), return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        def period_means(values):
+            # Mean of the non-NaN values of each period (bincount is a fast grouped sum)
+            graded = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(graded, values, 0.0), minlength=len(periods))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return sums / np.bincount(inverse, weights=graded, minlength=len(periods))
+
+        averages = self.part_averages()
+        part_means = np.column_stack([period_means(averages[:, part]) for part in range(len(self.parts))])
+        return periods, part_means.reshape(len(periods), len(self.parts)), period_means(self.final_grades())
+
+def report_trends(grades_data, force_name, date, path=GRADES_DB_PATH, sessions=REPORT_TREND_SESSIONS):
+    """
+    Returns the trend data for the report of a new session, from the force's saved
+    sessions in the grades store at `path` followed by this one, or None if the force
+    has no earlier sessions (or the store is disabled or unreadable):
+        {"dates": [...], "parts": [...], "part_averages": [[...], ...],
+         "final_grades": [...], "weakest_items": [(part, item, mean), ...]}
+    Only the last `sessions` sessions are charted; the weakest items are over all of them.
+    """
+    if not path or not grades_data or not os.path.exists(path):
+        return None
+    try:
+        with GradesStore(path) as store:
+            history = GradesMatrix.from_store(store, force_name=force_name)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read the grades history from '{path}': {e}")
+        return None
+    if not len(history) or not history.items:
+        return None
+
+    current = GradesMatrix.from_records([{"grades_data": grades_data, "force_name": force_name, "date": date}], history.items)
+    matrix = GradesMatrix(
+        np.vstack([history.grades, current.grades]), history.items, np.zeros(len(history) + 1),
+        [force_name], np.concatenate([history.dates, current.dates])
+    ).force(force_name)
+    recent = matrix.select(np.arange(max(0, len(matrix) - sessions), len(matrix)))
+    return {
+        "dates": [str(day) for day in recent.dates],
+        "parts": recent.parts,
+        "part_averages": np.round(recent.part_averages(), 2).tolist(),
+        "final_grades": np.round(recent.final_grades(), 2).tolist(),
+        "weakest_items": matrix.weakest_items()
+    }
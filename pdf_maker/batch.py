@@ -0,0 +1,299 @@
+# batch.py
+
+"""
+Generates many combat reports in one run.
+Run `python batch.py <directory or manifest.json> [options]`; see `python batch.py -h`.
+
+A directory holds one `<name>.txt` debrief per report with an optional
+`<name>.json` next to it. A manifest is a JSON list of records. Both use the
+same record fields:
+
+    {
+        "name": "team_a",                      # defaults to the file name
+        "text_file": "team_a.txt",             # or "text": "..."
+        "grades": {"<part>": {"items": {"<item>": 8, ...}, "comment": "..."}, ...},
+        "force_name": "...", "location": "...", "manager_name": "...", "date": "dd/mm/YYYY"
+    }
+
+"grades" may also be given as "grades_file" holding the same JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from gpt_integration import (
+    improve_text_async, improve_text_structured_async, set_max_in_flight, create_combat_report_from_text, create_combat_report_pdf,
+    run_with_llm
+)
+from grades import summarize_grades
+from grades_store import GRADES_DB_PATH, GradesStore
+from llm_cache import llm_cache
+from llm_client import llm_client
+from document_generator import CHART_BACKENDS
+
+DEFAULT_MANAGER_NAME = "יואב סמיפור"
+DEFAULT_FORCE_NAME = "כוח האימון"
+DEFAULT_LOCATION = "מיקום האימון"
+
+OUTPUT_FORMATS = ("docx", "pdf")
+
+class RateLimiter:
+    """
+    Spaces out request starts so that at most `per_minute` requests begin in any minute.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def _resolve(base_dir, path):
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+def load_records(source):
+    """
+    Loads the report records from a directory of debriefs or a JSON manifest.
+    Relative paths in a manifest are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        base_dir = source
+        records = []
+        for file_name in sorted(os.listdir(source)):
+            if not file_name.endswith(".txt"):
+                continue
+            name = file_name[:-len(".txt")]
+            record = {"name": name, "text_file": file_name}
+            sidecar = os.path.join(source, f"{name}.json")
+            if os.path.exists(sidecar):
+                record = {**record, **_read_json(sidecar)}
+            records.append(record)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        records = _read_json(source)
+
+    for index, record in enumerate(records):
+        if "text" not in record:
+            with open(_resolve(base_dir, record["text_file"]), "r", encoding="utf-8") as file:
+                record["text"] = file.read()
+        if "grades" not in record and "grades_file" in record:
+            record["grades"] = _read_json(_resolve(base_dir, record["grades_file"]))
+        record.setdefault("name", os.path.splitext(os.path.basename(record.get("text_file", "")))[0] or f"report_{index + 1}")
+    return records
+
+def grades_from_record(grades):
+    """
+    Builds grades_data from a record's grades ({part: {"items": {...}, "comment": ...}}).
+    Returns None if the record has no grades; raises ValueError for a grade that is not
+    a number between 1 and 10, like the grades entered in main.py and the bot.
+    """
+    if not grades:
+        return None
+    parts = {part_name: {item: float(grade) for item, grade in part["items"].items()} for part_name, part in grades.items()}
+    for part_name, items in parts.items():
+        for item, grade in items.items():
+            if not 1 <= grade <= 10:  # Also false for NaN
+                raise ValueError(f"grade {grade} of '{item}' in '{part_name}' is not between 1 and 10")
+    comments = {part_name: part.get("comment", "") for part_name, part in grades.items()}
+    return summarize_grades(parts, comments)
+
+def unique_output_path(output_dir, name, taken, extension="docx"):
+    """
+    Returns an output path for the report that no other report of this run
+    and no existing file uses.
+    """
+    safe_name = re.sub(r'[^\w\-]+', '_', name).strip('_') or "report"
+    path = os.path.join(output_dir, f"combat_report_{safe_name}.{extension}")
+    counter = 2
+    while path in taken or os.path.exists(path):
+        path = os.path.join(output_dir, f"combat_report_{safe_name}_{counter}.{extension}")
+        counter += 1
+    taken.add(path)
+    return path
+
+def _render_report(improved_text, output_path, date, grades_data, signature, chart_backend, output_format):
+    """
+    Process pool job: writes one report document and returns the time it took.
+    """
+    start = time.perf_counter()
+    if output_format == "pdf":
+        create_combat_report_pdf(improved_text, output_path, date=date, grades_data=grades_data, signature=signature)
+    else:
+        create_combat_report_from_text(
+            improved_text, output_path, date=date, grades_data=grades_data, signature=signature, chart_backend=chart_backend
+        )
+    return time.perf_counter() - start
+
+async def _process_record(record, output_path, rate_limiter, pool, use_cache, chart_backend, structured, output_format):
+    """
+    Runs the LLM request of one record and hands the document to the process pool
+    as soon as the text is ready, so rendering overlaps the remaining requests.
+    """
+    result = {"name": record["name"], "output": output_path, "llm_seconds": 0.0, "render_seconds": 0.0, "error": ""}
+    manager_name = record.get("manager_name", DEFAULT_MANAGER_NAME)
+    date = record.get("date") or datetime.now().strftime('%d/%m/%Y')
+
+    try:
+        grades_data = grades_from_record(record.get("grades"))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+        result["error"] = f"Invalid grades: {e}"
+        return result
+
+    await rate_limiter.wait()
+    start = time.perf_counter()
+    improve = improve_text_structured_async if structured else improve_text_async
+    improved_text = await improve(
+        record["text"],
+        date,
+        manager_name,
+        record.get("force_name", DEFAULT_FORCE_NAME),
+        record.get("location", DEFAULT_LOCATION),
+        use_cache=use_cache
+    )
+    result["llm_seconds"] = time.perf_counter() - start
+    if not improved_text:
+        result["error"] = "LLM returned no text"
+        return result
+
+    try:
+        result["render_seconds"] = await asyncio.get_running_loop().run_in_executor(
+            pool, _render_report, improved_text, output_path, date, grades_data, manager_name, chart_backend, output_format
+        )
+    except Exception as e:
+        result["error"] = f"Rendering failed: {e}"
+    return result
+
+async def run_batch(records, output_dir, concurrency=4, requests_per_minute=0, workers=None, use_cache=True, chart_backend="png",
+                    structured=False, output_format="docx"):
+    """
+    Generates a report for every record. At most `concurrency` LLM requests run at
+    once, starting at most `requests_per_minute` per minute (0 = no limit), and the
+    documents are rendered on a pool of `workers` processes.
+    With structured=True the text is requested in JSON mode (see improve_text_structured_async).
+    output_format is "docx" or "pdf" (see pdf_generator).
+    Returns one result dict per record, in record order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    set_max_in_flight(concurrency)
+    rate_limiter = RateLimiter(requests_per_minute)
+
+    taken = set()
+    output_paths = [unique_output_path(output_dir, record["name"], taken, output_format) for record in records]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return await asyncio.gather(*(
+            _process_record(record, output_path, rate_limiter, pool, use_cache, chart_backend, structured, output_format)
+            for record, output_path in zip(records, output_paths)
+        ))
+
+def save_sessions(records, results, path):
+    """
+    Saves the grades of the successfully generated reports to the grades store at `path`
+    in one transaction. Returns the number of sessions saved.
+    """
+    sessions = [
+        {
+            "grades_data": grades_from_record(record.get("grades")),
+            "force_name": record.get("force_name", DEFAULT_FORCE_NAME),
+            "date": record.get("date") or datetime.now().strftime('%d/%m/%Y'),
+            "location": record.get("location", DEFAULT_LOCATION),
+            "manager_name": record.get("manager_name", DEFAULT_MANAGER_NAME)
+        }
+        for record, result in zip(records, results)
+        if not result["error"] and record.get("grades")
+    ]
+    if not sessions:
+        return 0
+    try:
+        with GradesStore(path) as store:
+            store.add_sessions(sessions)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Warning: Could not save the grades to '{path}': {e}")
+        return 0
+    return len(sessions)
+
+def print_summary(results, elapsed, llm_metrics=None):
+    """
+    Prints per-report timings and failures, and the LLM client metrics if given.
+    """
+    print(f"\n{'report':<24} {'llm':>8} {'render':>8}  result")
+    for result in results:
+        status = f"FAILED: {result['error']}" if result["error"] else result["output"]
+        print(f"{result['name'][:24]:<24} {result['llm_seconds']:>7.2f}s {result['render_seconds']:>7.2f}s  {status}")
+    failed = sum(1 for result in results if result["error"])
+    print(f"\n{len(results) - failed}/{len(results)} reports generated in {elapsed:.2f}s, {failed} failed.")
+    if llm_metrics:
+        print(
+            f"LLM requests: {llm_metrics['retries']} retries, {llm_metrics['hedges']} hedged, "
+            f"{llm_metrics['rejected']} refused by the circuit breaker; latency p50 {llm_metrics['latency_p50']}s, "
+            f"p95 {llm_metrics['latency_p95']}s, p99 {llm_metrics['latency_p99']}s"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate combat reports for a directory or manifest of debriefs.")
+    parser.add_argument("source", help="Directory of <name>.txt (+ <name>.json) debriefs, or a JSON manifest.")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum LLM requests in flight.")
+    parser.add_argument("--rpm", type=int, default=0, help="Maximum LLM requests started per minute (0 = no limit).")
+    parser.add_argument("--workers", type=int, default=None, help="Document rendering processes (default: CPU count).")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="docx")
+    parser.add_argument("--chart-backend", choices=CHART_BACKENDS, default="png", help="Chart type of docx reports.")
+    parser.add_argument("--no-cache", action="store_true", help="Always make a new LLM request.")
+    parser.add_argument("--structured", action="store_true", help="Request the sections as validated JSON.")
+    parser.add_argument("--summary", help="Also write the per-report results to this JSON file.")
+    parser.add_argument("--grades-db", default=GRADES_DB_PATH, help="Grades store to save the sessions to (empty = don't save).")
+    args = parser.parse_args()
+
+    try:
+        records = load_records(args.source)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Could not load records from '{args.source}': {e}")
+        return
+
+    start = time.perf_counter()
+    results = run_with_llm(run_batch(
+        records,
+        args.output_dir,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        chart_backend=args.chart_backend,
+        structured=args.structured,
+        output_format=args.format
+    ))
+    elapsed = time.perf_counter() - start
+    llm_metrics = llm_client.metrics.snapshot()
+    print_summary(results, elapsed, llm_metrics)
+    print(llm_cache.summary())
+    if args.grades_db:
+        saved = save_sessions(records, results, args.grades_db)
+        if saved:
+            print(f"Saved the grades of {saved} sessions to '{args.grades_db}'.")
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as file:
+            json.dump({"elapsed_seconds": elapsed, "llm_client": llm_metrics, "llm_cache": llm_cache.stats(), "reports": results}, file, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1126 @@
+# benchmarks.py
+
+"""
+Offline benchmarks for the report pipeline.
+Run `python benchmarks.py <benchmark> [options]`; see `python benchmarks.py -h`.
+`python benchmarks.py suite --output results.json [--compare baseline.json]` times every
+stage of the pipeline and compares the results with those of another commit.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+from chart_utils import create_bar_chart, create_final_grade_chart
+from chart_pool import chart_jobs_for_report, render_chart_job, render_charts_for_reports, get_chart_pool, warm_chart_pool, CHART_POOL_WORKERS
+from document_generator import generate_word_document, generate_word_document_bytes, CHART_BACKENDS
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.shared import Pt
+from fake_llm import fake_openai, CANNED_RESPONSE, CANNED_STRUCTURED_RESPONSE
+from mock_llm_server import running_mock_server
+import batch
+import gpt_integration
+from llm_client import llm_client
+from grades import GRADING_PARTS, summarize_grades
+from grades_store import GradesStore
+from analytics import GradesMatrix, report_trends
+from hyperlink_utils import add_hyperlink
+from pdf_generator import generate_pdf_report_bytes
+from report_styles import register_report_styles, add_styled_paragraph
+from chunking import estimate_tokens
+from report_queue import ReportQueue, QueueFullError, UserLimitError
+from startup import load_report_modules
+from bot_state import BotStatePersistence, encode_data
+from tracing import span, traced, enable_tracing, disable_tracing, tracing_enabled, trace_report, reset_trace_stats
+from gpt_integration import (
+    improve_text_async, improve_text_structured_async, set_max_in_flight, parse_to_sections, LLM_MAX_IN_FLIGHT, SECTION_NAMES,
+    save_improved_text_to_file, create_combat_report_from_file, run_with_llm
+)
+
+def sample_grades_data(seed=0):
+    """
+    Returns grades_data with random grades for every rubric item.
+    """
+    rng = random.Random(seed)
+    parts = {
+        part_name: {item_name: float(rng.randint(1, 10)) for item_name in items}
+        for part_name, items in GRADING_PARTS.items()
+    }
+    comments = {part_name: "הערה לדוגמה" for part_name in GRADING_PARTS}
+    return summarize_grades(parts, comments)
+
+def bench_llm_concurrency(conversations=20, latency=1.0, max_in_flight=None):
+    """
+    Load test for the bot's LLM path: runs `conversations` simulated conversations
+    at once against a fake LLM with a fixed latency. With enough in-flight slots
+    they should all finish in about the time of a single call.
+    Also measures the worst event loop stall, i.e. how long other chats would wait.
+    """
+    max_in_flight = max_in_flight or conversations
+
+    async def conversation(index):
+        return await improve_text_async(f"debrief {index}", "01/01/2024", "manager", "force", "location", use_cache=False)
+
+    async def heartbeat(stop, lags):
+        # Wakes up every 10 ms and records how late it was woken
+        while not stop.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - expected)
+
+    async def run():
+        set_max_in_flight(max_in_flight)
+        stop = asyncio.Event()
+        lags = []
+        monitor = asyncio.create_task(heartbeat(stop, lags))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(conversation(i) for i in range(conversations)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+        return results, elapsed, max(lags, default=0.0)
+
+    with fake_openai(latency) as fake, contextlib.redirect_stdout(io.StringIO()):
+        results, elapsed, max_lag = run_with_llm(run())
+
+    set_max_in_flight(LLM_MAX_IN_FLIGHT)
+    completed = sum(1 for result in results if result)
+    print(f"Conversations:       {conversations} ({completed} completed, {fake.calls} LLM calls)")
+    print(f"Max in flight:       {max_in_flight}")
+    print(f"LLM latency:         {latency:.2f}s")
+    print(f"Total time:          {elapsed:.2f}s ({elapsed / latency:.2f}x one call)")
+    print(f"Serial estimate:     {conversations * latency:.2f}s")
+    print(f"Max event loop lag:  {max_lag * 1000:.1f}ms")
+    return elapsed
+
+def bench_llm_streaming(latency=1.0, chunk_delay=0.02):
+    """
+    Compares the time until the first visible output with and without streaming.
+    """
+    async def run(stream):
+        first_output = None
+        start = time.perf_counter()
+
+        async def on_delta(partial_text):
+            nonlocal first_output
+            if first_output is None:
+                first_output = time.perf_counter() - start
+
+        result = await improve_text_async(
+            "debrief", "01/01/2024", "manager", "force", "location",
+            use_cache=False, on_delta=on_delta if stream else None
+        )
+        total = time.perf_counter() - start
+        return first_output if stream else total, total, result
+
+    with fake_openai(latency, chunk_delay=chunk_delay), contextlib.redirect_stdout(io.StringIO()):
+        blocking_first, blocking_total, _ = run_with_llm(run(False))
+        streaming_first, streaming_total, _ = run_with_llm(run(True))
+
+    print(f"Blocking:   first output {blocking_first:.2f}s, complete {blocking_total:.2f}s")
+    print(f"Streaming:  first output {streaming_first:.2f}s, complete {streaming_total:.2f}s")
+    return streaming_first, blocking_first
+
+def bench_chart_rendering(report_counts=(1, 10, 100), workers=None):
+    """
+    Compares rendering every chart of N reports one after another in this process
+    with rendering them on the warm chart process pool.
+    """
+    workers = workers or CHART_POOL_WORKERS
+    pool = get_chart_pool(workers)
+    warm_chart_pool(workers)
+    # Render one chart here too so both paths start with matplotlib loaded
+    render_chart_job(chart_jobs_for_report(sample_grades_data())[0])
+
+    print(f"Pool workers: {workers}")
+    print(f"{'reports':>8} {'charts':>7} {'serial':>9} {'pooled':>9} {'speedup':>8}")
+    results = []
+    for count in report_counts:
+        reports = [sample_grades_data(seed) for seed in range(count)]
+
+        start = time.perf_counter()
+        serial_charts = [[render_chart_job(job) for job in chart_jobs_for_report(grades_data)] for grades_data in reports]
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_charts_for_reports(reports, pool)
+        pooled_time = time.perf_counter() - start
+
+        chart_count = sum(len(charts) for charts in serial_charts)
+        print(f"{count:>8} {chart_count:>7} {serial_time:>8.2f}s {pooled_time:>8.2f}s {serial_time / pooled_time:>7.2f}x")
+        results.append((count, serial_time, pooled_time))
+    return results
+
+def bench_chart_backends(reports=5):
+    """
+    Compares generation time and output size of the PNG and native DOCX chart backends.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        sections = parse_to_sections(CANNED_RESPONSE)
+    grades_data = sample_grades_data()
+
+    print(f"{'backend':>8} {'time/report':>12} {'size':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for backend in CHART_BACKENDS:
+            output_path = os.path.join(output_dir, f"{backend}.docx")
+            with contextlib.redirect_stdout(io.StringIO()):
+                # Warm-up run so imports and font lookups are not counted
+                generate_word_document(sections, output_path, grades_data=grades_data, chart_backend=backend)
+                start = time.perf_counter()
+                for _ in range(reports):
+                    generate_word_document(sections, output_path, grades_data=grades_data, chart_backend=backend)
+                elapsed = (time.perf_counter() - start) / reports
+            size = os.path.getsize(output_path)
+            print(f"{backend:>8} {elapsed * 1000:>10.1f}ms {size / 1024:>8.1f}KB")
+            results[backend] = (elapsed, size)
+    return results
+
+def _add_run_formatted_paragraph(document, text, size, bold=False):
+    """
+    Per-run formatting as done before report_styles, kept for comparison.
+    """
+    paragraph = document.add_paragraph()
+    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = paragraph.add_run(text)
+    run.font.name = 'Arial'
+    run.font.size = Pt(size)
+    run.bold = bold
+    run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+
+def bench_styles(sections=200):
+    """
+    Compares per-run formatting with style references for a long report
+    (`sections` heading + body pairs): build time and document.xml / .docx size.
+    """
+    body_text = CANNED_RESPONSE.replace('\n', ' ')
+
+    def build(styled):
+        document = Document()
+        if styled:
+            register_report_styles(document)
+        start = time.perf_counter()
+        for index in range(sections):
+            if styled:
+                add_styled_paragraph(document, f"תרגיל {index + 1}", "Report Section Heading")
+                add_styled_paragraph(document, body_text, "Report Body")
+            else:
+                _add_run_formatted_paragraph(document, f"תרגיל {index + 1}", 14, bold=True)
+                _add_run_formatted_paragraph(document, body_text, 10)
+        elapsed = time.perf_counter() - start
+        buffer = io.BytesIO()
+        document.save(buffer)
+        document_xml_size = len(zipfile.ZipFile(buffer).read('word/document.xml'))
+        return elapsed, document_xml_size, len(buffer.getvalue())
+
+    print(f"{'mode':>10} {'build':>10} {'document.xml':>14} {'docx':>10}")
+    results = {}
+    for mode, styled in (("per-run", False), ("styles", True)):
+        elapsed, xml_size, docx_size = build(styled)
+        print(f"{mode:>10} {elapsed * 1000:>8.1f}ms {xml_size / 1024:>12.1f}KB {docx_size / 1024:>8.1f}KB")
+        results[mode] = (elapsed, xml_size, docx_size)
+    return results
+
+def _legacy_parse_to_sections(text):
+    """
+    The previous parse_to_sections: one lookahead regex search per section,
+    rebuilt on every call. Kept for comparison.
+    """
+    text = text.replace('**', '').replace('*', '').strip()
+    all_names = '|'.join(re.escape(n) for n in sum(SECTION_NAMES.values(), []))
+    extracted_sections = {}
+    for section, names in SECTION_NAMES.items():
+        name_pattern = r'|'.join(re.escape(name) for name in names)
+        pattern = r'^\s*(%s)[^\n]*\n(.*?)(?=(^\s*(%s)[^\n]*\n|\Z))' % (name_pattern, all_names)
+        match = re.search(pattern, text.replace('\r\n', '\n'), re.DOTALL | re.MULTILINE | re.IGNORECASE)
+        extracted_sections[section] = match.group(2).strip().replace('#', '').replace('*', '') if match else ''
+    return extracted_sections
+
+def sample_transcript(lines, blank_lines=0):
+    """
+    Returns a pasted-transcript-like response: the canned sections with `lines`
+    extra transcript lines in each exercise, each followed by `blank_lines`
+    whitespace-only lines.
+    """
+    filler = ("שורה מתוך תמלול רשת הקשר של הכוח\n" + "   \n" * blank_lines) * lines
+    return CANNED_RESPONSE.replace("\n\nתרגיל 2", "\n" + filler + "\nתרגיל 2").replace("\n\nסיכום", "\n" + filler + "\nסיכום")
+
+def bench_parser(lines=(1, 4, 16, 64), blank_lines=(0, 1000), repeat=3, legacy_limit=5.0):
+    """
+    Times the section parser against the previous multi-pass regex parser on
+    transcripts of growing size. The legacy parser is skipped for larger inputs
+    once a run takes longer than legacy_limit seconds.
+    """
+    print(f"{'lines':>6} {'blank':>6} {'size':>8} {'legacy':>10} {'single-pass':>12}")
+    results = {}
+    for blanks in blank_lines:
+        legacy_too_slow = False
+        for count in lines:
+            text = sample_transcript(count, blanks)
+            timings = {}
+            for name, parse in (("legacy", _legacy_parse_to_sections), ("single-pass", parse_to_sections)):
+                if name == "legacy" and legacy_too_slow:
+                    timings[name] = None
+                    continue
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    parse(text)
+                    best = min(best, time.perf_counter() - start)
+                    if best > legacy_limit:
+                        break
+                timings[name] = best
+                if name == "legacy" and best > legacy_limit:
+                    legacy_too_slow = True
+            legacy = f"{timings['legacy'] * 1000:>8.1f}ms" if timings['legacy'] is not None else f"{'skipped':>10}"
+            print(f"{count:>6} {blanks:>6} {len(text) / 1024:>6.0f}KB {legacy} {timings['single-pass'] * 1000:>10.2f}ms")
+            results[(count, blanks)] = timings
+    return results
+
+def bench_chunked(lines=(100, 1000, 3000), prefill_rate=5000.0, chunk_delay=0.01, max_in_flight=8):
+    """
+    Single-shot versus map-reduce requests for debriefs of growing length (`lines`
+    transcript lines per exercise) against a fake LLM whose time to first token grows
+    with the prompt (0.3s + prompt tokens / prefill_rate) and that writes one word
+    every chunk_delay seconds. Condensing requests get a short answer.
+    """
+    condensed_answer = CANNED_RESPONSE.split("\n\n")[1]
+
+    def answer(request):
+        return condensed_answer if request["messages"][0]["content"].startswith("You are given part") else CANNED_RESPONSE
+
+    def latency(request):
+        return 0.3 + sum(estimate_tokens(message["content"]) for message in request["messages"]) / prefill_rate
+
+    print(f"{'lines':>6} {'tokens':>8} {'mode':>11} {'calls':>6} {'largest prompt':>15} {'time':>8}")
+    results = {}
+    original_limit = gpt_integration.LLM_SINGLE_SHOT_TOKENS
+    set_max_in_flight(max_in_flight)
+    try:
+        for line_count in lines:
+            text = sample_transcript(line_count)
+            tokens = estimate_tokens(text)
+            for mode, limit in (("single-shot", 10 ** 9), ("map-reduce", 0)):
+                gpt_integration.LLM_SINGLE_SHOT_TOKENS = limit
+                with fake_openai(latency, answer, chunk_delay) as fake, contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    run_with_llm(improve_text_async(text, "01/01/2024", "manager", "force", "location", use_cache=False))
+                    elapsed = time.perf_counter() - start
+                largest = max(sum(estimate_tokens(message["content"]) for message in request["messages"]) for request in fake.requests)
+                print(f"{line_count:>6} {tokens:>8} {mode:>11} {fake.calls:>6} {largest:>15} {elapsed:>7.2f}s")
+                results[(line_count, mode)] = (elapsed, fake.calls, largest)
+    finally:
+        gpt_integration.LLM_SINGLE_SHOT_TOKENS = original_limit
+        set_max_in_flight(LLM_MAX_IN_FLIGHT)
+    return results
+
+def bench_structured_output(reports=20, failure_rate=0.3, seed=0):
+    """
+    Compares free-form and structured (JSON mode) generation when the model leaves
+    out the summary of `failure_rate` of its first answers. A free-form report with
+    a missing section has to be generated again from scratch; a structured one only
+    re-requests the missing section. Counts LLM calls and prompt / completion
+    characters per report.
+    """
+    rng = random.Random(seed)
+    failing = {index for index in range(reports) if rng.random() < failure_rate}
+    free_form_without_summary = CANNED_RESPONSE.rsplit("\n\nסיכום", 1)[0]
+    structured_without_summary = json.dumps(
+        {**json.loads(CANNED_STRUCTURED_RESPONSE), "summary": ""}, ensure_ascii=False
+    )
+    summary_only = json.dumps({"text": parse_to_sections(CANNED_RESPONSE)["Summary"]}, ensure_ascii=False)
+
+    def answer(request):
+        debrief = request["messages"][1]["content"]
+        if "response_format" not in request:
+            first_attempt = debrief not in seen
+            seen.add(debrief)
+            return free_form_without_summary if first_attempt and debrief in failing_debriefs else CANNED_RESPONSE
+        if len(request["messages"]) > 2:
+            return summary_only
+        return structured_without_summary if debrief in failing_debriefs else CANNED_STRUCTURED_RESPONSE
+
+    async def free_form(index):
+        # Regenerate until every section is found, like a user rerunning main.py
+        while True:
+            text = await improve_text_async(f"debrief {index}", "", "manager", "force", "location", use_cache=False)
+            if all(parse_to_sections(text).values()):
+                return text
+
+    async def structured(index):
+        return await improve_text_structured_async(f"debrief {index}", "", "manager", "force", "location", use_cache=False)
+
+    print(f"{'mode':>11} {'calls':>8} {'prompt chars':>14} {'completion chars':>18}  (per report, {len(failing)}/{reports} first answers incomplete)")
+    results = {}
+    for mode, generate in (("free-form", free_form), ("structured", structured)):
+        seen = set()
+        failing_debriefs = {f"Please improve this text and divide it into four parts as instructed: debrief {index}" for index in failing}
+        with fake_openai(0.0, answer) as fake, contextlib.redirect_stdout(io.StringIO()):
+            async def run():
+                return await asyncio.gather(*(generate(index) for index in range(reports)))
+            texts = run_with_llm(run())
+        assert all(all(parse_to_sections(text).values()) for text in texts)
+        prompt_chars = sum(len(message["content"]) for request in fake.requests for message in request["messages"])
+        completion_chars = sum(len(answer(request)) for request in fake.requests)
+        print(f"{mode:>11} {fake.calls / reports:>8.2f} {prompt_chars / reports:>14.0f} {completion_chars / reports:>18.0f}")
+        results[mode] = (fake.calls, prompt_chars, completion_chars)
+    return results
+
+def bench_pdf(reports=20):
+    """
+    Per-report build time and size of the PDF renderer next to the two docx chart backends.
+    """
+    sections = parse_to_sections(CANNED_RESPONSE)
+    reports_grades_data = [sample_grades_data(seed) for seed in range(reports)]
+    builders = {
+        "docx/png": lambda grades_data: generate_word_document_bytes(sections, grades_data=grades_data, chart_backend="png"),
+        "docx/native": lambda grades_data: generate_word_document_bytes(sections, grades_data=grades_data, chart_backend="native"),
+        "pdf": lambda grades_data: generate_pdf_report_bytes(sections, grades_data=grades_data),
+    }
+
+    print(f"{'format':>12} {'time/report':>12} {'reports/min':>12} {'size':>10}")
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for build in builders.values():
+            build(reports_grades_data[0])  # Warm-up: template, fonts and logo caches
+    for name, build in builders.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sizes = [len(build(grades_data)) for grades_data in reports_grades_data]
+            elapsed = (time.perf_counter() - start) / reports
+        print(f"{name:>12} {elapsed * 1000:>10.1f}ms {60 / elapsed:>12.0f} {sum(sizes) / reports / 1024:>8.1f}KB")
+        results[name] = (elapsed, sum(sizes) / reports)
+    return results
+
+def bench_tracing(reports=20, calls=100000):
+    """
+    Cost of the tracing spans: per span and per traced call with tracing off and on,
+    and per report (docx with charts) with tracing off and on. Prints the span report.
+    """
+    @traced("bench.noop")
+    def traced_noop():
+        pass
+
+    def noop_spans():
+        for _ in range(calls):
+            with span("bench.noop"):
+                pass
+
+    def noop_calls():
+        for _ in range(calls):
+            traced_noop()
+
+    sections = parse_to_sections(CANNED_RESPONSE)
+    reports_grades_data = [sample_grades_data(seed) for seed in range(reports)]
+
+    def build_reports():
+        for grades_data in reports_grades_data:
+            generate_word_document_bytes(sections, grades_data=grades_data)
+
+    was_enabled = tracing_enabled()
+    generate_word_document_bytes(sections, grades_data=reports_grades_data[0])  # Warm-up: template cache
+    print(f"{'tracing':>8} {'span':>10} {'traced call':>12} {'report':>10}")
+    results = {}
+    try:
+        for enabled in (False, True):
+            if enabled:
+                enable_tracing(os.devnull)
+                reset_trace_stats()
+            else:
+                disable_tracing()
+            timings = []
+            for run, count in ((noop_spans, calls), (noop_calls, calls), (build_reports, reports)):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) / count)
+            span_time, call_time, report_time = timings
+            print(f"{'on' if enabled else 'off':>8} {span_time * 1e6:>8.2f}us {call_time * 1e6:>10.2f}us {report_time * 1000:>8.1f}ms")
+            results["on" if enabled else "off"] = tuple(timings)
+    finally:
+        disable_tracing()
+        if was_enabled:
+            enable_tracing()
+    print()
+    print(trace_report())
+    return results
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def bench_load(reports=50, concurrency=8, workers=None, latency="lognormal:1.0,0.5", chunk_delay=0.0, rate_429=0.0,
+               rate_500=0.0, rate_timeout=0.0, timeout=10.0, rpm=0, output_format="docx"):
+    """
+    End-to-end batch run (LLM request + document rendering) against the local mock
+    server over HTTP: throughput, latency percentiles and failures under the given
+    provider behaviour (see mock_llm_server).
+    """
+    records = []
+    for index in range(reports):
+        grades_data = sample_grades_data(index)
+        grades = {part: {"items": data["items"], "comment": data["comment"]} for part, data in grades_data.items() if part != "final_grade"}
+        records.append({"name": f"report_{index + 1}", "text": f"debrief {index}", "grades": grades, "date": "01/01/2024"})
+
+    original_timeout = gpt_integration.LLM_TIMEOUT
+    gpt_integration.LLM_TIMEOUT = timeout
+    try:
+        with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(io.StringIO()), running_mock_server(
+            latency=latency, chunk_delay=chunk_delay, rate_429=rate_429, rate_500=rate_500, rate_timeout=rate_timeout,
+            hang_seconds=timeout + 1, seed=0
+        ) as server:
+            start = time.perf_counter()
+            results = run_with_llm(batch.run_batch(
+                records, output_dir, concurrency=concurrency, requests_per_minute=rpm, workers=workers,
+                use_cache=False, output_format=output_format
+            ))
+            elapsed = time.perf_counter() - start
+            responses = dict(server.counts)
+    finally:
+        gpt_integration.LLM_TIMEOUT = original_timeout
+
+    succeeded = [result for result in results if not result["error"]]
+    llm_times = [result["llm_seconds"] for result in results]
+    report_times = [result["llm_seconds"] + result["render_seconds"] for result in succeeded]
+    print(f"{len(succeeded)}/{reports} reports in {elapsed:.2f}s ({len(succeeded) / elapsed * 60:.0f} reports/min), server responses: {responses}")
+    print(f"{'':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, values in (("llm", llm_times), ("report", report_times)):
+        print(f"{name:>8} " + " ".join(f"{_percentile(values, fraction):>7.2f}s" for fraction in (0.5, 0.95, 0.99, 1.0)))
+    llm_metrics = llm_client.metrics.snapshot()
+    print(f"LLM client: {llm_metrics}")
+    return {
+        "elapsed": elapsed, "succeeded": len(succeeded), "responses": responses, "llm": llm_times, "report": report_times,
+        "llm_client": llm_metrics
+    }
+
+def bench_grades_store(sessions=25000, forces=50):
+    """
+    Grades store on a database of `sessions` sessions (12 graded items each) spread
+    over `forces` forces and four years: bulk insert rate and the time of each trend query.
+    """
+    rng = random.Random(0)
+    records = []
+    for index in range(sessions):
+        parts = {
+            part_name: {item_name: float(rng.randint(1, 10)) for item_name in items}
+            for part_name, items in GRADING_PARTS.items()
+        }
+        records.append({
+            "grades_data": summarize_grades(parts, {}),
+            "force_name": f"כוח {index % forces + 1}",
+            "date": f"{2021 + index * 4 // sessions}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        })
+    items = sum(len(items) for items in GRADING_PARTS.values()) * sessions
+
+    with tempfile.TemporaryDirectory() as work_dir, GradesStore(os.path.join(work_dir, "grades.db")) as store:
+        start = time.perf_counter()
+        session_ids = store.add_sessions(records)
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {sessions} sessions ({items} graded items) in {elapsed:.2f}s ({items / elapsed:.0f} items/s)")
+
+        queries = {
+            "averages (all)": lambda: store.item_averages(),
+            "averages (force)": lambda: store.item_averages(force_name="כוח 1"),
+            "averages (1 year)": lambda: store.item_averages(since="2024-01-01"),
+            "latest deltas": lambda: store.latest_deltas("כוח 1"),
+            "force history": lambda: store.force_history("כוח 1"),
+            "percentiles (all)": lambda: store.item_percentiles(),
+            "percentiles (1 year)": lambda: store.item_percentiles(since="2024-01-01"),
+            "final grade rank": lambda: store.final_grade_percentile(session_ids[-1]),
+        }
+        results = {"insert": elapsed}
+        print(f"{'query':<22} {'time':>10}")
+        for name, query in queries.items():
+            start = time.perf_counter()
+            query()
+            results[name] = time.perf_counter() - start
+            print(f"{name:<22} {results[name] * 1000:>8.1f}ms")
+    return results
+
+def bench_analytics(sessions=100000, forces=50, repeat=5):
+    """
+    Cohort statistics over `sessions` sessions with GradesMatrix versus a loop over the
+    grades_data dicts, and the cost of building the matrix (from dicts and from the store).
+    """
+    rng = np.random.default_rng(0)
+    items = [(part, item) for part, part_items in GRADING_PARTS.items() for item in part_items]
+    grades = rng.integers(1, 11, size=(sessions, len(items))).astype(float)
+    records = []
+    for index, row in enumerate(grades.tolist()):
+        grades_data = {part: {"items": {}} for part in GRADING_PARTS}
+        for (part, item), grade in zip(items, row):
+            grades_data[part]["items"][item] = grade
+        records.append({"grades_data": grades_data, "force_name": f"כוח {index % forces + 1}", "date": f"2024-{index % 12 + 1:02d}-01"})
+
+    def loop_statistics():
+        values = {key: [] for key in items}
+        for record in records:
+            for part, item in items:
+                values[(part, item)].append(record["grades_data"][part]["items"][item])
+        means = {key: statistics.fmean(grades) for key, grades in values.items()}
+        stds = {key: statistics.pstdev(grades, means[key]) for key, grades in values.items()}
+        quartiles = {key: statistics.quantiles(grades, n=4, method="inclusive") for key, grades in values.items()}
+        return means, stds, quartiles, sorted(means, key=means.get)[:3]
+
+    def matrix_statistics():
+        return (matrix.item_means(), matrix.item_stds(), matrix.item_percentiles(), matrix.weakest_items(),
+                matrix.latest_deltas(), matrix.final_grades(), matrix.period_trend("M"))
+
+    def best_of(function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    start = time.perf_counter()
+    matrix = GradesMatrix.from_records(records)
+    from_records = time.perf_counter() - start
+    results = {"from_records": from_records, "numpy": best_of(matrix_statistics), "loop": best_of(loop_statistics)}
+
+    with tempfile.TemporaryDirectory() as work_dir, GradesStore(os.path.join(work_dir, "grades.db")) as store:
+        store.add_sessions(records)
+        results["from_store"] = best_of(lambda: GradesMatrix.from_store(store))
+        results["from_store (force)"] = best_of(lambda: GradesMatrix.from_store(store, force_name="כוח 1"))
+        store.close()
+        results["report_trends"] = best_of(lambda: report_trends(records[0]["grades_data"], "כוח 1", "2025-01-01", path=store.path))
+
+    print(f"{sessions} sessions x {len(items)} items, {forces} forces")
+    for name, elapsed in results.items():
+        print(f"{name:<20} {elapsed * 1000:>9.1f}ms")
+    print(f"NumPy statistics {results['loop'] / results['numpy']:.0f}x faster than the loop")
+    return results
+
+_FIRST_CHART_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from chart_utils import create_bar_chart
+from chart_fonts import warm_up_fonts
+imported = time.perf_counter()
+warm_up = warm_up_fonts() if sys.argv[1] == "warm-up" else 0.0
+timings = []
+for _ in range(3):
+    chart_start = time.perf_counter()
+    create_bar_chart({"1.1 גיבוש תמונת מצב": 7, "1.2 ניהול הכוח": 8}, "פיקוד ושליטה", 3)
+    timings.append(time.perf_counter() - chart_start)
+print(json.dumps({"import": imported - start, "warm_up": warm_up, "first": timings[0], "steady": min(timings[1:])}))
+"""
+
+def bench_fonts():
+    """
+    First chart after a restart versus steady state, each in a fresh process: with an
+    empty matplotlib cache (first report after a deploy), after `python chart_fonts.py`
+    has built the cache, and with warm_up_fonts() called at startup as the bot does.
+    Also counts font warnings.
+    """
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, MPLCONFIGDIR=cache_dir)
+
+        def run(mode):
+            process = subprocess.run(
+                [sys.executable, "-c", _FIRST_CHART_SCRIPT, mode], cwd=module_dir, env=env, capture_output=True, text=True, check=True
+            )
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            result["warnings"] = sum(1 for line in process.stderr.splitlines() if "findfont" in line)
+            return result
+
+        results["cold cache"] = run("cold")
+        subprocess.run([sys.executable, "chart_fonts.py"], cwd=module_dir, env=env, capture_output=True, check=True)
+        results["warm cache"] = run("cold")
+        results["warm-up at start"] = run("warm-up")
+
+    print(f"{'':<18} {'import':>9} {'warm-up':>9} {'1st chart':>10} {'steady':>9} {'warnings':>9}")
+    for name, result in results.items():
+        print(
+            f"{name:<18} {result['import'] * 1000:>7.0f}ms {result['warm_up'] * 1000:>7.0f}ms {result['first'] * 1000:>8.0f}ms "
+            f"{result['steady'] * 1000:>7.0f}ms {result['warnings']:>9}"
+        )
+    return results
+
+# Modules whose import time matters for the entry points, reported when they are loaded at startup
+HEAVY_MODULES = ("matplotlib", "docx", "fpdf", "numpy", "openai", "aiohttp", "telegram")
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+def measure_import(module, repeat=5):
+    """
+    Imports the module in `repeat` fresh processes. Returns the median import time in
+    seconds and which HEAVY_MODULES the import loaded.
+    """
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT, module, *HEAVY_MODULES], cwd=module_dir, capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return statistics.median(run["seconds"] for run in runs), runs[0]["loaded"]
+
+def bench_startup(modules=("main", "telegram_bot", "batch", "gpt_integration", "document_generator"), repeat=5, max_seconds=None):
+    """
+    Import time of the entry points (before their first prompt), each in fresh processes,
+    and the heavy modules they load. Returns False if one of `modules` takes longer than max_seconds.
+    """
+    print(f"{'module':<20} {'import':>9}  heavy modules loaded")
+    within_limit = True
+    results = {}
+    for module in modules:
+        seconds, loaded = measure_import(module, repeat)
+        results[module] = seconds
+        slow = max_seconds is not None and seconds > max_seconds
+        within_limit = within_limit and not slow
+        print(f"{module:<20} {seconds * 1000:>7.0f}ms  {', '.join(loaded) or '-'}{'  SLOWER THAN ' + str(max_seconds) + 's' if slow else ''}")
+    return within_limit
+
+def _build_sample_report(seed):
+    # Module level, so the report queue's worker processes can unpickle it
+    return generate_word_document_bytes(parse_to_sections(CANNED_RESPONSE), signature="manager", grades_data=sample_grades_data(seed))
+
+def bench_report_queue(users=12, workers=2, max_queued=20, per_user=1):
+    """
+    `users` reports finished at the same moment by different users (plus a second one
+    from the first user): built in the handler on a thread, as before the report queue,
+    versus submitted to a ReportQueue of `workers` processes. Measures the worst event
+    loop stall (how long other chats would wait), the time to each report and the rejections.
+    """
+    async def heartbeat(stop, lags):
+        while not stop.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - expected)
+
+    async def measure(build_all):
+        stop = asyncio.Event()
+        lags = []
+        monitor = asyncio.create_task(heartbeat(stop, lags))
+        start = time.perf_counter()
+        done_times = await build_all(start)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+        return elapsed, max(lags, default=0.0), done_times
+
+    async def in_handler(start):
+        async def build(seed):
+            await asyncio.to_thread(_build_sample_report, seed)
+            return time.perf_counter() - start
+        return await asyncio.gather(*(build(seed) for seed in range(users)))
+
+    queue = ReportQueue(workers=workers, max_queued=max_queued, per_user=per_user, initializer=load_report_modules)
+
+    async def queued(start):
+        jobs = []
+        for seed in range(users):
+            try:
+                jobs.append(queue.submit(seed, _build_sample_report, seed))
+            except (QueueFullError, UserLimitError):
+                pass
+        with contextlib.suppress(QueueFullError, UserLimitError):
+            jobs.append(queue.submit(0, _build_sample_report, 0))
+
+        async def wait(job):
+            await job.future
+            return time.perf_counter() - start
+        return await asyncio.gather(*(wait(job) for job in jobs))
+
+    async def run():
+        _build_sample_report(0)  # Warm-up: template, fonts and logo caches of this process
+        results = {"in handler (thread)": await measure(in_handler)}
+        await queue.warm_up()
+        try:
+            results[f"queue ({workers} processes)"] = await measure(queued)
+        finally:
+            stats = queue.stats()
+            await queue.shutdown()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    print(f"{users} reports, {os.cpu_count()} CPUs")
+    print(f"{'':<24} {'total':>8} {'first':>8} {'median':>8} {'max loop stall':>15}")
+    for name, (elapsed, max_lag, done_times) in results.items():
+        print(f"{name:<24} {elapsed:>7.2f}s {min(done_times):>7.2f}s {statistics.median(done_times):>7.2f}s {max_lag * 1000:>13.1f}ms")
+    print(f"Queue: {stats}")
+    return results
+
+def bench_bot_state(users=200, messages_per_round=100):
+    """
+    Cost of persisting the bot's conversations: `users` conversations answer every grade
+    question, one chat after the other like concurrent users. The changed conversations
+    are saved after every message (write-through) or in one transaction per save round
+    (write-behind, as the bot does every BOT_STATE_SAVE_INTERVAL seconds), here every
+    `messages_per_round` messages. Also the stored size of a conversation and the time
+    to load them all after a restart.
+    """
+    questions = [(part, item) for part, items in GRADING_PARTS.items() for item in [*items, None]]
+
+    def new_conversation():
+        return {
+            "input_text": sample_transcript(10), "date": "01/05/2024", "improved_text": CANNED_RESPONSE, "grades_data": {},
+            "grade_step": 0, "grade_items": {part: {} for part in GRADING_PARTS}, "grade_comments": {}
+        }
+
+    async def run(path, round_size):
+        persistence = BotStatePersistence(path, update_interval=60)
+        user_data = {user_id: new_conversation() for user_id in range(users)}
+        changed = set()
+        loop_seconds = 0.0
+        messages = 0
+        start = time.perf_counter()
+        for step, (part, item) in enumerate(questions):
+            for user_id in range(users):
+                data = user_data[user_id]
+                if item is None:
+                    data["grade_comments"][part] = "הערה לדוגמה"
+                else:
+                    data["grade_items"][part][item] = 7.0
+                data["grade_step"] = step + 1
+                changed.add(user_id)
+                messages += 1
+                if messages % round_size:
+                    continue
+                # What Application.update_persistence does with the conversations that changed
+                round_start = time.perf_counter()
+                for changed_id in changed:
+                    await persistence.update_user_data(changed_id, copy.deepcopy(user_data[changed_id]))
+                    await persistence.update_conversation("report", (changed_id, changed_id), 1)
+                changed.clear()
+                loop_seconds += time.perf_counter() - round_start
+                if round_size == 1:
+                    await persistence.save()  # The next message waits for the disk
+                else:
+                    await asyncio.sleep(0)  # The write starts on its thread, the messages go on
+        await persistence.flush()
+        elapsed = time.perf_counter() - start
+        return elapsed, loop_seconds, messages, persistence.counts
+
+    async def restart(path):
+        persistence = BotStatePersistence(path)
+        start = time.perf_counter()
+        user_data = await persistence.get_user_data()
+        conversations = await persistence.get_conversations("report")
+        elapsed = time.perf_counter() - start
+        await persistence.flush()
+        return elapsed, len(user_data), len(conversations)
+
+    conversation = new_conversation()
+    for part, item in questions[:len(questions) // 2]:
+        if item is not None:
+            conversation["grade_items"][part][item] = 7.0
+    sizes = {
+        "pickle": len(pickle.dumps(conversation)),
+        "json": len(json.dumps(conversation, ensure_ascii=False).encode("utf-8")),
+        "json + zlib": len(encode_data(conversation)),
+    }
+    print("Stored size of a conversation halfway through the grades: " + ", ".join(f"{name} {size} B" for name, size in sizes.items()))
+
+    results = {"sizes": sizes}
+    print(f"{users} conversations x {len(questions)} answers")
+    print(f"{'':<28} {'total':>8} {'per message':>12} {'on the loop':>12} {'writes':>7} {'written':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, round_size in (("write-through", 1), (f"write-behind ({messages_per_round}/round)", messages_per_round)):
+            path = os.path.join(work_dir, f"{round_size}.db")
+            elapsed, loop_seconds, messages, counts = asyncio.run(run(path, round_size))
+            results[name] = {"total": elapsed, "per_message": elapsed / messages, "loop_per_message": loop_seconds / messages, **counts}
+            print(
+                f"{name:<28} {elapsed:>7.2f}s {elapsed / messages * 1e6:>10.0f}us {loop_seconds / messages * 1e6:>10.0f}us "
+                f"{counts['writes']:>7} {counts['bytes'] / 1024:>7.0f}KB"
+            )
+        elapsed, loaded, conversations = asyncio.run(restart(path))
+        results["restart"] = elapsed
+        print(f"Restart: loaded {loaded} conversations ({conversations} conversation states) in {elapsed * 1000:.1f}ms")
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def _suite_stages(work_dir, latency):
+    """
+    Returns the pipeline stages timed by the suite: name -> function returning the
+    size in bytes of what the stage produced (or None).
+    """
+    sections = parse_to_sections(CANNED_RESPONSE)
+    grades_data = sample_grades_data()
+    large_output = sample_transcript(1000)
+    max_items = max(len(items) for items in GRADING_PARTS.values())
+    part_name = next(iter(GRADING_PARTS))
+    docx_path = os.path.join(work_dir, "report.docx")
+
+    def add_hyperlinks(count=100):
+        document = Document()
+        register_report_styles(document)
+        for index in range(count):
+            paragraph = add_styled_paragraph(document, "", "Report Contact")
+            add_hyperlink(paragraph, f"https://example.com/{index}", f"קישור {index}", style="Report Hyperlink")
+        return None
+
+    def word_document(chart_backend):
+        generate_word_document(sections, docx_path, signature="manager", grades_data=grades_data, chart_backend=chart_backend)
+        return os.path.getsize(docx_path)
+
+    def end_to_end():
+        # The command line flow: LLM -> middle.txt -> combat_report.docx, in work_dir
+        with fake_openai(latency):
+            save_improved_text_to_file("debrief", "01/01/2024", "manager", "force", "location", use_cache=False)
+        create_combat_report_from_file(date="01/01/2024", grades_data=grades_data, signature="manager")
+        return os.path.getsize("combat_report.docx")
+
+    return {
+        "parse_to_sections": lambda: parse_to_sections(CANNED_RESPONSE) and None,
+        "parse_to_sections_large": lambda: parse_to_sections(large_output) and None,
+        "create_bar_chart": lambda: len(create_bar_chart(grades_data[part_name]['items'], part_name, max_items).getvalue()),
+        "create_final_grade_chart": lambda: len(create_final_grade_chart(grades_data, max_items).getvalue()),
+        "add_hyperlink_x100": add_hyperlinks,
+        "generate_word_document_png": lambda: word_document("png"),
+        "generate_word_document_native": lambda: word_document("native"),
+        "generate_pdf_report": lambda: len(generate_pdf_report_bytes(sections, signature="manager", grades_data=grades_data)),
+        "end_to_end": end_to_end,
+        # Import time of the entry points in a fresh process, before their first prompt
+        "startup_main": lambda: measure_import("main", repeat=1) and None,
+        "startup_telegram_bot": lambda: measure_import("telegram_bot", repeat=1) and None,
+    }
+
+def bench_suite(repeat=5, latency=0.0, stages=None):
+    """
+    Times each pipeline stage offline (fake LLM with `latency` seconds).
+    Every stage runs once to warm up caches, `repeat` times for timing, then once
+    more under tracemalloc for its peak Python memory.
+    Returns a JSON-serialisable dict with the results and the environment.
+    """
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "repeat": repeat,
+            "llm_latency": latency,
+        },
+        "stages": {},
+    }
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        suite = _suite_stages(work_dir, latency)
+        os.chdir(work_dir)
+        try:
+            for name, stage in suite.items():
+                if stages and name not in stages:
+                    continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    output_bytes = stage()
+                    timings = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        stage()
+                        timings.append(time.perf_counter() - start)
+                    tracemalloc.start()
+                    stage()
+                    peak_memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                results["stages"][name] = {
+                    "median_s": statistics.median(timings),
+                    "min_s": min(timings),
+                    "peak_memory_kb": round(peak_memory / 1024, 1),
+                    "output_bytes": output_bytes,
+                }
+                print(f"{name:<30} {statistics.median(timings) * 1000:>10.2f}ms {peak_memory / 1024:>10.0f}KB "
+                      f"{'' if output_bytes is None else f'{output_bytes / 1024:.1f}KB':>10}")
+        finally:
+            os.chdir(original_dir)
+    return results
+
+def compare_suite_results(results, baseline, threshold=0.2):
+    """
+    Prints each stage's median time and peak memory relative to a baseline run.
+    Returns the names of stages that got slower by more than `threshold` (0.2 = 20%).
+    """
+    regressions = []
+    print(f"\n{'stage':<30} {'time':>10} {'memory':>10}  (vs {baseline['meta'].get('commit') or 'baseline'})")
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base:
+            print(f"{name:<30} {'new':>10}")
+            continue
+        time_ratio = stage["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        memory_ratio = stage["peak_memory_kb"] / base["peak_memory_kb"] if base["peak_memory_kb"] else 1.0
+        flag = "  REGRESSION" if time_ratio > 1 + threshold else ""
+        print(f"{name:<30} {time_ratio:>9.2f}x {memory_ratio:>9.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the combat report pipeline.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    llm_parser = subparsers.add_parser("llm-concurrency", help="Concurrent bot conversations against a fake LLM.")
+    llm_parser.add_argument("--conversations", type=int, default=20)
+    llm_parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM latency in seconds.")
+    llm_parser.add_argument("--max-in-flight", type=int, default=None)
+
+    stream_parser = subparsers.add_parser("llm-streaming", help="Time to first output with and without streaming.")
+    stream_parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM time to first token in seconds.")
+    stream_parser.add_argument("--chunk-delay", type=float, default=0.02, help="Delay between streamed chunks in seconds.")
+
+    chart_parser = subparsers.add_parser("charts", help="Serial versus pooled chart rendering.")
+    chart_parser.add_argument("--reports", type=int, nargs="+", default=[1, 10, 100])
+    chart_parser.add_argument("--workers", type=int, default=None)
+
+    backend_parser = subparsers.add_parser("chart-backends", help="PNG versus native DOCX charts.")
+    backend_parser.add_argument("--reports", type=int, default=5)
+
+    styles_parser = subparsers.add_parser("styles", help="Per-run formatting versus style references.")
+    styles_parser.add_argument("--sections", type=int, default=200)
+
+    parser_parser = subparsers.add_parser("parser", help="Section parser on large transcripts.")
+    parser_parser.add_argument("--lines", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser_parser.add_argument("--blank-lines", type=int, nargs="+", default=[0, 1000])
+
+    structured_parser = subparsers.add_parser("structured", help="Free-form versus structured output retries.")
+    structured_parser.add_argument("--reports", type=int, default=20)
+    structured_parser.add_argument("--failure-rate", type=float, default=0.3)
+
+    chunked_parser = subparsers.add_parser("chunked", help="Single-shot versus map-reduce requests for long debriefs.")
+    chunked_parser.add_argument("--lines", type=int, nargs="+", default=[100, 1000, 3000])
+    chunked_parser.add_argument("--prefill-rate", type=float, default=5000.0, help="Fake LLM prompt tokens per second.")
+    chunked_parser.add_argument("--chunk-delay", type=float, default=0.01, help="Fake LLM seconds per output word.")
+    chunked_parser.add_argument("--max-in-flight", type=int, default=8)
+
+    pdf_parser = subparsers.add_parser("pdf", help="PDF renderer versus docx.")
+    pdf_parser.add_argument("--reports", type=int, default=20)
+
+    load_parser = subparsers.add_parser("load", help="End-to-end batch run against the local mock LLM server.")
+    load_parser.add_argument("--reports", type=int, default=50)
+    load_parser.add_argument("--concurrency", type=int, default=8)
+    load_parser.add_argument("--workers", type=int, default=None)
+    load_parser.add_argument("--latency", default="lognormal:1.0,0.5", help="N, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA seconds.")
+    load_parser.add_argument("--chunk-delay", type=float, default=0.0)
+    load_parser.add_argument("--rate-429", type=float, default=0.0)
+    load_parser.add_argument("--rate-500", type=float, default=0.0)
+    load_parser.add_argument("--rate-timeout", type=float, default=0.0)
+    load_parser.add_argument("--timeout", type=float, default=10.0, help="Client timeout per LLM request in seconds.")
+    load_parser.add_argument("--rpm", type=int, default=0, help="Client-side requests per minute limit (0 = none).")
+    load_parser.add_argument("--format", choices=batch.OUTPUT_FORMATS, default="docx")
+
+    grades_store_parser = subparsers.add_parser("grades-store", help="Bulk insert and trend queries of the grades store.")
+    grades_store_parser.add_argument("--sessions", type=int, default=25000)
+    grades_store_parser.add_argument("--forces", type=int, default=50)
+
+    queue_parser = subparsers.add_parser("report-queue", help="Bot report builds in the handler versus on the report queue.")
+    queue_parser.add_argument("--users", type=int, default=12)
+    queue_parser.add_argument("--workers", type=int, default=2)
+    queue_parser.add_argument("--max-queued", type=int, default=20)
+    queue_parser.add_argument("--per-user", type=int, default=1)
+
+    bot_state_parser = subparsers.add_parser("bot-state", help="Saving the bot's conversations after every message versus in rounds.")
+    bot_state_parser.add_argument("--users", type=int, default=200)
+    bot_state_parser.add_argument("--messages-per-round", type=int, default=100)
+
+    startup_parser = subparsers.add_parser("startup", help="Import time of the entry points.")
+    startup_parser.add_argument("--modules", nargs="+", default=["main", "telegram_bot", "batch", "gpt_integration", "document_generator"])
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--max-seconds", type=float, default=None, help="Exit with status 1 if an import takes longer.")
+
+    subparsers.add_parser("fonts", help="First chart after a restart, with and without the font warm-up.")
+
+    analytics_parser = subparsers.add_parser("analytics", help="Vectorized cohort statistics versus a loop over sessions.")
+    analytics_parser.add_argument("--sessions", type=int, default=100000)
+    analytics_parser.add_argument("--forces", type=int, default=50)
+
+    tracing_parser = subparsers.add_parser("tracing", help="Overhead of the tracing spans, off and on.")
+    tracing_parser.add_argument("--reports", type=int, default=20)
+
+    suite_parser = subparsers.add_parser("suite", help="Time every pipeline stage and write the results as JSON.")
+    suite_parser.add_argument("--repeat", type=int, default=5)
+    suite_parser.add_argument("--latency", type=float, default=0.0, help="Fake LLM latency in seconds (end_to_end stage).")
+    suite_parser.add_argument("--stages", nargs="+", help="Only run these stages.")
+    suite_parser.add_argument("--output", help="Write the results to this JSON file.")
+    suite_parser.add_argument("--compare", help="Baseline JSON file of an earlier run to compare with.")
+    suite_parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown reported as a regression (0.2 = 20%%).")
+
+    args = parser.parse_args()
+    if args.benchmark == "llm-concurrency":
+        bench_llm_concurrency(args.conversations, args.latency, args.max_in_flight)
+    elif args.benchmark == "llm-streaming":
+        bench_llm_streaming(args.latency, args.chunk_delay)
+    elif args.benchmark == "charts":
+        bench_chart_rendering(args.reports, args.workers)
+    elif args.benchmark == "chart-backends":
+        bench_chart_backends(args.reports)
+    elif args.benchmark == "styles":
+        bench_styles(args.sections)
+    elif args.benchmark == "parser":
+        bench_parser(args.lines, args.blank_lines)
+    elif args.benchmark == "structured":
+        bench_structured_output(args.reports, args.failure_rate)
+    elif args.benchmark == "chunked":
+        bench_chunked(args.lines, args.prefill_rate, args.chunk_delay, args.max_in_flight)
+    elif args.benchmark == "pdf":
+        bench_pdf(args.reports)
+    elif args.benchmark == "load":
+        bench_load(
+            args.reports, args.concurrency, args.workers, args.latency, args.chunk_delay, args.rate_429,
+            args.rate_500, args.rate_timeout, args.timeout, args.rpm, args.format
+        )
+    elif args.benchmark == "grades-store":
+        bench_grades_store(args.sessions, args.forces)
+    elif args.benchmark == "report-queue":
+        bench_report_queue(args.users, args.workers, args.max_queued, args.per_user)
+    elif args.benchmark == "bot-state":
+        bench_bot_state(args.users, args.messages_per_round)
+    elif args.benchmark == "startup":
+        if not bench_startup(args.modules, args.repeat, args.max_seconds):
+            sys.exit(1)
+    elif args.benchmark == "fonts":
+        bench_fonts()
+    elif args.benchmark == "analytics":
+        bench_analytics(args.sessions, args.forces)
+    elif args.benchmark == "tracing":
+        bench_tracing(args.reports)
+    elif args.benchmark == "suite":
+        results = bench_suite(args.repeat, args.latency, args.stages)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as file:
+                baseline = json.load(file)
+            if compare_suite_results(results, baseline, args.threshold):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# bot_state.py
+
+"""
+Persistence of the bot's conversations, so that a restart or deploy in the middle
+of a report resumes where it left off instead of losing the improved text and the
+grades entered so far.
+
+    application = ApplicationBuilder().token(token).persistence(BotStatePersistence()).build()
+
+Only user_data and the states of the persistent ConversationHandlers are kept, in an
+SQLite database: one row per user with its user_data as zlib-compressed JSON, and one
+row per active conversation. Nothing is written while a message is handled: the
+application hands over the conversations that changed every BOT_STATE_SAVE_INTERVAL
+seconds (and when it stops), and they are written in one transaction on a thread.
+user_data must hold JSON values only; tasks and other runtime objects belong elsewhere.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import zlib
+
+from dotenv import load_dotenv
+from telegram.ext import BasePersistence, PersistenceInput
+
+load_dotenv()
+
+# Database file; an empty value turns off the bot's persistence
+BOT_STATE_PATH = os.getenv("BOT_STATE_PATH", "bot_state.db")
+# Seconds between writes of the changed conversations; a crash (not a normal stop) loses at most this much
+BOT_STATE_SAVE_INTERVAL = float(os.getenv("BOT_STATE_SAVE_INTERVAL", "5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL  -- zlib-compressed JSON
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,  -- JSON list, e.g. [chat_id, user_id]
+    state NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+def encode_data(data):
+    """
+    Returns the compact form of a user_data dict stored in the database.
+    """
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def decode_data(blob):
+    return json.loads(zlib.decompress(blob))
+
+class BotStatePersistence(BasePersistence):
+    """
+    python-telegram-bot persistence of user_data and conversation states in an
+    SQLite database, written behind in batches.
+    """
+
+    def __init__(self, path=BOT_STATE_PATH, update_interval=BOT_STATE_SAVE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path
+        self.connection = None
+        # Changes not written yet; None marks a row to delete
+        self._pending_user_data = {}
+        self._pending_conversations = {}
+        self._write_task = None
+        self.counts = {"updates": 0, "writes": 0, "rows": 0, "bytes": 0}
+
+    def _connect(self):
+        if self.connection is None:
+            # Used by the event loop's thread at startup and by one write thread at a time
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            if self.path != ":memory:":
+                self.connection.execute("PRAGMA journal_mode = WAL")
+                self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.executescript(_SCHEMA)
+        return self.connection
+
+    async def get_user_data(self):
+        rows = self._connect().execute("SELECT user_id, data FROM user_data").fetchall()
+        return {user_id: decode_data(data) for user_id, data in rows}
+
+    async def get_conversations(self, name):
+        rows = self._connect().execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    async def update_user_data(self, user_id, data):
+        self._pending_user_data[user_id] = data
+        self._changed()
+
+    async def drop_user_data(self, user_id):
+        self._pending_user_data[user_id] = None
+        self._changed()
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+        self._changed()
+
+    def _changed(self):
+        # The application hands over all changes of a round before the write task
+        # gets to run, so they end up in the same transaction
+        self.counts["updates"] += 1
+        self._schedule_write()
+
+    def _schedule_write(self):
+        # One write task at a time; changes handed over while it writes go in its next transaction
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+        return self._write_task
+
+    async def save(self):
+        """
+        Writes the changes handed over so far and returns once they are written.
+        """
+        await self._schedule_write()
+
+    async def _write_pending(self):
+        while self._pending_user_data or self._pending_conversations:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            try:
+                await asyncio.to_thread(self._write, user_data, conversations)
+            except sqlite3.Error as e:
+                print(f"Warning: Could not save the bot's conversations to '{self.path}': {e}")
+                # Keep them for the next write, unless they changed again since
+                self._pending_user_data = {**user_data, **self._pending_user_data}
+                self._pending_conversations = {**conversations, **self._pending_conversations}
+                break
+
+    def _write(self, user_data, conversations):
+        # Empty user_data (a finished conversation) is deleted rather than stored
+        encoded = {user_id: encode_data(data) if data else None for user_id, data in user_data.items()}
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                [(user_id, data) for user_id, data in encoded.items() if data is not None]
+            )
+            connection.executemany(
+                "DELETE FROM user_data WHERE user_id = ?", [(user_id,) for user_id, data in encoded.items() if data is None]
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+            )
+            connection.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [key for key, state in conversations.items() if state is None]
+            )
+        self.counts["writes"] += 1
+        self.counts["rows"] += len(encoded) + len(conversations)
+        self.counts["bytes"] += sum(len(data) for data in encoded.values() if data is not None)
+
+    async def flush(self):
+        """
+        Waits for the last write and closes the database; called when the application stops.
+        """
+        if self._write_task is not None:
+            await self._write_task
+        # Also retries what a failed write left behind
+        await self.save()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    # Only user_data and the conversations are stored
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
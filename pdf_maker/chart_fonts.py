@@ -0,0 +1,92 @@
+# chart_fonts.py
+
+"""
+Fonts and style of the matplotlib charts, set up once per process.
+Run `python chart_fonts.py` after installing or deploying to build matplotlib's
+font cache ahead of time, so the first report doesn't pay for it.
+
+Arial is used when it is installed. Otherwise the Hebrew capable fonts shipped in
+pdf_maker/fonts (CHART_FONTS_DIR points elsewhere) are registered with matplotlib's
+font manager and used instead, without a font fallback search and its warnings on
+every chart.
+"""
+
+import glob
+import os
+import threading
+import time
+
+import matplotlib
+from matplotlib import font_manager, rcParams
+
+# Fonts shipped with the package (CHART_FONTS_DIR points elsewhere)
+CHART_FONTS_DIR = os.getenv("CHART_FONTS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# Font families tried in order; DejaVu Sans (bundled with matplotlib) covers Hebrew too
+CHART_FONT_PREFERENCES = ("Arial", "DejaVu Sans")
+
+_chart_font_family = None
+_setup_lock = threading.Lock()
+
+def register_chart_fonts(fonts_dir=CHART_FONTS_DIR):
+    """
+    Adds the .ttf/.otf fonts in fonts_dir to matplotlib's font manager.
+    Unreadable files are skipped. Returns the family names registered.
+    """
+    families = []
+    for path in sorted(glob.glob(os.path.join(fonts_dir, "*.[ot]tf"))):
+        try:
+            font_manager.fontManager.addfont(path)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Warning: Could not load font '{path}': {e}")
+            continue
+        families.append(font_manager.fontManager.ttflist[-1].name)
+    return list(dict.fromkeys(families))
+
+def setup_chart_style():
+    """
+    Registers the shipped fonts, picks the chart font family and sets matplotlib's
+    defaults to it. Runs once per process; later calls return the family at once.
+    """
+    global _chart_font_family
+    if _chart_font_family is not None:
+        return _chart_font_family
+    with _setup_lock:
+        if _chart_font_family is None:
+            registered = register_chart_fonts()
+            # Look the families up in the font list instead of asking findfont, which
+            # warns and falls back for every missing family
+            available = {font.name for font in font_manager.fontManager.ttflist}
+            family = next((name for name in CHART_FONT_PREFERENCES + tuple(registered) if name in available), "sans-serif")
+            rcParams['font.family'] = family
+            rcParams['axes.unicode_minus'] = False
+            _chart_font_family = family
+    return _chart_font_family
+
+def chart_font(size, weight="normal"):
+    """
+    Returns the FontProperties of chart text in the given size.
+    """
+    return font_manager.FontProperties(family=setup_chart_style(), size=size, weight=weight)
+
+def warm_up_fonts():
+    """
+    Builds matplotlib's font cache if needed, sets up the chart style and renders a
+    throwaway chart, so the font files, glyph caches and bidi tables are loaded.
+    Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    # Imported here: chart_utils uses this module
+    from chart_utils import create_bar_chart
+    setup_chart_style()
+    create_bar_chart({"חימום 1.1": 1}, "חימום", 1)
+    return time.perf_counter() - start
+
+def main():
+    elapsed = warm_up_fonts()
+    print(f"Chart font: {setup_chart_style()}")
+    print(f"Font cache: {matplotlib.get_cachedir()}")
+    print(f"Warm-up took {elapsed:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# chart_pool.py
+
+import os
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from chart_utils import create_bar_chart, create_final_grade_chart
+from chart_fonts import warm_up_fonts
+
+# Number of chart rendering processes (defaults to the number of CPUs)
+CHART_POOL_WORKERS = int(os.getenv("CHART_POOL_WORKERS", "0")) or os.cpu_count() or 1
+
+_chart_pool = None
+_chart_pool_workers = 0
+
+def _warm_up_worker():
+    """
+    Pool initializer: renders a throwaway chart so matplotlib, the fonts and
+    the bidi tables are loaded before the first real job arrives.
+    """
+    warm_up_fonts()
+
+def _ping():
+    return os.getpid()
+
+def chart_jobs_for_report(grades_data):
+    """
+    Returns the chart jobs of a report, in the order the charts appear in the document:
+    one bar chart per part followed by the final grade chart.
+    """
+    parts = [part_name for part_name in grades_data if part_name != 'final_grade']
+    max_items = max(len(grades_data[part_name]['items']) for part_name in parts)
+    jobs = [("bar", grades_data[part_name]['items'], part_name, max_items) for part_name in parts]
+    jobs.append(("final", grades_data, max_items))
+    return jobs
+
+def render_chart_job(job):
+    """
+    Renders a single chart job and returns the PNG bytes.
+    """
+    if job[0] == "bar":
+        _, items, title, max_items = job
+        image = create_bar_chart(items, title, max_items)
+    else:
+        _, grades_data, max_items = job
+        image = create_final_grade_chart(grades_data, max_items)
+    return image.getvalue()
+
+def get_chart_pool(workers=None):
+    """
+    Returns the process-wide chart rendering pool, starting it on first use.
+    """
+    global _chart_pool, _chart_pool_workers
+    if _chart_pool is None:
+        _chart_pool_workers = workers or CHART_POOL_WORKERS
+        _chart_pool = ProcessPoolExecutor(max_workers=_chart_pool_workers, initializer=_warm_up_worker)
+    return _chart_pool
+
+def warm_chart_pool(workers=None):
+    """
+    Starts every worker of the chart pool now instead of on the first report.
+    """
+    pool = get_chart_pool(workers)
+    # Submitting one job per worker before any of them is idle starts all of them
+    futures = [pool.submit(_ping) for _ in range(_chart_pool_workers)]
+    return {future.result() for future in futures}
+
+def shutdown_chart_pool():
+    """
+    Stops the chart pool's worker processes.
+    """
+    global _chart_pool
+    if _chart_pool is not None:
+        _chart_pool.shutdown()
+        _chart_pool = None
+
+atexit.register(shutdown_chart_pool)
+
+def render_charts_for_reports(reports_grades_data, pool=None):
+    """
+    Renders the charts of several reports in parallel on the chart pool.
+    Returns one list of BytesIO PNG images per report, in document order.
+    """
+    pool = pool or get_chart_pool()
+    report_jobs = [chart_jobs_for_report(grades_data) for grades_data in reports_grades_data]
+    # Submit everything first so all workers stay busy, then collect in order
+    report_futures = [[pool.submit(render_chart_job, job) for job in jobs] for jobs in report_jobs]
+    return [[BytesIO(future.result()) for future in futures] for futures in report_futures]
+
+def render_report_charts(grades_data, pool=None):
+    """
+    Renders the charts of one report in parallel on the chart pool.
+    """
+    return render_charts_for_reports([grades_data], pool)[0]
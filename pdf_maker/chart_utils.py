@@ -1,12 +1,48 @@
 # chart_utils.py
 
-import matplotlib.pyplot as plt
+from io import BytesIO
 from bidi.algorithm import get_display
-from matplotlib import rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from chart_fonts import chart_font
+from tracing import traced, current_span
 
-def create_bar_chart(items, title, output_path, max_items):
+def _render_horizontal_bar_chart(labels, values, title, xlabel, color, max_items):
     """
-    Creates a bar chart for the given items and saves it to the specified path.
+    Renders a horizontal bar chart with the value next to each bar.
+    Uses a standalone Figure on the Agg canvas (no global pyplot state) and
+    returns the PNG image in a BytesIO buffer.
+    """
+    # Calculate figure height based on max_items to keep consistent height
+    figure_height = max_items * 0.5 + 1  # Adjust the multiplier as needed
+
+    figure = Figure(figsize=(8, figure_height))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+
+    bars = axes.barh(labels, values, color=color, height=0.4)
+    axes.set_xlabel(xlabel, fontproperties=chart_font(14))
+    axes.set_title(title, fontproperties=chart_font(16))
+    axes.set_xlim(0, 10)
+    tick_font = chart_font(14)
+    for tick_label in axes.get_xticklabels() + axes.get_yticklabels():
+        tick_label.set_fontproperties(tick_font)
+    figure.tight_layout()
+    # Add value labels next to the bars
+    value_font = chart_font(12)
+    for bar, value in zip(bars, values):
+        axes.text(value + 0.1, bar.get_y() + bar.get_height()/2, f'{value}', va='center', fontproperties=value_font)
+
+    image = BytesIO()
+    figure.savefig(image, format='png')
+    current_span().set(items=len(values), bytes=image.tell())
+    image.seek(0)
+    return image
+
+@traced("chart.part")
+def create_bar_chart(items, title, max_items):
+    """
+    Creates a bar chart for the given items and returns it as a PNG in a BytesIO buffer.
     Ensures that all charts have the same height by using max_items.
     """
     # Reverse the items for right-to-left display
@@ -17,30 +53,13 @@ def create_bar_chart(items, title, output_path, max_items):
     labels = [get_display(label) for label in labels]
     title = get_display(title)
 
-    # Set font to Arial (or another font that supports Hebrew)
-    rcParams['font.family'] = 'Arial'
+    return _render_horizontal_bar_chart(labels, grades, title, get_display("ציון"), 'skyblue', max_items)
 
-    # Calculate figure height based on max_items to keep consistent height
-    figure_height = max_items * 0.5 + 1  # Adjust the multiplier as needed
-
-    plt.figure(figsize=(8, figure_height))
-    bars = plt.barh(labels, grades, color='skyblue', height=0.4)
-    plt.xlabel(get_display("ציון"), fontsize=14)
-    plt.title(title, fontsize=16)
-    plt.xlim(0, 10)
-    plt.xticks(fontsize=14)
-    plt.yticks(fontsize=14)
-    plt.tight_layout()
-    # Add grade labels next to the bars
-    for bar, grade in zip(bars, grades):
-        plt.text(grade + 0.1, bar.get_y() + bar.get_height()/2, f'{grade}', va='center', fontsize=12)
-    plt.savefig(output_path)
-    plt.close()
-
-def create_final_grade_chart(grades_data, output_path, max_items):
+@traced("chart.final_grade")
+def create_final_grade_chart(grades_data, max_items):
     """
-    Creates a bar chart for the final grades of each part.
-    Ensures consistent chart size using max_items.
+    Creates a bar chart for the final grades of each part and returns it as a PNG
+    in a BytesIO buffer. Ensures consistent chart size using max_items.
     """
     parts = [part for part in grades_data if part != 'final_grade']
     averages = [grades_data[part]['average'] for part in parts]
@@ -53,22 +72,38 @@ def create_final_grade_chart(grades_data, output_path, max_items):
     parts = [get_display(part) for part in parts]
     title = get_display('ציון ממוצע לכל חלק')
 
-    # Set font to Arial (or another font that supports Hebrew)
-    rcParams['font.family'] = 'Arial'
+    return _render_horizontal_bar_chart(parts, averages, title, get_display("ציון ממוצע"), 'lightgreen', max_items)
 
-    # Calculate figure height based on max_items
-    figure_height = max_items * 0.5 + 1  # Adjust the multiplier as needed
+@traced("chart.trend")
+def create_trend_chart(trends):
+    """
+    Creates a line chart of the part averages and the final grade over the force's
+    recent sessions (see analytics.report_trends) and returns it as a PNG in a BytesIO buffer.
+    """
+    figure = Figure(figsize=(8, 4.5))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+
+    positions = range(len(trends["dates"]))
+    for part, averages in zip(trends["parts"], zip(*trends["part_averages"])):
+        axes.plot(positions, averages, marker='o', linewidth=1.5, label=get_display(part))
+    axes.plot(positions, trends["final_grades"], marker='o', linewidth=3, color='black', label=get_display("ציון סופי"))
+
+    # Session dates as dd/mm/YY, oldest on the left
+    axes.set_xticks(list(positions))
+    axes.set_xticklabels([f"{date[8:10]}/{date[5:7]}/{date[2:4]}" for date in trends["dates"]])
+    axes.set_ylim(0, 10.5)
+    axes.set_ylabel(get_display("ציון"), fontproperties=chart_font(14))
+    axes.set_title(get_display("מגמת ציונים באימונים האחרונים"), fontproperties=chart_font(16))
+    tick_font = chart_font(11)
+    for tick_label in axes.get_xticklabels() + axes.get_yticklabels():
+        tick_label.set_fontproperties(tick_font)
+    axes.grid(axis='y', alpha=0.3)
+    axes.legend(prop=chart_font(11), loc='lower left')
+    figure.tight_layout()
 
-    plt.figure(figsize=(8, figure_height))
-    bars = plt.barh(parts, averages, color='lightgreen', height=0.4)
-    plt.xlabel(get_display("ציון ממוצע"), fontsize=14)
-    plt.title(title, fontsize=16)
-    plt.xlim(0, 10)
-    plt.xticks(fontsize=14)
-    plt.yticks(fontsize=14)
-    plt.tight_layout()
-    # Add average labels next to the bars
-    for bar, avg in zip(bars, averages):
-        plt.text(avg + 0.1, bar.get_y() + bar.get_height()/2, f'{avg}', va='center', fontsize=12)
-    plt.savefig(output_path)
-    plt.close()
+    image = BytesIO()
+    figure.savefig(image, format='png')
+    current_span().set(sessions=len(trends["dates"]), bytes=image.tell())
+    image.seek(0)
+    return image
@@ -0,0 +1,73 @@
+# chunking.py
+
+"""
+Token estimates and splitting of long debriefs for the map-reduce path of gpt_integration.
+"""
+
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Optional: without it tokens are estimated from the characters
+    tiktoken = None
+
+_encoding = None
+
+_HEBREW_RE = re.compile(r'[\u0590-\u05FF]')
+
+# Roughly how many characters make up one token of the model's tokenizer
+HEBREW_CHARS_PER_TOKEN = 2.5
+OTHER_CHARS_PER_TOKEN = 4.0
+
+def estimate_tokens(text):
+    """
+    Returns the number of tokens of the text: exact with tiktoken installed, otherwise
+    estimated from the number of Hebrew and other characters.
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    hebrew = len(_HEBREW_RE.findall(text))
+    return int(hebrew / HEBREW_CHARS_PER_TOKEN + (len(text) - hebrew) / OTHER_CHARS_PER_TOKEN) + 1
+
+def _split_to_fit(text, max_tokens, separators):
+    """
+    Splits text that is over max_tokens at the first separator that occurs in it
+    (paragraphs, then lines, then sentences); pieces with none of them are cut by length.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    for index, separator in enumerate(separators):
+        if separator in text.strip():
+            pieces = [piece + separator for piece in text.split(separator)]
+            pieces[-1] = pieces[-1][:-len(separator)]
+            return [part for piece in pieces if piece.strip() for part in _split_to_fit(piece, max_tokens, separators[index + 1:])]
+    chars = max(1, int(len(text) * max_tokens / estimate_tokens(text)))
+    return [text[start:start + chars] for start in range(0, len(text), chars)]
+
+def split_into_chunks(text, max_tokens, boundaries=()):
+    """
+    Splits the text into chunks of at most max_tokens (estimated) tokens.
+    `boundaries` are offsets where a new part starts (e.g. exercise headings): parts are
+    kept whole and merged with their neighbours while they fit, and only parts over
+    the budget are cut, at paragraph, line or sentence ends.
+    """
+    starts = sorted({0, *boundaries} - {len(text)})
+    parts = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    pieces = [piece for part in parts if part.strip() for piece in _split_to_fit(part, max_tokens, ["\n\n", "\n", ". "])]
+
+    chunks = []
+    current, current_tokens = "", 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current += piece
+        current_tokens += tokens
+    if current.strip():
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks]
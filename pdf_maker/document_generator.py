@@ -4,22 +4,105 @@ from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
+from io import BytesIO
 import os
+import threading
 
-from chart_utils import create_bar_chart, create_final_grade_chart
+from chart_utils import create_bar_chart, create_final_grade_chart, create_trend_chart
+from chart_pool import render_report_charts
+from docx_charts import add_native_part_chart, add_native_final_grade_chart
 from hyperlink_utils import add_hyperlink
-from sanitize_utils import sanitize_filename
+from report_styles import register_report_styles, add_styled_paragraph
+from tracing import span, traced, tracing_enabled
 
-def generate_word_document(sections, output_path, date="", signature="", title="", grades_data=None):
+CHART_BACKENDS = ("png", "native")
+
+# Template and logo are looked up next to this module, not in the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, 'template.docx')  # Ensure this file exists in the pdf_maker directory
+LOGO2_PATH = os.path.join(BASE_DIR, "dca_logo2.png")  # Ensure this file exists in the pdf_maker directory
+
+# Static content of the final page, shared with the PDF renderer
+CLOSING_TITLE = "תודה שהשתתפתם באימון שלנו"
+CLOSING_MESSAGE = (
+    "אנו מודים לכם על השתתפותכם באימון שלנו. "
+    "נשמח לעמוד לשירותכם בכל עת."
+)
+CONTACT_INFO = {
+    "אתר האינטרנט": "https://digitalcombat.academy/",
+    "דוא\"ל": "or.ben.shabat@digitalcombat.academy",
+    "טלפון": "+972544538973",
+    "LinkedIn": "https://www.linkedin.com/company/digital-combat-academy-incorporate/"
+}
+
+DEFAULT_TITLE = "דוח סיכום אימון"
+
+# Cached report skeleton: (cache key, saved .docx bytes, number of final page body elements)
+_report_skeleton = None
+_report_skeleton_lock = threading.Lock()
+
+def _add_final_page(document):
+    """
+    Adds the static final page (thank-you message, contact links and logo).
+    """
+    # Add a page break before the final page
+    document.add_page_break()
+
+    # Add final page content
+    add_styled_paragraph(document, CLOSING_TITLE, "Report Closing Title")
+
+    # Thank you message
+    add_styled_paragraph(document, CLOSING_MESSAGE, "Report Closing Message")
+
+    # Contact information
+    for label, info in CONTACT_INFO.items():
+        if label != "טלפון":
+            # Add clickable hyperlink
+            contact_paragraph = add_styled_paragraph(document, "", "Report Contact")
+            add_hyperlink(contact_paragraph, info, f"{label}: {info}", style="Report Hyperlink")
+        else:
+            # Add regular text for the phone number
+            add_styled_paragraph(document, f"{label}: {info}", "Report Contact")
+
+    # Add the logo image if needed (assuming you still want to keep dca_logo2.png)
+    if os.path.exists(LOGO2_PATH):
+        logo_paragraph = document.add_paragraph()
+        logo_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        logo_run = logo_paragraph.add_run()
+        logo_run.add_picture(LOGO2_PATH, width=Inches(6))
+    else:
+        print(f"Warning: Logo file '{LOGO2_PATH}' not found. Skipping logo.")
+
+def report_section_titles(sections):
+    """
+    Returns the (section, Hebrew title) pairs of the report in document order.
+    Exercises beyond the second one (e.g. "תרגיל 3") go before the summary.
+    """
+    extra_exercises = sorted(
+        int(section_title.split()[1]) for section_title in sections
+        if section_title.startswith("Exercise ") and section_title not in ("Exercise 1", "Exercise 2")
+    )
+    return [
+        ("Introduction", "הקדמה"),
+        ("Exercise 1", "תרגיל 1"),
+        ("Exercise 2", "תרגיל 2"),
+        *[(f"Exercise {number}", f"תרגיל {number}") for number in extra_exercises],
+        ("Summary", "סיכום")
+    ]
+
+def _body_elements(document):
+    return [element for element in document.element.body.iterchildren() if element.tag != qn('w:sectPr')]
+
+def _build_report_skeleton():
     """
-    Generates a Word document with the given content, applying the provided template.
+    Loads the template, applies the default font and appends the final page.
+    Returns the saved document bytes and the number of body elements of the final page.
     """
     # Load the template document
-    template_path = 'template.docx'  # Ensure this file exists in your directory
-    if os.path.exists(template_path):
-        document = Document(template_path)
+    if os.path.exists(TEMPLATE_PATH):
+        document = Document(TEMPLATE_PATH)
     else:
-        print(f"Error: Template file '{template_path}' not found. Using a blank document instead.")
+        print(f"Error: Template file '{TEMPLATE_PATH}' not found. Using a blank document instead.")
         document = Document()
 
     # Set default font to support Hebrew characters
@@ -29,180 +112,225 @@ def generate_word_document(sections, output_path, date="", signature="", title="
     font.size = Pt(10)
     font._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')  # Fix for Hebrew characters
 
+    # Register the report styles once; content refers to them by name
+    register_report_styles(document)
+
+    template_element_count = len(_body_elements(document))
+    _add_final_page(document)
+    final_page_element_count = len(_body_elements(document)) - template_element_count
+
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue(), final_page_element_count
+
+def _skeleton_cache_key():
+    # Rebuild the skeleton when the template or the logo changes on disk
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in (TEMPLATE_PATH, LOGO2_PATH))
+
+def new_report_document():
+    """
+    Returns a fresh document for a report and the body elements of its final page.
+    The template is parsed and the static final page (including its hyperlink and
+    image relationships) is built once per process; each call only parses a copy
+    of the cached bytes. The final page elements are detached so the caller can
+    append the dynamic content and then re-attach them.
+    """
+    global _report_skeleton
+    cache_key = _skeleton_cache_key()
+    with _report_skeleton_lock:
+        if _report_skeleton is None or _report_skeleton[0] != cache_key:
+            _report_skeleton = (cache_key, *_build_report_skeleton())
+        _, skeleton_bytes, final_page_element_count = _report_skeleton
+
+    document = Document(BytesIO(skeleton_bytes))
+    body = document.element.body
+    final_page_elements = _body_elements(document)[-final_page_element_count:] if final_page_element_count else []
+    for element in final_page_elements:
+        body.remove(element)
+    return document, final_page_elements
+
+def _add_sections(document, sections, title):
+    """
+    Adds the title and the text sections of the first page.
+    """
     # --- First Page Content ---
 
     # Add the title centered at the top
-    title_text = title if title else "דוח סיכום אימון"
+    title_text = title if title else DEFAULT_TITLE
     if title_text:
-        title_paragraph = document.add_paragraph()
-        title_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
-        title_run = title_paragraph.add_run(title_text)
-        title_run.font.name = 'Arial'
-        title_run.font.size = Pt(18)
-        title_run.bold = True
-        title_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+        add_styled_paragraph(document, title_text, "Report Title")
 
     # Add a line break before starting the GPT output text
     document.add_paragraph()
 
     # --- Insert GPT Output Text (Sections) ---
     # Add each section to the document
-    for section_title, hebrew_title in [
-        ("Introduction", "הקדמה"),
-        ("Exercise 1", "תרגיל 1"),
-        ("Exercise 2", "תרגיל 2"),
-        ("Summary", "סיכום")
-    ]:
+    for section_title, hebrew_title in report_section_titles(sections):
         if sections.get(section_title):
             # Add section title
-            heading = document.add_heading(hebrew_title, level=1)
-            heading.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
-            heading_run = heading.runs[0]
-            heading_run.font.name = 'Arial'
-            heading_run.font.size = Pt(14)
-            heading_run.bold = True
-            heading_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+            add_styled_paragraph(document, hebrew_title, "Report Section Heading")
 
             # Add section content
-            paragraph = document.add_paragraph()
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
             content = sections[section_title]
             # Remove '#' and '*' from content
             content = content.replace('#', '').replace('*', '')
-            run = paragraph.add_run(content)
-            run.font.name = 'Arial'
-            run.font.size = Pt(10)
-            run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+            add_styled_paragraph(document, content, "Report Body")
 
-    # --- Grades Section ---
-    if grades_data:
-        # Add a page break before grades
-        document.add_page_break()
-
-        # Add Grades Section
-        grades_heading = document.add_heading('דוח ציונים', level=1)
-        grades_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        grades_heading_run = grades_heading.runs[0]
-        grades_heading_run.font.name = 'Arial'
-        grades_heading_run.font.size = Pt(14)
-        grades_heading_run.bold = True
-        grades_heading_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
-
-        # Insert graphs with comments between them
-        max_items = max(len(part_data['items']) for part_name, part_data in grades_data.items() if part_name != 'final_grade')
-
-        for part_name, part_data in grades_data.items():
-            if part_name == "final_grade":
-                continue
-            # Add part heading
-            part_heading = document.add_heading(part_name, level=2)
-            part_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            part_heading_run = part_heading.runs[0]
-            part_heading_run.font.name = 'Arial'
-            part_heading_run.font.size = Pt(12)
-            part_heading_run.bold = True
-            part_heading_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
-
-            # Generate and insert graph for the part
-            # Sanitize the part name for the filename
-            sanitized_part_name = sanitize_filename(part_name)
-            chart_path = f"{sanitized_part_name}_chart.png"
-            create_bar_chart(part_data['items'], part_name, chart_path, max_items)
-            document.add_picture(chart_path, width=Inches(6))
-            # Remove the chart image file after inserting
-            os.remove(chart_path)
-
-            # Add comment after the graph
-            if 'comment' in part_data and part_data['comment']:
-                comment_paragraph = document.add_paragraph()
-                comment_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
-                comment_run = comment_paragraph.add_run(part_data['comment'])
-                comment_run.font.name = 'Arial'
-                comment_run.font.size = Pt(10)
-                comment_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
-
-        # Add final grade
-        final_grade_paragraph = document.add_paragraph()
-        final_grade_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = final_grade_paragraph.add_run(f"ציון סופי: {grades_data['final_grade']}")
-        run.font.name = 'Arial'
-        run.font.size = Pt(14)
-        run.bold = True
-        run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
-
-        # Generate and insert final grade graph
-        final_chart_path = "final_grade_chart.png"
-        create_final_grade_chart(grades_data, final_chart_path, max_items)
-        document.add_picture(final_chart_path, width=Inches(6))
-        # Remove the chart image file after inserting
-        os.remove(final_chart_path)
-
-    # --- Final Page ---
-    # Add a page break before the final page
+def _add_chart_picture(document, image):
+    """
+    Embeds a rendered chart image (PNG in a BytesIO buffer) 6 inches wide.
+    """
+    with span("docx.add_picture", bytes=image.getbuffer().nbytes):
+        document.add_picture(image, width=Inches(6))
+
+def _add_grades(document, grades_data, chart_images, parallel_charts, chart_backend):
+    """
+    Adds the grades pages: a chart and comment per part, then the final grade and its chart.
+    """
+    # Add a page break before grades
     document.add_page_break()
 
-    # Add final page content
-    thank_you_title = document.add_heading("תודה שהשתתפתם באימון שלנו", level=0)
-    thank_you_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    thank_you_title_run = thank_you_title.runs[0]
-    thank_you_title_run.font.name = 'Arial'
-    thank_you_title_run.font.size = Pt(24)
-    thank_you_title_run.bold = True
-    thank_you_title_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+    # Add Grades Section
+    add_styled_paragraph(document, 'דוח ציונים', "Report Section Heading")
 
-    # Thank you message
-    thank_you_message = (
-        "אנו מודים לכם על השתתפותכם באימון שלנו. "
-        "נשמח לעמוד לשירותכם בכל עת."
-    )
-    message_paragraph = document.add_paragraph()
-    message_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    message_run = message_paragraph.add_run(thank_you_message)
-    message_run.font.name = 'Arial'
-    message_run.font.size = Pt(14)
-    message_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+    # Insert graphs with comments between them
+    max_items = max(len(part_data['items']) for part_name, part_data in grades_data.items() if part_name != 'final_grade')
+    if chart_backend == "native":
+        chart_images = None
+    elif chart_images is None and parallel_charts:
+        chart_images = render_report_charts(grades_data)
+    chart_images = iter(chart_images) if chart_images is not None else None
 
-    # Contact information
-    contact_info = {
-        "אתר האינטרנט": "https://digitalcombat.academy/",
-        "דוא\"ל": "or.ben.shabat@digitalcombat.academy",
-        "טלפון": "+972544538973",
-        "LinkedIn": "https://www.linkedin.com/company/digital-combat-academy-incorporate/"
-    }
-
-    for label, info in contact_info.items():
-        contact_paragraph = document.add_paragraph()
-        contact_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
-        if label != "טלפון":
-            # Add clickable hyperlink
-            add_hyperlink(contact_paragraph, info, f"{label}: {info}")
+    for part_name, part_data in grades_data.items():
+        if part_name == "final_grade":
+            continue
+        # Add part heading
+        add_styled_paragraph(document, part_name, "Report Part Heading")
+
+        # Generate and insert graph for the part (rendered in memory)
+        if chart_backend == "native":
+            add_native_part_chart(document, part_data['items'], part_name, max_items)
         else:
-            # Add regular text for the phone number
-            contact_run = contact_paragraph.add_run(f"{label}: {info}")
-            contact_run.font.name = 'Arial'
-            contact_run.font.size = Pt(12)
-            contact_run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+            if chart_images is not None:
+                chart_image = next(chart_images)
+            else:
+                chart_image = create_bar_chart(part_data['items'], part_name, max_items)
+            _add_chart_picture(document, chart_image)
 
-    # Add the logo image if needed (assuming you still want to keep dca_logo2.png)
-    logo2_path = "dca_logo2.png"  # Ensure this file exists in your directory
-    if os.path.exists(logo2_path):
-        logo_paragraph = document.add_paragraph()
-        logo_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        logo_run = logo_paragraph.add_run()
-        logo_run.add_picture(logo2_path, width=Inches(6))
+        # Add comment after the graph
+        if 'comment' in part_data and part_data['comment']:
+            add_styled_paragraph(document, part_data['comment'], "Report Comment")
+
+    # Add final grade
+    add_styled_paragraph(document, f"ציון סופי: {grades_data['final_grade']}", "Report Final Grade")
+
+    # Generate and insert final grade graph
+    if chart_backend == "native":
+        add_native_final_grade_chart(document, grades_data, max_items)
     else:
-        print(f"Warning: Logo file '{logo2_path}' not found. Skipping logo.")
+        if chart_images is not None:
+            final_chart_image = next(chart_images)
+        else:
+            final_chart_image = create_final_grade_chart(grades_data, max_items)
+        _add_chart_picture(document, final_chart_image)
+
+def _add_trends(document, trends):
+    """
+    Adds the force's progress: a chart of its recent sessions and its weakest items.
+    The chart is always a PNG image, also with the native chart backend.
+    """
+    add_styled_paragraph(document, "מגמות לאורך האימונים", "Report Part Heading")
+    _add_chart_picture(document, create_trend_chart(trends))
+    if trends["weakest_items"]:
+        weakest = "; ".join(f"{item} ({average:.1f})" for _, item, average in trends["weakest_items"])
+        add_styled_paragraph(document, f"נושאים לשיפור: {weakest}", "Report Comment")
+
+def _attach_final_page(document, final_page_elements, signature):
+    """
+    Re-attaches the prebuilt final page after the dynamic content and adds the signature.
+    """
+    # Re-attach the prebuilt final page after the dynamic content
+    sectPr = document.element.body.find(qn('w:sectPr'))
+    for element in final_page_elements:
+        if sectPr is not None:
+            sectPr.addprevious(element)
+        else:
+            document.element.body.append(element)
+        # Give the prebuilt pictures ids that don't clash with the new ones
+        for doc_pr in element.iter(qn('wp:docPr')):
+            shape_id = str(document.part.next_id)
+            doc_pr.set('id', shape_id)
+            for c_nv_pr in doc_pr.getparent().iter(qn('pic:cNvPr')):
+                c_nv_pr.set('id', shape_id)
 
     # Add signature at the end
     if signature:
         document.add_paragraph()  # Add empty paragraph for spacing
-        signature_paragraph = document.add_paragraph()
-        signature_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER  # Center align
-        run = signature_paragraph.add_run(signature)
-        run.font.name = 'Arial'
-        run.font.size = Pt(12)
-        run.bold = True
-        run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Arial')
+        add_styled_paragraph(document, signature, "Report Signature")
+
+def build_report_document(sections, date="", signature="", title="", grades_data=None,
+                          chart_images=None, parallel_charts=False, chart_backend="png", trends=None):
+    """
+    Builds the report Word document in memory with the given content, applying the template.
+    Reads no files other than the template and logo and writes none, so several
+    reports can be built at the same time in one process.
+    chart_backend selects how grade charts are added: "png" embeds matplotlib images,
+    "native" writes native Word charts (see docx_charts).
+    PNG charts are rendered one after another unless parallel_charts is set, in which case
+    they are rendered on the chart process pool. Pre-rendered charts (e.g. from
+    chart_pool.render_charts_for_reports) can be passed in document order as chart_images.
+    trends (see analytics.report_trends) adds the force's progress after the grades.
+    """
+    if chart_backend not in CHART_BACKENDS:
+        raise ValueError(f"Unknown chart backend '{chart_backend}', expected one of {CHART_BACKENDS}")
+
+    # Copy of the cached template, with the static final page detached
+    with span("docx.template"):
+        document, final_page_elements = new_report_document()
+
+    with span("docx.sections", sections=len(sections)):
+        _add_sections(document, sections, title)
+
+    if grades_data:
+        with span("docx.grades", parts=len(grades_data) - 1, chart_backend=chart_backend):
+            _add_grades(document, grades_data, chart_images, parallel_charts, chart_backend)
+
+    if trends:
+        with span("docx.trends", sessions=len(trends["dates"])):
+            _add_trends(document, trends)
+
+    with span("docx.final_page"):
+        _attach_final_page(document, final_page_elements, signature)
+
+    return document
+
+@traced("generate_word_document")
+def generate_word_document(sections, output_path, date="", signature="", title="", grades_data=None,
+                           chart_images=None, parallel_charts=False, chart_backend="png", trends=None):
+    """
+    Generates a Word document with the given content (see build_report_document) and
+    saves it to output_path, which may be a file path or a writable binary stream.
+    """
+    document = build_report_document(
+        sections, date=date, signature=signature, title=title, grades_data=grades_data,
+        chart_images=chart_images, parallel_charts=parallel_charts, chart_backend=chart_backend, trends=trends
+    )
 
     # Save the document
-    document.save(output_path)
+    with span("docx.save") as current:
+        document.save(output_path)
+        if tracing_enabled():
+            is_path = isinstance(output_path, (str, os.PathLike))
+            current.set(bytes=os.path.getsize(output_path) if is_path else output_path.tell())
+
+def generate_word_document_bytes(sections, date="", signature="", title="", grades_data=None,
+                                 chart_images=None, parallel_charts=False, chart_backend="png", trends=None):
+    """
+    Generates a Word document with the given content and returns the .docx as bytes.
+    """
+    buffer = BytesIO()
+    generate_word_document(
+        sections, buffer, date=date, signature=signature, title=title, grades_data=grades_data,
+        chart_images=chart_images, parallel_charts=parallel_charts, chart_backend=chart_backend, trends=trends
+    )
+    return buffer.getvalue()
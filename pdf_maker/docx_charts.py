@@ -0,0 +1,212 @@
+# docx_charts.py
+
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.part import Part
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Inches
+from tracing import traced, current_span
+
+# Bar colours matching the matplotlib charts in chart_utils
+PART_CHART_COLOR = '87CEEB'  # skyblue
+FINAL_CHART_COLOR = '90EE90'  # lightgreen
+
+CHART_FONT_FAMILY = 'Arial'
+
+def _text_properties(size):
+    """
+    Returns a c:txPr element setting the font and size (in points) of chart text.
+    """
+    return (
+        '<c:txPr><a:bodyPr/><a:lstStyle/><a:p><a:pPr>'
+        f'<a:defRPr sz="{size * 100}"><a:latin typeface="{CHART_FONT_FAMILY}"/><a:cs typeface="{CHART_FONT_FAMILY}"/></a:defRPr>'
+        '</a:pPr><a:endParaRPr lang="he-IL"/></a:p></c:txPr>'
+    )
+
+def _rich_title(text, size):
+    """
+    Returns a c:title element with the given text.
+    """
+    return (
+        '<c:title><c:tx><c:rich><a:bodyPr/><a:lstStyle/><a:p>'
+        f'<a:pPr><a:defRPr sz="{size * 100}"/></a:pPr>'
+        f'<a:r><a:rPr lang="he-IL" sz="{size * 100}"><a:latin typeface="{CHART_FONT_FAMILY}"/><a:cs typeface="{CHART_FONT_FAMILY}"/></a:rPr>'
+        f'<a:t>{escape(text)}</a:t></a:r></a:p></c:rich></c:tx><c:overlay val="0"/></c:title>'
+    )
+
+def _chart_xml(labels, values, title, axis_title, color, workbook_r_id):
+    """
+    Builds the chart part XML of a horizontal bar chart whose data lives in
+    Sheet1 of the embedded workbook (labels in column A, values in column B).
+    """
+    count = len(labels)
+    label_points = ''.join(f'<c:pt idx="{i}"><c:v>{escape(label)}</c:v></c:pt>' for i, label in enumerate(labels))
+    value_points = ''.join(f'<c:pt idx="{i}"><c:v>{value}</c:v></c:pt>' for i, value in enumerate(values))
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<c:chartSpace {nsdecls("c", "a", "r")}>'
+        '<c:roundedCorners val="0"/>'
+        '<c:chart>'
+        f'{_rich_title(title, 16)}'
+        '<c:autoTitleDeleted val="0"/>'
+        '<c:plotArea><c:layout/>'
+        '<c:barChart><c:barDir val="bar"/><c:grouping val="clustered"/><c:varyColors val="0"/>'
+        '<c:ser><c:idx val="0"/><c:order val="0"/>'
+        f'<c:tx><c:strRef><c:f>Sheet1!$B$1</c:f><c:strCache><c:ptCount val="1"/><c:pt idx="0"><c:v>{escape(axis_title)}</c:v></c:pt></c:strCache></c:strRef></c:tx>'
+        f'<c:spPr><a:solidFill><a:srgbClr val="{color}"/></a:solidFill></c:spPr>'
+        '<c:invertIfNegative val="0"/>'
+        '<c:dLbls><c:spPr><a:noFill/><a:ln><a:noFill/></a:ln></c:spPr>'
+        f'{_text_properties(12)}'
+        '<c:dLblPos val="outEnd"/><c:showLegendKey val="0"/><c:showVal val="1"/><c:showCatName val="0"/>'
+        '<c:showSerName val="0"/><c:showPercent val="0"/><c:showBubbleSize val="0"/></c:dLbls>'
+        f'<c:cat><c:strRef><c:f>Sheet1!$A$2:$A${count + 1}</c:f><c:strCache><c:ptCount val="{count}"/>{label_points}</c:strCache></c:strRef></c:cat>'
+        f'<c:val><c:numRef><c:f>Sheet1!$B$2:$B${count + 1}</c:f><c:numCache><c:formatCode>General</c:formatCode><c:ptCount val="{count}"/>{value_points}</c:numCache></c:numRef></c:val>'
+        '</c:ser>'
+        '<c:gapWidth val="150"/><c:axId val="500000001"/><c:axId val="500000002"/>'
+        '</c:barChart>'
+        '<c:catAx><c:axId val="500000001"/><c:scaling><c:orientation val="minMax"/></c:scaling><c:delete val="0"/>'
+        '<c:axPos val="l"/><c:numFmt formatCode="General" sourceLinked="0"/><c:majorTickMark val="out"/>'
+        f'<c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>{_text_properties(14)}'
+        '<c:crossAx val="500000002"/><c:crosses val="autoZero"/><c:auto val="1"/><c:lblAlgn val="ctr"/>'
+        '<c:lblOffset val="100"/><c:noMultiLvlLbl val="0"/></c:catAx>'
+        '<c:valAx><c:axId val="500000002"/><c:scaling><c:orientation val="minMax"/><c:max val="10"/><c:min val="0"/></c:scaling>'
+        f'<c:delete val="0"/><c:axPos val="b"/>{_rich_title(axis_title, 14)}'
+        '<c:numFmt formatCode="General" sourceLinked="0"/><c:majorTickMark val="out"/><c:minorTickMark val="none"/>'
+        f'<c:tickLblPos val="nextTo"/>{_text_properties(14)}'
+        '<c:crossAx val="500000001"/><c:crosses val="autoZero"/><c:crossBetween val="between"/><c:majorUnit val="2"/></c:valAx>'
+        '</c:plotArea>'
+        '<c:plotVisOnly val="1"/><c:dispBlanksAs val="gap"/>'
+        '</c:chart>'
+        f'{_text_properties(12)}'
+        f'<c:externalData r:id="{workbook_r_id}"><c:autoUpdate val="0"/></c:externalData>'
+        '</c:chartSpace>'
+    )
+
+def _workbook_blob(labels, values, axis_title):
+    """
+    Builds a minimal .xlsx holding the chart data, so the chart can be edited in Word.
+    """
+    def text_cell(ref, text):
+        return f'<c r="{ref}" t="inlineStr"><is><t>{escape(text)}</t></is></c>'
+
+    rows = [f'<row r="1">{text_cell("A1", "")}{text_cell("B1", axis_title)}</row>']
+    for row, (label, value) in enumerate(zip(labels, values), start=2):
+        rows.append(f'<row r="{row}">{text_cell(f"A{row}", label)}<c r="B{row}"><v>{value}</v></c></row>')
+
+    spreadsheet_ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    relationships_ns = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    files = {
+        '[Content_Types].xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ),
+        '_rels/.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{relationships_ns}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ),
+        'xl/workbook.xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{spreadsheet_ns}" xmlns:r="{relationships_ns}">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{relationships_ns}/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'
+        ),
+        'xl/worksheets/sheet1.xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{spreadsheet_ns}"><sheetData>{"".join(rows)}</sheetData></worksheet>'
+        ),
+    }
+
+    blob = io.BytesIO()
+    with zipfile.ZipFile(blob, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in files.items():
+            workbook.writestr(name, content)
+    return blob.getvalue()
+
+@traced("chart.native")
+def add_native_bar_chart(document, labels, values, title, axis_title, color, width, height):
+    """
+    Appends a native Word horizontal bar chart (a DrawingML chart part with an
+    embedded data sheet) to the document in its own paragraph.
+    """
+    package = document.part.package
+
+    # Embedded workbook with the chart data
+    workbook_part = Part(
+        package.next_partname('/word/embeddings/Microsoft_Excel_Sheet%d.xlsx'),
+        CT.SML_SHEET,
+        _workbook_blob(labels, values, axis_title),
+        package
+    )
+
+    # Chart part, linked to the workbook through its externalData relationship
+    chart_part = Part(package.next_partname('/word/charts/chart%d.xml'), CT.DML_CHART, None, package)
+    workbook_r_id = chart_part.relate_to(workbook_part, RT.PACKAGE)
+    chart_part._blob = _chart_xml(labels, values, title, axis_title, color, workbook_r_id).encode('utf-8')
+    chart_r_id = document.part.relate_to(chart_part, RT.CHART)
+    current_span().set(items=len(values), bytes=len(workbook_part.blob) + len(chart_part.blob))
+
+    shape_id = document.part.next_id
+    inline = parse_xml(
+        f'<wp:inline {nsdecls("wp", "a", "c", "r")} distT="0" distB="0" distL="0" distR="0">'
+        f'<wp:extent cx="{int(width)}" cy="{int(height)}"/>'
+        '<wp:effectExtent l="0" t="0" r="0" b="0"/>'
+        f'<wp:docPr id="{shape_id}" name="Chart {shape_id}"/>'
+        '<wp:cNvGraphicFramePr/>'
+        '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/chart">'
+        f'<c:chart r:id="{chart_r_id}"/>'
+        '</a:graphicData></a:graphic>'
+        '</wp:inline>'
+    )
+    drawing = OxmlElement('w:drawing')
+    drawing.append(inline)
+
+    paragraph = document.add_paragraph()
+    paragraph.add_run()._r.append(drawing)
+    return paragraph
+
+def _chart_size(max_items):
+    """
+    Returns the (width, height) of a chart, matching the proportions of the
+    matplotlib charts (8 x max_items * 0.5 + 1 inches) scaled to 6 inches wide.
+    """
+    width = Inches(6)
+    return width, int(width * (max_items * 0.5 + 1) / 8)
+
+def add_native_part_chart(document, items, title, max_items):
+    """
+    Native equivalent of chart_utils.create_bar_chart + add_picture.
+    Word applies the bidi algorithm itself, so labels stay in logical order
+    (no get_display); the items are reversed like in chart_utils so the first
+    item is drawn at the top.
+    """
+    labels = list(items.keys())[::-1]
+    grades = list(items.values())[::-1]
+    width, height = _chart_size(max_items)
+    return add_native_bar_chart(document, labels, grades, title, "ציון", PART_CHART_COLOR, width, height)
+
+def add_native_final_grade_chart(document, grades_data, max_items):
+    """
+    Native equivalent of chart_utils.create_final_grade_chart + add_picture.
+    """
+    parts = [part for part in grades_data if part != 'final_grade']
+    averages = [grades_data[part]['average'] for part in parts]
+    width, height = _chart_size(max_items)
+    return add_native_bar_chart(
+        document, parts[::-1], averages[::-1], 'ציון ממוצע לכל חלק', "ציון ממוצע", FINAL_CHART_COLOR, width, height
+    )
@@ -0,0 +1,145 @@
+# fake_llm.py
+
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+
+import openai
+from openai.openai_object import OpenAIObject
+
+# Canned four-section answer in the format requested by gpt_integration.build_messages
+CANNED_RESPONSE = (
+    "הקדמה\n"
+    "כוח האימון ביצע אימון בסימולטור DCA בבסיס האימונים לכיש.\n"
+    "המנהל: יואב סמיפור.\n\n"
+    "תרגיל 1\n"
+    "הכוח זיהה התקרבות של רועה צאן לגדר, הפעיל נוהל מעצר חשוד ודיווח לחמ\"ל החטיבה. "
+    "בהמשך זוהה ניסיון הברחת אמל\"ח מעל הגדר והכוח פעל לסיכולו.\n"
+    "הכוח גילה שליטה טובה ברשת הקשר ודיווחים מדויקים.\n"
+    "על הכוח לשפר את מהירות הסריקות ואת סגירת המעגלים מול החמ\"ל.\n\n"
+    "תרגיל 2\n"
+    "הכוח ביצע מרדף אחר חוליית מחבלים בשטח הכחול לאורך ציר המערכת וחסם את הצירים.\n"
+    "שיתוף הפעולה בין חמ\"ל הגדוד לחמ\"ל החטיבה נתן תמונת מצב מלאה.\n"
+    "יש לשפר את עיתוי הסיוע הרפואי ואת המעקב אחר החשודים.\n\n"
+    "סיכום\n"
+    "הכוח הפגין מוכנות גבוהה ויכולת פיקוד ושליטה טובה. "
+    "יש להמשיך לתרגל סריקות מהירות וסגירת מעגלים."
+)
+
+# The same answer in the JSON format of gpt_integration.REPORT_SCHEMA (structured mode)
+CANNED_STRUCTURED_RESPONSE = json.dumps({
+    "introduction": CANNED_RESPONSE.split("\n\n")[0].split("\n", 1)[1],
+    "exercises": [section.split("\n", 1)[1] for section in CANNED_RESPONSE.split("\n\n")[1:3]],
+    "summary": CANNED_RESPONSE.split("\n\n")[3].split("\n", 1)[1]
+}, ensure_ascii=False)
+
+def split_chunks(content):
+    """
+    Splits a response into the chunks it is streamed in: words, keeping the
+    whitespace, like streamed tokens.
+    """
+    words = content.split(' ')
+    return [word if i == len(words) - 1 else word + ' ' for i, word in enumerate(words)]
+
+class FakeChatCompletion:
+    """
+    Offline stand-in for openai.ChatCompletion that answers with a canned response.
+    Streamed requests (stream=True) get the first chunk after `latency` seconds and
+    one word every `chunk_delay` seconds after that; other requests get the whole
+    response once it would have finished streaming (see response_time).
+    `response` may also be a function of the request's keyword arguments returning
+    the answer, `latency` one returning the seconds to the first token (e.g. growing
+    with the prompt), and every request's keyword arguments are kept in `requests`.
+    """
+
+    def __init__(self, latency=1.0, response=CANNED_RESPONSE, chunk_delay=0.0):
+        self.latency = latency
+        self.response = response
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.requests = []
+
+    def _answer(self, request):
+        return self.response(request) if callable(self.response) else self.response
+
+    def _latency(self, request):
+        return self.latency(request) if callable(self.latency) else self.latency
+
+    def response_time(self, content=None, request=None):
+        """
+        Seconds until a complete (non-streamed) response is returned.
+        """
+        request = request or {}
+        content = self._answer(request) if content is None else content
+        return self._latency(request) + len(split_chunks(content)) * self.chunk_delay
+
+    @staticmethod
+    def _build_chunk(content):
+        return OpenAIObject.construct_from({
+            "object": "chat.completion.chunk",
+            "model": "fake",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+        })
+
+    def _stream(self, content, request):
+        self.calls += 1
+        time.sleep(self._latency(request))
+        for chunk in split_chunks(content):
+            yield self._build_chunk(chunk)
+            time.sleep(self.chunk_delay)
+
+    async def _astream(self, content, request):
+        self.calls += 1
+        await asyncio.sleep(self._latency(request))
+        for chunk in split_chunks(content):
+            yield self._build_chunk(chunk)
+            await asyncio.sleep(self.chunk_delay)
+
+    def _build_response(self, content, request):
+        self.calls += 1
+        # Rough token counts (one per word) so traces show usage like real responses
+        prompt_tokens = sum(len(message["content"].split()) for message in request.get("messages", []))
+        return OpenAIObject.construct_from({
+            "object": "chat.completion",
+            "model": "fake",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content.split()),
+                "total_tokens": prompt_tokens + len(content.split())
+            }
+        })
+
+    def create(self, stream=False, **kwargs):
+        self.requests.append(kwargs)
+        content = self._answer(kwargs)
+        if stream:
+            return self._stream(content, kwargs)
+        time.sleep(self.response_time(content, kwargs))
+        return self._build_response(content, kwargs)
+
+    async def acreate(self, stream=False, **kwargs):
+        self.requests.append(kwargs)
+        content = self._answer(kwargs)
+        if stream:
+            return self._astream(content, kwargs)
+        await asyncio.sleep(self.response_time(content, kwargs))
+        return self._build_response(content, kwargs)
+
+@contextmanager
+def fake_openai(latency=1.0, response=CANNED_RESPONSE, chunk_delay=0.0):
+    """
+    Replaces openai.ChatCompletion with a FakeChatCompletion for the duration of the block.
+    """
+    fake = FakeChatCompletion(latency, response, chunk_delay)
+    original = openai.ChatCompletion
+    openai.ChatCompletion = fake
+    try:
+        yield fake
+    finally:
+        openai.ChatCompletion = original
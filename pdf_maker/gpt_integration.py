@@ -1,132 +1,690 @@
 # gpt_integration.py
 
 import os
+import asyncio
+import json
+import math
+import aiohttp
 import openai
 import re
 from dotenv import load_dotenv
-from document_generator import generate_word_document
+from llm_cache import llm_cache, LLM_CACHE_BYPASS
+from tracing import traced, current_span, event
+from llm_client import llm_client, CircuitOpenError
+from chunking import estimate_tokens, split_into_chunks
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Set up OpenAI API key from environment variable
 openai.api_key = os.getenv("OPENAI_API_KEY")
+# Endpoint of the API, e.g. a local mock_llm_server for load tests
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
 
-def improve_text(text, date, manager_name, force_name, location):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",  # Use "gpt-3.5-turbo" if you don't have access to GPT-4
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an assistant specializing in creating text in a military style, tailored specifically for the IDF. "
-                        "Your task is to improve the text, making it more professional and impactful, and to organize it into four sections according to the following military structure:\n\n"
-                        "1. Introduction ('הקדמה'):\n"
-                        "   - Provide the following details in **2 lines**:\n"
-                        f"     - Name of the force:\n"
-                        f"     - Date: \n"
-                        f"     - Manager: {manager_name}\n"
-                        f"     - Location: \n\n"
-                        "2. Exercise 1 ('תרגיל 1'):\n"
-                        "   - Limit to **7 lines**.\n"
-                        "   - Three paragraphs:\n"
-                        "     - Paragraph one: Describe the events in chronological order, not in a list.\n"
-                        "     - Paragraph two: What the force did well.\n"
-                        "     - Paragraph three: Where the force needs to improve.\n\n"
-                        "3. Exercise 2 ('תרגיל 2'):\n"
-                        "   - Limit to **7 lines**.\n"
-                        "   - Three paragraphs, same structure as Exercise 1.\n\n"
-                        "4. Summary ('סיכום'):\n"
-                        "   - Limit to **5 lines**.\n"
-                        "   - A conclusion of the exercises, highlighting the critical disadvantages of the force (if any) and where the force did well.\n"
-                        "   - The summary should maintain a positive tone.\n\n"
-                        "Guidelines:\n"
-                        "- Replace any instances of 'Scenario' ('תרחיש') with 'Exercise' ('תרגיל').\n"
-                        "- Describe events in chronological order, avoiding division into sub-events.\n"
-                        "- Ensure the entire output is well-organized and professional.\n"
-                        "- Write exclusively in Hebrew, adhering to military jargon and style appropriate for the IDF.\n"
-                        "- Each section must start with its title on a new line, without any additional formatting or symbols.\n"
-                        "- Maintain a formal and authoritative tone suitable for IDF documentation.\n"
-                        "- **Strictly adhere to the specified line limits for each section.**"
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": f"Please improve this text and divide it into four parts as instructed: {text}"
-                }
-            ]
+LLM_MODEL = "gpt-4o"
+
+# Maximum number of LLM requests in flight at once and the deadline of a request,
+# including its retries (seconds; see llm_client)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+_llm_semaphore = None
+_llm_semaphore_loop = None
+_http_session = None
+_http_session_loop = None
+
+# Structured (JSON mode) output: the object the model must return. "maxLines" are the
+# line limits of the prompt, checked by validate_report (not a standard schema keyword).
+REPORT_SCHEMA = {
+    "type": "object",
+    "required": ["introduction", "exercises", "summary"],
+    "properties": {
+        "introduction": {"type": "string", "maxLines": 2},
+        "exercises": {"type": "array", "minItems": 2, "items": {"type": "string", "maxLines": 7}},
+        "summary": {"type": "string", "maxLines": 5}
+    }
+}
+
+# Approximate number of characters in one line of the report body text
+CHARS_PER_LINE = 110
+
+# Maximum rounds of re-requesting invalid sections of a structured report
+STRUCTURED_MAX_REASKS = int(os.getenv("STRUCTURED_MAX_REASKS", "2"))
+
+# Debriefs estimated at more tokens than LLM_SINGLE_SHOT_TOKENS are condensed in
+# chunks of at most LLM_CHUNK_TOKENS before the four-section request (map-reduce)
+LLM_SINGLE_SHOT_TOKENS = int(os.getenv("LLM_SINGLE_SHOT_TOKENS", "12000"))
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "4000"))
+
+# Define the possible section names in both English and Hebrew
+SECTION_NAMES = {
+    "Introduction": ["הקדמה", "מבוא", "Introduction"],
+    "Exercise 1": ["תרגיל 1", "Exercise 1"],
+    "Exercise 2": ["תרגיל 2", "Exercise 2"],
+    "Summary": ["סיכום", "Summary"]
+}
+
+# Words that start a numbered exercise heading ("תרחיש"/"Scenario" should be
+# replaced by the model but still shows up)
+EXERCISE_HEADINGS = ["תרגיל", "תרחיש", "Exercise", "Scenario"]
+
+# Heading name (lower case) -> section, for the headings that are not numbered exercises
+_HEADING_SECTIONS = {
+    name.lower(): section
+    for section, names in SECTION_NAMES.items() if not section.startswith("Exercise")
+    for name in names
+}
+
+# A heading is a line starting (after optional indentation, '#' or '*') with a section
+# name; the rest of the line, e.g. a translated title or ':', is part of the heading.
+# Only [ \t] is allowed before the name so a match never spans several lines.
+_SECTION_HEADING_RE = re.compile(
+    r'^[ \t#*]*(?:(?:%s)[ \t]*(?P<number>\d+)|(?P<name>%s))[^\n]*' % (
+        '|'.join(re.escape(name) for name in EXERCISE_HEADINGS),
+        '|'.join(re.escape(name) for name in _HEADING_SECTIONS)
+    ),
+    re.MULTILINE | re.IGNORECASE
+)
+
+def build_messages(text, manager_name):
+    """
+    Builds the chat messages (system prompt and user text) sent to the LLM.
+    """
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an assistant specializing in creating text in a military style, tailored specifically for the IDF. "
+                "Your task is to improve the text, making it more professional and impactful, and to organize it into four sections according to the following military structure:\n\n"
+                "1. Introduction ('הקדמה'):\n"
+                "   - Provide the following details in **2 lines**:\n"
+                f"     - Name of the force:\n"
+                f"     - Date: \n"
+                f"     - Manager: {manager_name}\n"
+                f"     - Location: \n\n"
+                "2. Exercise 1 ('תרגיל 1'):\n"
+                "   - Limit to **7 lines**.\n"
+                "   - Three paragraphs:\n"
+                "     - Paragraph one: Describe the events in chronological order, not in a list.\n"
+                "     - Paragraph two: What the force did well.\n"
+                "     - Paragraph three: Where the force needs to improve.\n\n"
+                "3. Exercise 2 ('תרגיל 2'):\n"
+                "   - Limit to **7 lines**.\n"
+                "   - Three paragraphs, same structure as Exercise 1.\n\n"
+                "4. Summary ('סיכום'):\n"
+                "   - Limit to **5 lines**.\n"
+                "   - A conclusion of the exercises, highlighting the critical disadvantages of the force (if any) and where the force did well.\n"
+                "   - The summary should maintain a positive tone.\n\n"
+                "Guidelines:\n"
+                "- Replace any instances of 'Scenario' ('תרחיש') with 'Exercise' ('תרגיל').\n"
+                "- Describe events in chronological order, avoiding division into sub-events.\n"
+                "- Ensure the entire output is well-organized and professional.\n"
+                "- Write exclusively in Hebrew, adhering to military jargon and style appropriate for the IDF.\n"
+                "- Each section must start with its title on a new line, without any additional formatting or symbols.\n"
+                "- Maintain a formal and authoritative tone suitable for IDF documentation.\n"
+                "- **Strictly adhere to the specified line limits for each section.**"
+            )
+        },
+        {
+            "role": "user",
+            "content": f"Please improve this text and divide it into four parts as instructed: {text}"
+        }
+    ]
+
+def _cache_params(**params):
+    """
+    Returns the request parameters for the cache key: `params` and the settings that
+    change the output of a long text (how and whether it is condensed first).
+    """
+    return {"single_shot_tokens": LLM_SINGLE_SHOT_TOKENS, "chunk_tokens": LLM_CHUNK_TOKENS, **params}
+
+def _get_cached_response(messages, use_cache):
+    """
+    Returns (cache_key, cached response or None) for the request.
+    """
+    cache_key = llm_cache.make_key(LLM_MODEL, messages, _cache_params())
+    if not use_cache or LLM_CACHE_BYPASS:
+        return cache_key, None
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print("Using cached LLM response.")
+    return cache_key, cached
+
+def _trace_response(response, raw_text):
+    """
+    Adds the token counts and size of an LLM response to the current span and logs
+    the raw text as a trace event.
+    """
+    current = current_span()
+    current.set(response_chars=len(raw_text))
+    # Streamed responses carry no usage
+    usage = response.get("usage") if response is not None else None
+    if usage:
+        current.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+    event("llm.response", text=raw_text)
+
+def improve_text(text, date, manager_name, force_name, location, use_cache=True):
+    """
+    Blocking version of improve_text_async for the command line.
+    """
+    return run_with_llm(improve_text_async(text, date, manager_name, force_name, location, use_cache=use_cache))
+
+def _get_llm_semaphore():
+    """
+    Returns the semaphore that limits how many LLM requests are in flight at once.
+    A semaphore only works in one event loop, so a new one is made for every loop
+    (e.g. each asyncio.run of the command line tools).
+    """
+    global _llm_semaphore, _llm_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _llm_semaphore is None or _llm_semaphore_loop is not loop:
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_IN_FLIGHT)
+        _llm_semaphore_loop = loop
+    return _llm_semaphore
+
+def set_max_in_flight(limit):
+    """
+    Changes the maximum number of concurrent LLM requests made by improve_text_async.
+    """
+    global LLM_MAX_IN_FLIGHT, _llm_semaphore
+    LLM_MAX_IN_FLIGHT = limit
+    _llm_semaphore = None
+
+def _get_http_session():
+    """
+    Returns the HTTP session shared by the LLM requests of the running event loop.
+    Besides reusing connections, this keeps openai from leaking a session for every
+    cancelled request (a lost hedge, a timeout or /cancel), since it only closes the
+    sessions it creates itself when the request ends with an Exception.
+    """
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session_loop is not loop or _http_session.closed:
+        _http_session = aiohttp.ClientSession()
+        _http_session_loop = loop
+    return _http_session
+
+async def close_http_session():
+    """
+    Closes the shared HTTP session of the running event loop, if there is one.
+    """
+    global _http_session
+    if _http_session is not None and _http_session_loop is asyncio.get_running_loop():
+        await _http_session.close()
+    _http_session = None
+
+def run_with_llm(coroutine):
+    """
+    asyncio.run for coroutines that make LLM requests: closes the shared HTTP session
+    before the event loop ends.
+    """
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await close_http_session()
+    return asyncio.run(run())
+
+async def _chat_completion(messages, timeout, **params):
+    """
+    Makes one completion request, waiting for a free slot of the in-flight limit first.
+    """
+    async with _get_llm_semaphore():
+        openai.aiosession.set(_get_http_session())
+        return await openai.ChatCompletion.acreate(model=LLM_MODEL, messages=messages, request_timeout=timeout, **params)
+
+async def _stream_completion(messages, timeout, on_delta):
+    """
+    Requests a streamed completion and calls `await on_delta(text_so_far)`
+    for every received chunk. Returns the full text.
+    """
+    async with _get_llm_semaphore():
+        openai.aiosession.set(_get_http_session())
+        chunks = await openai.ChatCompletion.acreate(
+            model=LLM_MODEL,
+            messages=messages,
+            stream=True,
+            request_timeout=timeout
+        )
+        parts = []
+        async for chunk in chunks:
+            delta = chunk.choices[0].delta.get('content') if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                await on_delta(''.join(parts))
+        return ''.join(parts)
+
+def build_condense_messages(chunk, index, count):
+    """
+    Builds the messages that condense one chunk of a long debrief (the map step).
+    """
+    return [
+        {
+            "role": "system",
+            "content": (
+                f"You are given part {index} of {count} of a long debrief of an IDF simulator training session, "
+                "for example radio transcripts. Condense it into notes for a combat report:\n"
+                "- The events of each exercise in chronological order.\n"
+                "- What the force did well and where it needs to improve.\n"
+                "- Keep names, call signs, places and times that matter.\n"
+                "- Keep every exercise or scenario title ('תרגיל'/'תרחיש' and its number) on its own line before its notes.\n"
+                "- Write in Hebrew, in at most 150 words, without any introduction or closing remarks."
+            )
+        },
+        {"role": "user", "content": chunk}
+    ]
+
+@traced("llm.condense")
+async def condense_text(text, timeout):
+    """
+    Map step of long debriefs: splits the text at its exercise headings into chunks of
+    at most LLM_CHUNK_TOKENS tokens and condenses them concurrently (each request
+    within `timeout` seconds). Returns the condensed chunks joined in order; raises
+    the error of a chunk that could not be condensed.
+    """
+    chunks = split_into_chunks(text, LLM_CHUNK_TOKENS, [start for _, start, _ in find_section_headings(text)])
+    current_span().set(chunks=len(chunks))
+    responses = await asyncio.gather(*(
+        llm_client.call(
+            lambda attempt_timeout, messages=build_condense_messages(chunk, index, len(chunks)): _chat_completion(messages, attempt_timeout),
+            timeout
         )
-        raw_text = response.choices[0].message['content'].strip()
-        print("Raw LLM response:\n", raw_text)  # Print the raw response for debugging
+        for index, chunk in enumerate(chunks, start=1)
+    ), return_exceptions=True)
+    for response in responses:
+        if isinstance(response, BaseException):
+            raise response
+    condensed = "\n\n".join(response.choices[0].message['content'].strip() for response in responses)
+    current_span().set(condensed_tokens=estimate_tokens(condensed))
+    return condensed
+
+async def _condense_if_long(text, timeout):
+    """
+    Returns the text, or its condensed version (see condense_text) if it is estimated
+    at more than LLM_SINGLE_SHOT_TOKENS tokens.
+    """
+    tokens = estimate_tokens(text)
+    current_span().set(input_tokens=tokens)
+    if tokens <= LLM_SINGLE_SHOT_TOKENS:
+        return text
+    print(f"Long input (about {tokens} tokens), condensing it in chunks first.")
+    return await condense_text(text, timeout)
+
+@traced("llm.improve_text_async")
+async def improve_text_async(text, date, manager_name, force_name, location, timeout=None, use_cache=True, on_delta=None):
+    """
+    Improves the text with the LLM and returns it as titled sections ("" on failure).
+    At most LLM_MAX_IN_FLIGHT requests run at the same time. Failed requests are
+    retried by llm_client within `timeout` seconds in total (LLM_TIMEOUT by default),
+    and cancelling the awaiting task aborts the request.
+    If on_delta is given the completion is streamed and `await on_delta(text_so_far)`
+    is called as tokens arrive; a retried stream starts over.
+    Long texts are condensed first (see condense_text); the cache is keyed on the
+    original text.
+    """
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    messages = build_messages(text, manager_name)
+    cache_key, cached = _get_cached_response(messages, use_cache)
+    current_span().set(input_chars=len(text), cached=cached is not None, streamed=on_delta is not None)
+    if cached is not None:
+        if on_delta is not None:
+            await on_delta(cached)
+        return cached
+
+    try:
+        messages = build_messages(await _condense_if_long(text, timeout), manager_name)
+        response = None
+        if on_delta is not None:
+            raw_text = await llm_client.call(
+                lambda attempt_timeout: _stream_completion(messages, attempt_timeout, on_delta), timeout, hedge=False
+            )
+        else:
+            response = await llm_client.call(lambda attempt_timeout: _chat_completion(messages, attempt_timeout), timeout)
+            raw_text = response.choices[0].message['content']
+        raw_text = raw_text.strip()
+        _trace_response(response, raw_text)
 
+        if raw_text:
+            llm_cache.put(cache_key, raw_text)
         return raw_text
 
+    except CircuitOpenError as e:
+        print(f"Error: {e}.")
+        return ""
+    except asyncio.TimeoutError:
+        print(f"Error: LLM request timed out after {timeout} seconds.")
+        return ""
     except Exception as e:
         print(f"Error occurred while communicating with LLM: {e}")
         return ""
 
+def find_section_headings(text):
+    """
+    Finds every section heading of the text in a single pass.
+    Returns (section, heading_start, content_start) tuples in text order; numbered
+    exercise headings ("תרגיל 3", "Scenario 2", ...) map to "Exercise <n>".
+    """
+    headings = []
+    for match in _SECTION_HEADING_RE.finditer(text):
+        if match.group('number'):
+            section = f"Exercise {int(match.group('number'))}"
+        else:
+            section = _HEADING_SECTIONS[match.group('name').lower()]
+        headings.append((section, match.start(), match.end()))
+    return headings
+
+def split_sections(text, include_last=True):
+    """
+    Splits the text at its section headings.
+    Returns {section: (content, heading_start)}, keeping the first occurrence of
+    each section. With include_last=False the section after the last heading is
+    left out, since it may still be incomplete.
+    """
+    headings = find_section_headings(text)
+    ends = [heading_start for _, heading_start, _ in headings[1:]] + [len(text)]
+    if not include_last:
+        headings = headings[:-1]
+
+    sections = {}
+    for (section, heading_start, content_start), end in zip(headings, ends):
+        if section not in sections:
+            # Remove '#' and '*' from content
+            content = text[content_start:end].replace('#', '').replace('*', '').strip()
+            sections[section] = (content, heading_start)
+    return sections
+
+@traced("parse_to_sections")
 def parse_to_sections(text):
     """
     Splits the text into a dictionary with the updated sections.
     """
-    # Remove unwanted formatting characters
-    text = text.replace('**', '').replace('*', '').strip()
+    split = split_sections(text.replace('\r\n', '\n'))
 
-    # Define default empty sections
-    sections = {"Introduction": "", "Exercise 1": "", "Exercise 2": "", "Summary": ""}
+    extracted_sections = {}
+    for section in SECTION_NAMES:
+        if section not in split:
+            print(f"Warning: Could not find section '{section}' in the text. It may be missing or formatted differently.")
+        extracted_sections[section] = split.pop(section, ('', 0))[0]
 
-    # Define the possible section names in both English and Hebrew
-    section_names = {
-        "Introduction": ["הקדמה", "מבוא", "Introduction"],
-        "Exercise 1": ["תרגיל 1", "Exercise 1"],
-        "Exercise 2": ["תרגיל 2", "Exercise 2"],
-        "Summary": ["סיכום", "Summary"]
-    }
+    # Additional exercises (e.g. "תרגיל 3") are kept after the standard sections
+    for section, (content, _) in split.items():
+        extracted_sections[section] = content
 
-    # Prepare regex patterns for each section
-    patterns = {}
-    for section, names in section_names.items():
-        # Create a regex pattern that matches any of the names
-        name_pattern = r'|'.join(re.escape(name) for name in names)
-        # Pattern to match the section heading
-        patterns[section] = r'^\s*(%s)[^\n]*\n(.*?)(?=(^\s*(%s)[^\n]*\n|\Z))' % (
-            name_pattern,
-            '|'.join(re.escape(n) for n in sum(section_names.values(), []))
+    current_span().set(input_chars=len(text), sections=len(extracted_sections))
+    return extracted_sections
+
+def parse_completed_sections(partial_text):
+    """
+    Parses a partially streamed LLM response.
+    Returns only the sections that are known to be complete, i.e. whose heading
+    is followed by the heading of another section; the last section is only
+    complete once the full response is passed to parse_to_sections.
+    """
+    split = split_sections(partial_text.replace('\r\n', '\n'), include_last=False)
+    return {section: content for section, (content, _) in split.items()}
+
+def build_structured_messages(text, manager_name):
+    """
+    Builds the messages of a structured (JSON mode) request: the same instructions
+    as build_messages, but the sections are returned as a REPORT_SCHEMA object.
+    """
+    messages = build_messages(text, manager_name)
+    messages[0] = {
+        "role": "system",
+        "content": (
+            messages[0]["content"] + "\n\n"
+            "Output format:\n"
+            "- Instead of titled sections, return only a JSON object matching this JSON schema:\n"
+            f"{json.dumps(REPORT_SCHEMA, ensure_ascii=False)}\n"
+            "- 'exercises' holds one string per exercise, in order.\n"
+            "- Strings contain the section text without its title; separate paragraphs with '\\n'."
         )
+    }
+    return messages
 
-    # Preprocess the text to ensure consistent line breaks
-    text = text.replace('\r\n', '\n')
+def _line_count(text):
+    """
+    Estimates how many lines the text takes in the report (CHARS_PER_LINE characters per line).
+    """
+    return sum(math.ceil(len(line) / CHARS_PER_LINE) for line in text.splitlines() if line.strip())
 
-    # Initialize the sections dictionary
-    extracted_sections = {}
+def _field_name(path):
+    return path[0] if len(path) == 1 else f"{path[0]}[{path[1]}]"
 
-    for section, pattern in patterns.items():
-        match = re.search(pattern, text, re.DOTALL | re.MULTILINE | re.IGNORECASE)
-        if match:
-            content = match.group(2).strip()
-            # Remove '#' and '*' from content
-            content = content.replace('#', '').replace('*', '')
-            extracted_sections[section] = content
+def _check_string(value, schema, path, problems):
+    if not isinstance(value, str) or not value.strip():
+        problems.append((path, "is missing or empty"))
+    elif _line_count(value) > schema["maxLines"]:
+        problems.append((path, f"is {_line_count(value)} lines long, the limit is {schema['maxLines']} lines"))
+
+def validate_report(report):
+    """
+    Validates a structured report against REPORT_SCHEMA.
+    Returns a list of (path, problem) tuples, where path is ("introduction",),
+    ("exercises", index) or ("summary",); empty if the report is valid.
+    """
+    if not isinstance(report, dict):
+        report = {}
+    problems = []
+    for field, schema in REPORT_SCHEMA["properties"].items():
+        value = report.get(field)
+        if schema["type"] == "array":
+            items = value if isinstance(value, list) else []
+            for index in range(max(len(items), schema["minItems"])):
+                _check_string(items[index] if index < len(items) else None, schema["items"], (field, index), problems)
         else:
-            print(f"Warning: Could not find section '{section}' in the text. It may be missing or formatted differently.")
-            extracted_sections[section] = ''
+            _check_string(value, schema, (field,), problems)
+    return problems
 
-    return extracted_sections
+def build_reask_messages(messages, report, path, problem):
+    """
+    Builds a follow-up request that asks for a single section again.
+    """
+    if path[0] == "exercises":
+        section = f"exercise {path[1] + 1} ('תרגיל {path[1] + 1}')"
+    else:
+        section = f"{path[0]} ('{SECTION_NAMES[path[0].capitalize()][0]}')"
+    return messages + [
+        {"role": "assistant", "content": json.dumps(report, ensure_ascii=False)},
+        {
+            "role": "user",
+            "content": (
+                f"The field '{_field_name(path)}' {problem}. "
+                f"Write only the {section} section again, following the instructions, "
+                "and return it as a JSON object: {\"text\": \"...\"}"
+            )
+        }
+    ]
+
+def _set_report_field(report, path, value):
+    if len(path) == 1:
+        report[path[0]] = value
+    else:
+        exercises = report.get(path[0]) if isinstance(report.get(path[0]), list) else []
+        exercises.extend([""] * (path[1] + 1 - len(exercises)))
+        exercises[path[1]] = value
+        report[path[0]] = exercises
+
+@traced("llm.request_json")
+async def _request_json(messages, timeout):
+    """
+    Makes a JSON mode request and returns the decoded object, or None if the
+    response is not a JSON object.
+    """
+    response = await llm_client.call(
+        lambda attempt_timeout: _chat_completion(messages, attempt_timeout, response_format={"type": "json_object"}), timeout
+    )
+    _trace_response(response, response.choices[0].message['content'])
+    try:
+        result = json.loads(response.choices[0].message['content'])
+    except ValueError:
+        return None
+    return result if isinstance(result, dict) else None
+
+def report_to_text(report):
+    """
+    Renders a structured report as titled sections, the format parse_to_sections reads.
+    """
+    exercises = report.get("exercises") if isinstance(report.get("exercises"), list) else []
+    sections = [("הקדמה", report.get("introduction"))]
+    sections += [(f"תרגיל {index}", exercise) for index, exercise in enumerate(exercises, start=1)]
+    sections.append(("סיכום", report.get("summary")))
+    return "\n\n".join(f"{title}\n{content.strip()}" for title, content in sections if isinstance(content, str) and content.strip())
 
-def save_improved_text_to_file(input_text, date, manager_name, force_name, location):
+@traced("llm.improve_text_structured")
+async def improve_text_structured_async(text, date, manager_name, force_name, location, timeout=None, use_cache=True):
+    """
+    Structured version of improve_text_async: the model answers with a JSON object
+    (introduction, exercises[], summary) that is validated against REPORT_SCHEMA.
+    Sections that are missing or over-length are requested again one by one, up to
+    STRUCTURED_MAX_REASKS rounds, instead of regenerating the whole report.
+    Returns the report as titled sections (see report_to_text). Long texts are
+    condensed first, like in improve_text_async.
+    """
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    messages = build_structured_messages(text, manager_name)
+    cache_key = llm_cache.make_key(
+        LLM_MODEL, messages, _cache_params(response_format="json_object", max_reasks=STRUCTURED_MAX_REASKS)
+    )
+    current_span().set(input_chars=len(text), cached=False)
+    if use_cache and not LLM_CACHE_BYPASS:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            print("Using cached LLM response.")
+            current_span().set(cached=True)
+            return cached
+
+    try:
+        messages = build_structured_messages(await _condense_if_long(text, timeout), manager_name)
+        report = await _request_json(messages, timeout)
+        if report is None:
+            # Nothing to repair section by section, ask for the whole object once more
+            print("Warning: LLM response is not a JSON object, requesting it again.")
+            report = await _request_json(messages, timeout)
+            if report is None:
+                print("Error: LLM did not return a JSON object.")
+                return ""
+
+        problems = validate_report(report)
+        for _ in range(STRUCTURED_MAX_REASKS):
+            if not problems:
+                break
+            print(f"Re-requesting {len(problems)} section(s): {', '.join(_field_name(path) for path, _ in problems)}")
+            fixes = await asyncio.gather(*(
+                _request_json(build_reask_messages(messages, report, path, problem), timeout)
+                for path, problem in problems
+            ))
+            for (path, _), fix in zip(problems, fixes):
+                if fix and isinstance(fix.get("text"), str):
+                    _set_report_field(report, path, fix["text"])
+            problems = validate_report(report)
+
+        for path, problem in problems:
+            print(f"Warning: Section '{_field_name(path)}' {problem}.")
+
+        improved_text = report_to_text(report)
+        current_span().set(response_chars=len(improved_text), invalid_sections=len(problems))
+        if improved_text and not problems:
+            llm_cache.put(cache_key, improved_text)
+        return improved_text
+
+    except CircuitOpenError as e:
+        print(f"Error: {e}.")
+        return ""
+    except asyncio.TimeoutError:
+        print(f"Error: LLM request timed out after {timeout} seconds.")
+        return ""
+    except Exception as e:
+        print(f"Error occurred while communicating with LLM: {e}")
+        return ""
+
+def improve_text_structured(text, date, manager_name, force_name, location, use_cache=True):
+    """
+    Blocking version of improve_text_structured_async for the command line.
+    """
+    return run_with_llm(improve_text_structured_async(text, date, manager_name, force_name, location, use_cache=use_cache))
+
+def save_improved_text_to_file(input_text, date, manager_name, force_name, location, use_cache=True, structured=False):
     """
     Enhances the input text and saves the raw response to 'middle.txt'.
+    Returns False (leaving 'middle.txt' unchanged) if no text was received.
+    Unchanged input is served from the LLM cache unless use_cache is False.
+    With structured=True the text is requested in JSON mode (see improve_text_structured).
     """
     # Get the raw response from the LLM
-    raw_text = improve_text(input_text, date, manager_name, force_name, location)
+    improve = improve_text_structured if structured else improve_text
+    raw_text = improve(input_text, date, manager_name, force_name, location, use_cache=use_cache)
+
+    if not raw_text:
+        print("Error: No improved text was received, 'middle.txt' was not updated.")
+        return False
 
     # Save the raw text to middle.txt
     with open("middle.txt", "w", encoding="utf-8") as file:
         file.write(raw_text)
     print("Enhanced text saved to 'middle.txt'")
+    return True
+
+# Title of the combat report documents
+REPORT_TITLE = "אימון בסימולטור DCA"
+
+def create_combat_report_from_text(improved_text, output_path, date="", grades_data=None, signature="", chart_backend="png",
+                                   trends=None):
+    """
+    Parses the improved text into sections and generates the combat report
+    Word document with grades at output_path (a file path or a writable binary stream).
+    trends (see analytics.report_trends) adds the force's progress over its recent sessions.
+    """
+    # Imported on first use: python-docx and matplotlib are only needed here (see startup.py)
+    from document_generator import generate_word_document
+    sections = parse_to_sections(improved_text)
+    generate_word_document(
+        sections,
+        output_path=output_path,
+        date=date,
+        signature=signature,
+        title=REPORT_TITLE,
+        grades_data=grades_data,
+        chart_backend=chart_backend,
+        trends=trends
+    )
 
-def create_combat_report_from_file(file_path="middle.txt", date="", grades_data=None, signature=""):
+def create_combat_report_bytes(improved_text, date="", grades_data=None, signature="", chart_backend="png", trends=None):
+    """
+    Same as create_combat_report_from_text, but builds the document in memory and
+    returns the .docx bytes. Touches no shared files, so it is safe to call for
+    several reports at once (e.g. from the bot's worker threads).
+    """
+    from document_generator import generate_word_document_bytes
+    sections = parse_to_sections(improved_text)
+    return generate_word_document_bytes(
+        sections,
+        date=date,
+        signature=signature,
+        title=REPORT_TITLE,
+        grades_data=grades_data,
+        chart_backend=chart_backend,
+        trends=trends
+    )
+
+def create_combat_report_pdf(improved_text, output_path, date="", grades_data=None, signature=""):
+    """
+    Parses the improved text into sections and generates the combat report as a PDF
+    at output_path (a file path or a writable binary stream).
+    """
+    from pdf_generator import generate_pdf_report
+    sections = parse_to_sections(improved_text)
+    generate_pdf_report(sections, output_path, date=date, signature=signature, title=REPORT_TITLE, grades_data=grades_data)
+
+def create_combat_report_pdf_bytes(improved_text, date="", grades_data=None, signature=""):
+    """
+    Same as create_combat_report_pdf, but returns the PDF bytes.
+    """
+    from pdf_generator import generate_pdf_report_bytes
+    sections = parse_to_sections(improved_text)
+    return generate_pdf_report_bytes(sections, date=date, signature=signature, title=REPORT_TITLE, grades_data=grades_data)
+
+def create_combat_report_from_file(file_path="middle.txt", date="", grades_data=None, signature="", trends=None):
     """
     Reads the improved text from 'middle.txt', parses it into sections,
     and generates the combat report Word document with grades.
@@ -138,9 +696,6 @@ def create_combat_report_from_file(file_path="middle.txt", date="", grades_data=
         print(f"Error: '{file_path}' file not found.")
         return
 
-    # Parse the text into sections
-    sections = parse_to_sections(improved_text)
-
     # Delete the old combat report Word document if it exists
     doc_output_path = "combat_report.docx"
     if os.path.exists(doc_output_path):
@@ -153,12 +708,5 @@ def create_combat_report_from_file(file_path="middle.txt", date="", grades_data=
             return
 
     # Generate Combat Report Word Document with grades
-    generate_word_document(
-        sections,
-        output_path=doc_output_path,
-        date=date,
-        signature=signature,
-        title="אימון בסימולטור DCA",
-        grades_data=grades_data
-    )
+    create_combat_report_from_text(improved_text, doc_output_path, date=date, grades_data=grades_data, signature=signature, trends=trends)
     print(f"Combat report generated and saved as '{doc_output_path}'")
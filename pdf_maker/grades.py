@@ -1,43 +1,66 @@
 # grades.py
 
-def collect_grades():
+# Define the grading structure
+GRADING_PARTS = {
+    "פיקוד ושליטה": [
+        "1.1 גיבוש תמונת מצב",
+        "1.2 ניהול הכוח, חלוקת גזרות, הזרמת כוחות",
+        "1.3 מיקום המפקד המאפשר שליטה בכוח (לא להישאב לרובאות)"
+    ],
+    "עבודת קשר": [
+        "2.1 נדב\"ר בסיסי - עלייה לפי פורמט",
+        "2.2 אסרטיביות ופיקוד בדגש על שליטה בכוח ומניעת קשקשת ברשת",
+        "2.3 דיווחים והכרזות בדגש על סיווג ואיפיון האירוע",
+        "2.4 וידוא קבלה בעיקר בציון ידיעות חשובות"
+    ],
+    "מבצעיות | עקרונות לחימה": [
+        "3.1 שימוש בשפה משותפת",
+        "3.2 פכת\"ט | רואה, מעריך, ממליץ - דיווחים קצרים ומדוייקים",
+        "3.3 מתן מענה לאירועים, קבלת החלטות נכונות",
+        "3.4 שימוש במעטפת - כוחות חבירים, תצפיות וכו'",
+        "3.5 הזדהות, חבירה וסגירת מעגלים - בדגש על מניעת דו\"צים"
+    ]
+}
+
+def summarize_grades(parts, comments):
     """
-    Collects grades and comments for each item from the user.
-    Returns a dictionary with the grades, comments, and calculated averages.
+    Builds the grades dictionary from the collected item grades and part comments.
+    Calculates the average of each part and the final grade.
     """
     grades_data = {}
 
-    # Define the grading structure
-    parts = {
-        "פיקוד ושליטה": {
-            "1.1 גיבוש תמונת מצב": None,
-            "1.2 ניהול הכוח, חלוקת גזרות, הזרמת כוחות": None,
-            "1.3 מיקום המפקד המאפשר שליטה בכוח (לא להישאב לרובאות)": None
-        },
-        "עבודת קשר": {
-            "2.1 נדב\"ר בסיסי - עלייה לפי פורמט": None,
-            "2.2 אסרטיביות ופיקוד בדגש על שליטה בכוח ומניעת קשקשת ברשת": None,
-            "2.3 דיווחים והכרזות בדגש על סיווג ואיפיון האירוע": None,
-            "2.4 וידוא קבלה בעיקר בציון ידיעות חשובות": None
-        },
-        "מבצעיות | עקרונות לחימה": {
-            "3.1 שימוש בשפה משותפת": None,
-            "3.2 פכת\"ט | רואה, מעריך, ממליץ - דיווחים קצרים ומדוייקים": None,
-            "3.3 מתן מענה לאירועים, קבלת החלטות נכונות": None,
-            "3.4 שימוש במעטפת - כוחות חבירים, תצפיות וכו'": None,
-            "3.5 הזדהות, חבירה וסגירת מעגלים - בדגש על מניעת דו\"צים": None
+    total_parts = 0
+    total_parts_score = 0.0
+
+    for part_name, items in parts.items():
+        # Calculate average for the part
+        part_average = round(sum(items.values()) / len(items), 2)
+        grades_data[part_name] = {
+            "items": items,
+            "average": part_average,
+            "comment": comments.get(part_name, "")
         }
-    }
+        total_parts_score += part_average
+        total_parts += 1
 
-    print("Please enter grades between 1 and 10 for each item.\n")
+    # Calculate final grade
+    final_grade = round(total_parts_score / total_parts, 2)
+    grades_data["final_grade"] = final_grade
 
-    total_parts = 0
-    total_parts_score = 0.0
+    return grades_data
+
+def collect_grades():
+    """
+    Collects grades and comments for each item from the user.
+    Returns a dictionary with the grades, comments, and calculated averages.
+    """
+    parts = {part_name: dict.fromkeys(items) for part_name, items in GRADING_PARTS.items()}
+    comments = {}
+
+    print("Please enter grades between 1 and 10 for each item.\n")
 
     for part_name, items in parts.items():
         print(f"\n{part_name}:")
-        part_total = 0.0
-        num_items = len(items)
         for item_name in items:
             while True:
                 try:
@@ -49,21 +72,68 @@ def collect_grades():
                 except ValueError:
                     print("Invalid input. Please enter a number between 1 and 10.")
             items[item_name] = grade
-            part_total += grade
         # Collect comment for the part
-        comment = input(f"Enter comment for {part_name} (in Hebrew): ")
-        # Calculate average for the part
-        part_average = round(part_total / num_items, 2)
-        grades_data[part_name] = {
-            "items": items,
-            "average": part_average,
-            "comment": comment
-        }
-        total_parts_score += part_average
-        total_parts += 1
+        comments[part_name] = input(f"Enter comment for {part_name} (in Hebrew): ")
 
-    # Calculate final grade
-    final_grade = round(total_parts_score / total_parts, 2)
-    grades_data["final_grade"] = final_grade
+    return summarize_grades(parts, comments)
 
-    return grades_data
+def _bot_questions():
+    """
+    Returns the ordered (part, item) questions asked by the bot.
+    An item of None stands for the comment on the part.
+    """
+    questions = []
+    for part_name, items in GRADING_PARTS.items():
+        questions.extend((part_name, item_name) for item_name in items)
+        questions.append((part_name, None))
+    return questions
+
+async def _ask_bot_question(update, question):
+    part_name, item_name = question
+    if item_name is None:
+        await update.message.reply_text(f"הזן הערה עבור {part_name}:")
+    else:
+        await update.message.reply_text(f"{part_name}\n{item_name}\nהזן ציון בין 1 ל-10:")
+
+async def collect_grades_via_bot(update, context):
+    """
+    Conversation step for collecting grades through the Telegram bot.
+    Each call records the answer to the pending question (if any) and asks the next one.
+    Returns True once everything was collected; the result is stored in
+    context.user_data['grades_data'] in the same format as collect_grades.
+    """
+    user_data = context.user_data
+    questions = _bot_questions()
+
+    step = user_data.get('grade_step')
+    if step is None:
+        # First call: nothing to record yet, ask the first question
+        user_data['grade_step'] = 0
+        user_data['grade_items'] = {part_name: {} for part_name in GRADING_PARTS}
+        user_data['grade_comments'] = {}
+        await _ask_bot_question(update, questions[0])
+        return False
+
+    part_name, item_name = questions[step]
+    answer = update.message.text.strip()
+    if item_name is None:
+        user_data['grade_comments'][part_name] = answer
+    else:
+        try:
+            grade = float(answer)
+        except ValueError:
+            grade = None
+        if grade is None or not 1 <= grade <= 10:
+            await update.message.reply_text("ציון לא תקין. הזן מספר בין 1 ל-10.")
+            return False
+        user_data['grade_items'][part_name][item_name] = grade
+
+    step += 1
+    if step < len(questions):
+        user_data['grade_step'] = step
+        await _ask_bot_question(update, questions[step])
+        return False
+
+    user_data['grades_data'] = summarize_grades(user_data.pop('grade_items'), user_data.pop('grade_comments'))
+    del user_data['grade_step']
+    return True
@@ -0,0 +1,340 @@
+# grades_store.py
+
+"""
+SQLite store of graded sessions, for tracking the progress of forces over time.
+
+    with GradesStore() as store:
+        store.add_session(grades_data, "כוח האימון", "01/05/2024")
+        store.item_averages(force_name="כוח האימון")
+        store.latest_deltas("כוח האימון")
+
+Sessions, forces and rubric items are kept in their own tables and every grade is
+one (session, item, grade) row, indexed so that per-force, per-date and per-item
+queries only read the rows they need. Each session also keeps its grades packed in
+two blobs, for loading many sessions into analytics.GradesMatrix.
+"""
+
+import os
+import sqlite3
+from array import array
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database file; an empty value turns off saving the sessions of main.py, the bot and batch.py
+GRADES_DB_PATH = os.getenv("GRADES_DB_PATH", "grades.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forces (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS rubric_items (
+    id INTEGER PRIMARY KEY,
+    part TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (part, name)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    force_id INTEGER NOT NULL REFERENCES forces (id),
+    date TEXT NOT NULL,  -- ISO YYYY-MM-DD so dates sort and compare as text
+    location TEXT NOT NULL DEFAULT '',
+    manager_name TEXT NOT NULL DEFAULT '',
+    final_grade REAL,
+    -- Copy of the session's grades, packed as array('i') item ids and array('d') grades,
+    -- so that many sessions load as one row each (see packed_sessions)
+    item_ids BLOB,
+    grade_values BLOB
+);
+CREATE TABLE IF NOT EXISTS grades (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    item_id INTEGER NOT NULL REFERENCES rubric_items (id),
+    grade REAL NOT NULL,
+    PRIMARY KEY (session_id, item_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS part_comments (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    part TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    PRIMARY KEY (session_id, part)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_force_date ON sessions (force_id, date);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (date);
+CREATE INDEX IF NOT EXISTS sessions_final_grade ON sessions (final_grade);
+CREATE INDEX IF NOT EXISTS grades_item_grade ON grades (item_id, grade);
+"""
+
+def iso_date(date):
+    """
+    Converts a report date (dd/mm/YYYY) to the ISO date stored in the database.
+    ISO dates are returned unchanged.
+    """
+    if isinstance(date, str) and "/" in date:
+        return datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
+    return date
+
+def pack_grades(item_ids, grades):
+    """
+    Returns the (item ids, grades) blobs stored with a session.
+    """
+    return array("i", item_ids).tobytes(), array("d", grades).tobytes()
+
+def _percentile(sorted_values, percentile):
+    """
+    Linearly interpolated percentile (like numpy's default) of already sorted values.
+    """
+    position = (len(sorted_values) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+class GradesStore:
+    """
+    Persistent store of graded sessions in an SQLite database.
+    """
+
+    def __init__(self, path=GRADES_DB_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            # Readers don't block the writer, and commits don't wait for a full disk sync
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(_SCHEMA)
+        self._add_packed_grades()
+        self._force_ids = {}
+        self._item_ids = {}
+
+    def _add_packed_grades(self):
+        """
+        Adds the packed grades columns to a database created without them, and fills them in.
+        """
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(sessions)")}
+        if "item_ids" in columns:
+            return
+        with self.connection:
+            self.connection.execute("ALTER TABLE sessions ADD COLUMN item_ids BLOB")
+            self.connection.execute("ALTER TABLE sessions ADD COLUMN grade_values BLOB")
+            packed = {}
+            for session_id, item_id, grade in self.connection.execute("SELECT session_id, item_id, grade FROM grades"):
+                item_ids, grades = packed.setdefault(session_id, ([], []))
+                item_ids.append(item_id)
+                grades.append(grade)
+            self.connection.executemany(
+                "UPDATE sessions SET item_ids = ?, grade_values = ? WHERE id = ?",
+                [(*pack_grades(item_ids, grades), session_id) for session_id, (item_ids, grades) in packed.items()]
+            )
+            self.connection.execute("UPDATE sessions SET item_ids = x'', grade_values = x'' WHERE item_ids IS NULL")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _force_id(self, name):
+        if name not in self._force_ids:
+            self.connection.execute("INSERT OR IGNORE INTO forces (name) VALUES (?)", (name,))
+            self._force_ids[name] = self.connection.execute("SELECT id FROM forces WHERE name = ?", (name,)).fetchone()[0]
+        return self._force_ids[name]
+
+    def _item_id(self, part, name):
+        key = (part, name)
+        if key not in self._item_ids:
+            self.connection.execute("INSERT OR IGNORE INTO rubric_items (part, name) VALUES (?, ?)", key)
+            self._item_ids[key] = self.connection.execute(
+                "SELECT id FROM rubric_items WHERE part = ? AND name = ?", key
+            ).fetchone()[0]
+        return self._item_ids[key]
+
+    def add_sessions(self, sessions):
+        """
+        Inserts many sessions in one transaction. Each session is a dict with
+        "grades_data" (as returned by grades.summarize_grades), "force_name", "date"
+        (dd/mm/YYYY or YYYY-MM-DD) and optionally "location" and "manager_name".
+        Returns the new session ids.
+        """
+        session_ids = []
+        grade_rows = []
+        comment_rows = []
+        with self.connection:
+            for session in sessions:
+                grades_data = session["grades_data"]
+                parts = {part: part_data for part, part_data in grades_data.items() if part != "final_grade"}
+                item_grades = [
+                    (self._item_id(part, item), grade) for part, part_data in parts.items() for item, grade in part_data["items"].items()
+                ]
+                cursor = self.connection.execute(
+                    "INSERT INTO sessions (force_id, date, location, manager_name, final_grade, item_ids, grade_values) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self._force_id(session["force_name"]),
+                        iso_date(session["date"]),
+                        session.get("location", ""),
+                        session.get("manager_name", ""),
+                        grades_data.get("final_grade"),
+                        *pack_grades([item_id for item_id, _ in item_grades], [grade for _, grade in item_grades])
+                    )
+                )
+                session_id = cursor.lastrowid
+                session_ids.append(session_id)
+                grade_rows.extend((session_id, item_id, grade) for item_id, grade in item_grades)
+                comment_rows.extend((session_id, part, part_data["comment"]) for part, part_data in parts.items() if part_data.get("comment"))
+            self.connection.executemany("INSERT INTO grades (session_id, item_id, grade) VALUES (?, ?, ?)", grade_rows)
+            self.connection.executemany("INSERT INTO part_comments (session_id, part, comment) VALUES (?, ?, ?)", comment_rows)
+        return session_ids
+
+    def add_session(self, grades_data, force_name, date, location="", manager_name=""):
+        """
+        Inserts one graded session and returns its id.
+        """
+        return self.add_sessions([{
+            "grades_data": grades_data, "force_name": force_name, "date": date, "location": location, "manager_name": manager_name
+        }])[0]
+
+    @staticmethod
+    def _session_filter(force_name=None, since=None, until=None):
+        """
+        Returns the WHERE clause (on sessions aliased s and forces aliased f) and its parameters.
+        """
+        conditions, params = [], []
+        if force_name is not None:
+            conditions.append("f.name = ?")
+            params.append(force_name)
+        if since is not None:
+            conditions.append("s.date >= ?")
+            params.append(iso_date(since))
+        if until is not None:
+            conditions.append("s.date <= ?")
+            params.append(iso_date(until))
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def item_averages(self, force_name=None, since=None, until=None):
+        """
+        Returns {(part, item): (count, average)} over the matching sessions.
+        """
+        where, params = self._session_filter(force_name, since, until)
+        if where:
+            sessions = "sessions s JOIN forces f ON f.id = s.force_id JOIN grades g ON g.session_id = s.id"
+        else:
+            # Every session counts: the (item_id, grade) index alone answers the query
+            sessions = "grades g"
+        rows = self.connection.execute(
+            f"SELECT r.part, r.name, COUNT(*), AVG(g.grade) FROM {sessions} "
+            "JOIN rubric_items r ON r.id = g.item_id"
+            f"{where} GROUP BY g.item_id ORDER BY g.item_id",
+            params
+        )
+        return {(part, item): (count, average) for part, item, count, average in rows}
+
+    def rubric_items(self):
+        """
+        Returns the (item id, part, item) of every rubric item.
+        """
+        return self.connection.execute("SELECT id, part, name FROM rubric_items ORDER BY id").fetchall()
+
+    def packed_sessions(self, force_name=None, since=None, until=None):
+        """
+        Returns the (force name, ISO date, item ids, grades) of the matching sessions, by
+        id, with their item ids and grades packed (see pack_grades): one row per session
+        instead of one per grade.
+        """
+        where, params = self._session_filter(force_name, since, until)
+        return self.connection.execute(
+            "SELECT f.name, s.date, s.item_ids, s.grade_values FROM sessions s JOIN forces f ON f.id = s.force_id"
+            f"{where} ORDER BY s.id",
+            params
+        ).fetchall()
+
+    def force_history(self, force_name):
+        """
+        Returns the (session id, ISO date, final grade) of every session of the force, oldest first.
+        """
+        return self.connection.execute(
+            "SELECT s.id, s.date, s.final_grade FROM sessions s JOIN forces f ON f.id = s.force_id "
+            "WHERE f.name = ? ORDER BY s.date, s.id",
+            (force_name,)
+        ).fetchall()
+
+    def session_grades(self, session_id):
+        """
+        Returns {(part, item): grade} of one session.
+        """
+        rows = self.connection.execute(
+            "SELECT r.part, r.name, g.grade FROM grades g JOIN rubric_items r ON r.id = g.item_id WHERE g.session_id = ?",
+            (session_id,)
+        )
+        return {(part, item): grade for part, item, grade in rows}
+
+    def latest_deltas(self, force_name):
+        """
+        Compares the force's last session with the one before it.
+        Returns {(part, item): (latest, previous, latest - previous)}; previous and the
+        delta are None for items not graded in the previous session (or if there is none).
+        """
+        last_two = self.connection.execute(
+            "SELECT s.id FROM sessions s JOIN forces f ON f.id = s.force_id "
+            "WHERE f.name = ? ORDER BY s.date DESC, s.id DESC LIMIT 2",
+            (force_name,)
+        ).fetchall()
+        if not last_two:
+            return {}
+        latest = self.session_grades(last_two[0][0])
+        previous = self.session_grades(last_two[1][0]) if len(last_two) > 1 else {}
+        return {
+            key: (grade, previous.get(key), grade - previous[key] if key in previous else None)
+            for key, grade in latest.items()
+        }
+
+    def item_percentiles(self, percentiles=(25, 50, 75), since=None, until=None):
+        """
+        Returns {(part, item): {percentile: grade}} over all forces' sessions in the date range.
+        """
+        where, params = self._session_filter(None, since, until)
+        if where:
+            query = (
+                "SELECT g.item_id, g.grade FROM sessions s JOIN forces f ON f.id = s.force_id "
+                f"JOIN grades g ON g.session_id = s.id{where} ORDER BY g.item_id, g.grade"
+            )
+        else:
+            # Read straight from the (item_id, grade) index, already in order
+            query = "SELECT item_id, grade FROM grades ORDER BY item_id, grade"
+        grades_by_item = {}
+        for item_id, grade in self.connection.execute(query, params):
+            grades_by_item.setdefault(item_id, []).append(grade)
+
+        items = {item_id: (part, name) for item_id, part, name in self.connection.execute("SELECT id, part, name FROM rubric_items")}
+        return {
+            items[item_id]: {percentile: _percentile(grades, percentile) for percentile in percentiles}
+            for item_id, grades in grades_by_item.items()
+        }
+
+    def final_grade_percentile(self, session_id):
+        """
+        Returns the percentage of all sessions with a lower final grade than this session's.
+        """
+        (final_grade,) = self.connection.execute("SELECT final_grade FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        below, total = self.connection.execute(
+            "SELECT (SELECT COUNT(*) FROM sessions WHERE final_grade < ?), (SELECT COUNT(*) FROM sessions)", (final_grade,)
+        ).fetchone()
+        return 100.0 * below / total
+
+def save_session(grades_data, force_name, date, location="", manager_name="", path=GRADES_DB_PATH):
+    """
+    Saves a graded session to the store at `path` (skipped if path is empty).
+    Returns the session id, or None if it was not saved.
+    """
+    if not path or not grades_data:
+        return None
+    try:
+        with GradesStore(path) as store:
+            return store.add_session(grades_data, force_name, date, location, manager_name)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Warning: Could not save the grades to '{path}': {e}")
+        return None
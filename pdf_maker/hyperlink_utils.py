@@ -4,9 +4,11 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 import docx.opc.constants
 
-def add_hyperlink(paragraph, url, text):
+def add_hyperlink(paragraph, url, text, style=None):
     """
     Adds a clickable hyperlink to a paragraph.
+    If style names a character style, the run refers to it instead of
+    carrying its own font, size, underline and colour.
     """
     # Access the document relationships to create a new hyperlink id
     part = paragraph.part
@@ -26,6 +28,31 @@ def add_hyperlink(paragraph, url, text):
     # Create the run properties and set formatting
     rPr = OxmlElement('w:rPr')
 
+    if style is not None:
+        rStyle = OxmlElement('w:rStyle')
+        rStyle.set(qn('w:val'), paragraph.part.styles[style].style_id)
+        rPr.append(rStyle)
+    else:
+        _add_direct_formatting(rPr)
+
+    # Create the text element and set the text
+    w_t = OxmlElement('w:t')
+    w_t.text = text
+
+    # Build the hyperlink run
+    new_run.append(rPr)
+    new_run.append(w_t)
+    hyperlink.append(new_run)
+
+    # Add the hyperlink to the paragraph
+    paragraph._p.append(hyperlink)
+
+    return hyperlink
+
+def _add_direct_formatting(rPr):
+    """
+    Formats a hyperlink run directly: Arial, 12 pt, underlined and blue.
+    """
     # Set font
     rFonts = OxmlElement('w:rFonts')
     rFonts.set(qn('w:ascii'), 'Arial')
@@ -47,17 +74,3 @@ def add_hyperlink(paragraph, url, text):
     color = OxmlElement('w:color')
     color.set(qn('w:val'), '0000FF')  # Blue color
     rPr.append(color)
-
-    # Create the text element and set the text
-    w_t = OxmlElement('w:t')
-    w_t.text = text
-
-    # Build the hyperlink run
-    new_run.append(rPr)
-    new_run.append(w_t)
-    hyperlink.append(new_run)
-
-    # Add the hyperlink to the paragraph
-    paragraph._p.append(hyperlink)
-
-    return hyperlink
@@ -0,0 +1,162 @@
+# llm_cache.py
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cache location and limits, configurable from the environment
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_MAX_AGE = float(os.getenv("LLM_CACHE_MAX_AGE", str(30 * 24 * 60 * 60)))  # seconds
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+class LLMCache:
+    """
+    Content-addressed on-disk cache for LLM responses.
+    Entries are keyed by a hash of the model, messages and request parameters,
+    expire when unused for max_age seconds and the least recently used entries
+    are evicted once the cache grows past max_bytes. An entry's last use is the
+    modification time of its file.
+    """
+
+    def __init__(self, cache_dir=LLM_CACHE_DIR, max_bytes=LLM_CACHE_MAX_BYTES, max_age=LLM_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, messages, params=None):
+        """
+        Returns the cache key for a request.
+        """
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params or {}},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns the cached response for the key, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.max_age:
+                self._remove(path)
+                self.misses += 1
+                return None
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used for size based eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["response"]
+
+    def put(self, key, response):
+        """
+        Stores the response under the key and evicts old entries if needed.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            # Write to a temporary file first so readers never see a partial entry; its
+            # name is unique, as threads and processes may store the same key at once
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{key}.", suffix=".tmp")
+            try:
+                with open(fd, "w", encoding="utf-8") as file:
+                    json.dump({"created": time.time(), "response": response}, file, ensure_ascii=False)
+                os.replace(temp_path, path)
+            except OSError:
+                self._remove(temp_path)
+                raise
+            self.evict()
+        except OSError as e:
+            print(f"Warning: Could not write LLM cache entry: {e}")
+
+    def evict(self):
+        """
+        Removes the entries unused for max_age, then the least recently used ones
+        until the cache fits in max_bytes.
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        now = time.time()
+        entries = []
+        total_size = 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 2) if lookups else 0.0
+        }
+
+    def summary(self):
+        """
+        Returns the hit/miss counters as one line for the logs.
+        """
+        stats = self.stats()
+        return f"LLM cache: {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.0%})"
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Process-wide cache used by gpt_integration
+llm_cache = LLMCache()
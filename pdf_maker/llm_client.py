@@ -0,0 +1,278 @@
+# llm_client.py
+
+"""
+Retries, deadlines, hedging and a circuit breaker for the LLM requests of gpt_integration.
+
+    result = await llm_client.call(lambda timeout: openai.ChatCompletion.acreate(..., request_timeout=timeout))
+
+The request function is called with its timeout (the seconds left before the
+deadline, or attempt_timeout if that is shorter) and is called again, after a
+jittered exponential backoff or the provider's Retry-After, when it fails with a
+rate limit, a 5xx error, a timeout or a connection error.
+With hedge_after set, a duplicate request is started when the first one has not
+answered after that many seconds and whichever answers first is used.
+After LLM_BREAKER_THRESHOLD consecutive failed attempts (every retry of a call is
+one, so with LLM_MAX_ATTEMPTS=3 two failed calls are enough) the circuit opens and calls
+fail immediately with CircuitOpenError for LLM_BREAKER_RESET seconds; then one
+trial request decides whether it closes again.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import openai
+from dotenv import load_dotenv
+
+from tracing import current_span
+
+load_dotenv()
+
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))  # seconds
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "0")) or None  # seconds, 0 = the rest of the deadline
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0")) or None  # seconds, 0 = no hedging
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))  # consecutive failed attempts, retries included
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # seconds
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while the circuit breaker is open.
+    """
+
+def is_retryable(error):
+    """
+    Returns True for errors that another attempt may not hit: rate limits, 5xx
+    responses, timeouts and connection errors.
+    """
+    if isinstance(error, (asyncio.TimeoutError, openai.error.Timeout, openai.error.APIConnectionError,
+                          openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+        return True
+    if isinstance(error, openai.error.OpenAIError):
+        status = error.http_status
+        return status is not None and (status == 429 or status >= 500)
+    return False
+
+def _retry_after(error):
+    """
+    Returns the seconds the provider asked to wait before retrying, if it did.
+    """
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed attempts, retries included (LLMClient.call records every
+    attempt); at `threshold` the circuit opens and requests are refused for
+    `reset_timeout` seconds, after which a single trial call is let through.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """
+        Returns True if a request may be made now, "trial" if it is the half-open trial
+        call, or False.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return "trial"
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Frees the trial call's slot without recording an outcome, for a call that was
+        cancelled, so that the next request can make the trial.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Records a failed call. Returns True if this opened the circuit.
+        """
+        with self._lock:
+            self.failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+            if reopen or (self.opened_at is None and self.threshold and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+class LLMMetrics:
+    """
+    Counters and latencies of the calls made through an LLMClient in this process.
+    """
+
+    def __init__(self, window=1000):
+        self.counts = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                       "rejected": 0, "circuit_opened": 0}
+        self.latencies = deque(maxlen=window)  # seconds, of the last `window` successful calls
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def snapshot(self):
+        """
+        Returns the counters and the p50/p95/p99 latency (seconds) of recent successful calls.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            snapshot = dict(self.counts)
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            snapshot[f"latency_{name}"] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3) if latencies else None
+        return snapshot
+
+class LLMClient:
+    """
+    Makes LLM requests with a deadline, retries, optional hedging and a circuit breaker.
+    """
+
+    def __init__(self, max_attempts=LLM_MAX_ATTEMPTS, backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX,
+                 attempt_timeout=LLM_ATTEMPT_TIMEOUT, hedge_after=LLM_HEDGE_AFTER, breaker=None, metrics=None):
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or LLMMetrics()
+
+    def backoff(self, attempt, error):
+        """
+        Seconds to wait before retry number `attempt` (1, 2, ...): the provider's
+        Retry-After if given, else a random delay of up to base * 2^(attempt-1) ("full jitter").
+        """
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def call(self, request, deadline, hedge=True):
+        """
+        Awaits request(timeout) until it succeeds, retrying retryable errors within
+        `deadline` seconds in total. Returns its result, or raises the last error
+        (asyncio.TimeoutError once the deadline has passed) or CircuitOpenError.
+        hedge=False disables hedging, e.g. for streamed requests whose output is
+        already being shown.
+        """
+        self.metrics.count("calls")
+        start = time.monotonic()
+        end = start + deadline
+        attempt = 1
+        while True:
+            allowed = self.breaker.allow()
+            if not allowed:
+                self.metrics.count("rejected")
+                raise CircuitOpenError(f"LLM provider unavailable, requests are paused for up to {self.breaker.reset_timeout:.0f} seconds")
+            timeout = end - time.monotonic()
+            if self.attempt_timeout:
+                timeout = min(timeout, self.attempt_timeout)
+            try:
+                if timeout <= 0:
+                    raise asyncio.TimeoutError()
+                result = await self._attempt(request, timeout, hedge)
+            except asyncio.CancelledError:
+                # Cancelled by the caller (/cancel, a new conversation, shutdown): says nothing
+                # about the provider, but the trial slot must be freed for the next request
+                if allowed == "trial":
+                    self.breaker.release_trial()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable and self.breaker.record_failure():
+                    self.metrics.count("circuit_opened")
+                if not retryable:
+                    # The request itself is wrong (e.g. invalid or unauthorized), not the provider
+                    self.breaker.record_success()
+                delay = self.backoff(attempt, e) if retryable else 0.0
+                if not retryable or attempt >= self.max_attempts or time.monotonic() + delay >= end:
+                    self.metrics.count("failures")
+                    current_span().set(attempts=attempt)
+                    raise
+                self.metrics.count("retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.metrics.count("successes")
+            self.metrics.record_latency(time.monotonic() - start)
+            current_span().set(attempts=attempt)
+            return result
+
+    async def _attempt(self, request, timeout, hedge):
+        """
+        One attempt, limited to `timeout` seconds. With hedging, a second request is
+        started if the first takes longer than hedge_after and the first answer wins.
+        """
+        if not hedge or not self.hedge_after or self.hedge_after >= timeout:
+            return await asyncio.wait_for(request(timeout), timeout)
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(asyncio.wait_for(request(timeout), timeout))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done:
+                return primary.result()
+
+            self.metrics.count("hedges")
+            hedge_timeout = timeout - (time.monotonic() - start)
+            tasks.append(asyncio.ensure_future(asyncio.wait_for(request(hedge_timeout), hedge_timeout)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.metrics.count("hedge_wins")
+                        return task.result()
+            # Both failed
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Retrieve the exceptions of the losing requests so none goes unreported
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+# Process-wide client used by gpt_integration
+llm_client = LLMClient()
@@ -1,32 +1,90 @@
 # main.py
 
-from gpt_integration import save_improved_text_to_file, create_combat_report_from_file
 from grades import collect_grades
+from grades_store import save_session
+from llm_cache import llm_cache
+from startup import preload_report_modules
+from concurrent.futures import Future
 from datetime import datetime
+import sys
+import threading
+
+def run_in_background(function, *args, **kwargs):
+    """
+    Starts function(*args, **kwargs) on a daemon thread and returns a Future for its result.
+    A daemon thread does not keep the program alive if the user quits (e.g. Ctrl+C) meanwhile.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def improve_text_to_file(*args, **kwargs):
+    """
+    save_improved_text_to_file, with gpt_integration (openai, aiohttp) imported on the
+    calling thread: run in the background, it lets the first grade prompt appear at once.
+    """
+    from gpt_integration import save_improved_text_to_file
+    return save_improved_text_to_file(*args, **kwargs)
 
 if __name__ == "__main__":
-    # Step 1: Read 'input.txt', extract date, and enhance text
+    # Set manager name and other details
+    manager_name = "יואב סמיפור"  # Replace with actual manager name if needed
+    force_name = "כוח האימון"    # Replace with the actual force name
+    location = "מיקום האימון"    # Replace with the actual location
+
+    # Extract the date from the input text or set current date
+    date = datetime.now().strftime('%d/%m/%Y')
+
+    # Step 1: Read 'input.txt' and start enhancing the text in the background, so
+    # the LLM request runs while the grades are entered
+    improvement = None
     try:
         with open("input.txt", "r", encoding="utf-8") as file:
             input_text = file.read()
 
-        # Extract the date from the input text or set current date
-        date = datetime.now().strftime('%d/%m/%Y')
-
-        # Set manager name and other details
-        manager_name = "יואב סמיפור"  # Replace with actual manager name if needed
-        force_name = "כוח האימון"    # Replace with the actual force name
-        location = "מיקום האימון"    # Replace with the actual location
-
-        # Save the improved text to 'middle.txt'
-        save_improved_text_to_file(input_text, date, manager_name, force_name, location)
+        # Save the improved text to 'middle.txt' (pass --no-cache to force a new LLM request,
+        # --structured to request the sections as validated JSON)
+        use_cache = "--no-cache" not in sys.argv
+        structured = "--structured" in sys.argv
+        improve_args = (input_text, date, manager_name, force_name, location)
+        improvement = run_in_background(improve_text_to_file, *improve_args, use_cache=use_cache, structured=structured)
+        print("Improving the text in the background, meanwhile enter the grades.")
 
     except FileNotFoundError:
         print("Error: 'input.txt' file not found.")
-        date = datetime.now().strftime('%d/%m/%Y')
+
+    # Import the document modules and load the chart fonts while the grades are entered
+    preload_report_modules()
 
     # Step 2: Collect grades from the user
     grades_data = collect_grades()
 
-    # Step 3: Generate combat report document with grades
-    create_combat_report_from_file(date=date, grades_data=grades_data, signature=manager_name)
+    # Wait for the improved text
+    if improvement is not None:
+        if not improvement.done():
+            print("Waiting for the improved text...")
+        improved = improvement.result()
+        while not improved and input("Improving the text failed. Try again? [y/N] ").strip().lower() in ("y", "yes"):
+            improved = improve_text_to_file(*improve_args, use_cache=use_cache, structured=structured)
+        print(llm_cache.summary())
+        if not improved:
+            # Don't go on to build a report from an empty or stale 'middle.txt', but keep the grades entered
+            if save_session(grades_data, force_name, date, location, manager_name) is not None:
+                print("The grades were saved to the grades store.")
+            sys.exit(1)
+
+    # Step 3: Generate combat report document with grades and the force's progress since earlier sessions
+    from analytics import report_trends
+    from gpt_integration import create_combat_report_from_file
+    trends = report_trends(grades_data, force_name, date)
+    create_combat_report_from_file(date=date, grades_data=grades_data, signature=manager_name, trends=trends)
+
+    # Keep the session's grades for tracking the force's progress
+    save_session(grades_data, force_name, date, location, manager_name)
@@ -0,0 +1,286 @@
+# mock_llm_server.py
+
+"""
+Local stand-in for the OpenAI chat completions endpoint, for load and latency tests.
+Run `python mock_llm_server.py [options]` (see -h) and point gpt_integration at it:
+
+    OPENAI_API_BASE=http://127.0.0.1:8787/v1 OPENAI_API_KEY=mock python batch.py ...
+
+Answers every request with the canned four-section report (the JSON version for
+response_format json_object requests), streamed or not, after a latency drawn from
+a configurable distribution. Errors (429, 500, hung requests) can be injected at
+given rates, and requests over the requests-per-minute or concurrency limits get a
+429 like the real API.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+from fake_llm import CANNED_RESPONSE, CANNED_STRUCTURED_RESPONSE, split_chunks
+
+DEFAULT_PORT = 8787
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution and returns a function sampling it in seconds:
+    "1.5" (fixed), "uniform:MIN,MAX" or "lognormal:MEDIAN,SIGMA".
+    """
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda rng: value
+    values = [float(value) for value in params.split(",")]
+    if kind == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Unknown latency distribution '{spec}', expected a number, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    HTTP server answering POST /v1/chat/completions like the OpenAI API.
+    Each request is handled on its own thread, so slow responses overlap.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), latency="1.0", chunk_delay=0.0, rate_429=0.0, rate_500=0.0,
+                 rate_timeout=0.0, hang_seconds=600.0, requests_per_minute=0, max_concurrent=0, response=None, seed=None):
+        super().__init__(address, MockLLMHandler)
+        self.sample_latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.chunk_delay = chunk_delay
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_timeout = rate_timeout
+        self.hang_seconds = hang_seconds
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent = max_concurrent
+        self.response = response
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent_starts = deque()
+        self.in_flight = 0
+        # Response status (or "timeout") -> count
+        self.counts = {}
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self):
+        """
+        Decides the outcome of a new request: None to answer it, or 429, 500 or "timeout".
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._recent_starts and now - self._recent_starts[0] >= 60:
+                self._recent_starts.popleft()
+            if self.requests_per_minute and len(self._recent_starts) >= self.requests_per_minute:
+                return 429
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                return 429
+            roll = self.random.random()
+            if roll < self.rate_429:
+                return 429
+            if roll < self.rate_429 + self.rate_500:
+                return 500
+            if roll < self.rate_429 + self.rate_500 + self.rate_timeout:
+                return "timeout"
+            self._recent_starts.append(now)
+            self.in_flight += 1
+            return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def latency(self):
+        with self._lock:
+            return max(0.0, self.sample_latency(self.random))
+
+    def answer(self, request):
+        if self.response is not None:
+            return self.response
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return CANNED_STRUCTURED_RESPONSE
+        return CANNED_RESPONSE
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass  # One line per request would swamp a load test
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status):
+        error_type, message = {
+            404: ("invalid_request_error", "Unknown endpoint"),
+            429: ("rate_limit_error", "Rate limit reached for requests"),
+            500: ("server_error", "The server had an error while processing your request"),
+        }[status]
+        self.server.count(status)
+        headers = [("Retry-After", "1")] if status == 429 else []
+        self._send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": None}}, headers)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        outcome = self.server.admit()
+        if outcome == "timeout":
+            # Never answer; the client has to give up on its own
+            self.server.count("timeout")
+            time.sleep(self.server.hang_seconds)
+            self.close_connection = True
+            return
+        if outcome is not None:
+            self._send_error(outcome)
+            return
+
+        try:
+            content = self.server.answer(request)
+            if request.get("stream"):
+                self._stream(request, content)
+            else:
+                time.sleep(self.server.latency() + len(split_chunks(content)) * self.server.chunk_delay)
+                self._send_json(200, self._completion(request, content))
+            self.server.count(200)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count("disconnected")
+        finally:
+            self.server.release()
+
+    def _completion(self, request, content):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+        return {
+            "id": f"chatcmpl-mock-{id(self)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content.split()),
+                "total_tokens": prompt_tokens + len(content.split())
+            }
+        }
+
+    def _stream(self, request, content):
+        """
+        Sends the answer as server-sent events, one word per chunk.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_chunk(delta, finish_reason=None):
+            chunk = {
+                "id": f"chatcmpl-mock-{id(self)}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(self.server.latency())
+        send_chunk({"role": "assistant"})
+        for piece in split_chunks(content):
+            send_chunk({"content": piece})
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+        send_chunk({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+@contextmanager
+def running_mock_server(**settings):
+    """
+    Starts a MockLLMServer on a free local port in a background thread and points
+    openai at it for the duration of the block. Yields the server.
+    """
+    server = MockLLMServer(("127.0.0.1", 0), **settings)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original_base, original_key = openai.api_base, openai.api_key
+    openai.api_base = server.api_base
+    openai.api_key = original_key or "mock"
+    try:
+        yield server
+    finally:
+        openai.api_base, openai.api_key = original_base, original_key
+        server.shutdown()
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", default="1.0", help="Seconds to the first token: N, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA.")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds per streamed word.")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of requests answered with 500.")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="Fraction of requests that never get an answer.")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests accepted per minute, 429 above (0 = no limit).")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Requests handled at once, 429 above (0 = no limit).")
+    parser.add_argument("--response-file", help="Answer with the text of this file instead of the canned report.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    response = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as file:
+            response = file.read()
+
+    server = MockLLMServer(
+        (args.host, args.port),
+        latency=args.latency,
+        chunk_delay=args.chunk_delay,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_timeout=args.rate_timeout,
+        requests_per_minute=args.rpm,
+        max_concurrent=args.max_concurrent,
+        response=response,
+        seed=args.seed
+    )
+    print(f"Mock LLM server listening on {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Responses: {server.counts}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+# pdf_generator.py
+
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from bidi.algorithm import get_display
+from PIL import Image
+from fontTools import subset, ttLib
+from fpdf import FPDF
+
+from document_generator import CLOSING_TITLE, CLOSING_MESSAGE, CONTACT_INFO, DEFAULT_TITLE, LOGO2_PATH, report_section_titles
+from docx_charts import PART_CHART_COLOR, FINAL_CHART_COLOR
+from report_styles import REPORT_STYLES
+from tracing import span, traced
+
+# Hebrew capable fonts shipped with the package (PDF_FONTS_DIR points elsewhere). A font
+# that is missing or unreadable there is taken from matplotlib, which bundles DejaVu Sans.
+FONTS_DIR = os.getenv("PDF_FONTS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+PDF_FONT_FAMILY = "DejaVu"
+PDF_FONT_FILES = {"": "DejaVuSans.ttf", "B": "DejaVuSans-Bold.ttf"}
+
+# Characters the report fonts are cut down to: Latin, Hebrew, punctuation and currency signs.
+# Loading a full DejaVu font for every document costs more than laying out the whole report.
+PDF_FONT_UNICODES = (
+    set(range(0x20, 0x7F)) | set(range(0xA0, 0x100)) | set(range(0x590, 0x600))
+    | set(range(0x2000, 0x2070)) | set(range(0x20A0, 0x20D0)) | set(range(0xFB1D, 0xFB50))
+)
+
+# Reduced copies of the report fonts, made once per process
+_subset_fonts_dir = None
+_subset_fonts_lock = threading.Lock()
+
+# Logo flattened onto white and JPEG encoded once per process: (cache key, JPEG bytes).
+# A JPEG is embedded as is, while a PNG is decoded and recompressed for every document.
+_logo_jpeg = None
+
+# Line height as a multiple of the font size
+LINE_SPACING = 1.4
+
+def _rgb(hex_color):
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+def _remove_subset_fonts():
+    if _subset_fonts_dir is not None:
+        shutil.rmtree(_subset_fonts_dir, ignore_errors=True)
+
+atexit.register(_remove_subset_fonts)
+
+def _load_font(file_name):
+    """
+    Opens the font from FONTS_DIR, or matplotlib's copy of it if that one can't be read.
+    """
+    path = os.path.join(FONTS_DIR, file_name)
+    try:
+        return ttLib.TTFont(path)
+    except (OSError, ttLib.TTLibError) as e:
+        # Imported here: only needed without usable fonts in FONTS_DIR
+        import matplotlib
+        fallback = os.path.join(matplotlib.get_data_path(), "fonts", "ttf", file_name)
+        print(f"Warning: Could not load font '{path}' ({e}), using '{fallback}' instead.")
+        return ttLib.TTFont(fallback)
+
+def subset_font_path(file_name):
+    """
+    Returns the path of a copy of the font from FONTS_DIR (see _load_font) that only holds
+    the PDF_FONT_UNICODES glyphs, creating it in a private temporary directory on first use.
+    """
+    global _subset_fonts_dir
+    with _subset_fonts_lock:
+        if _subset_fonts_dir is None:
+            _subset_fonts_dir = tempfile.mkdtemp(prefix="pdf_fonts_")
+        path = os.path.join(_subset_fonts_dir, file_name)
+        if not os.path.exists(path):
+            font = _load_font(file_name)
+            options = subset.Options()
+            options.layout_features = ['*']
+            options.name_IDs = ['*']
+            options.notdef_outline = True
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(unicodes=PDF_FONT_UNICODES)
+            subsetter.subset(font)
+            font.save(path)
+        return path
+
+def _logo_image():
+    """
+    Returns the logo as a JPEG stream ready to embed.
+    """
+    global _logo_jpeg
+    cache_key = os.path.getmtime(LOGO2_PATH)
+    if _logo_jpeg is None or _logo_jpeg[0] != cache_key:
+        with Image.open(LOGO2_PATH) as logo:
+            logo = logo.convert("RGBA")
+            flattened = Image.new("RGB", logo.size, (255, 255, 255))
+            flattened.paste(logo, mask=logo.getchannel("A"))
+        buffer = BytesIO()
+        flattened.save(buffer, format="JPEG", quality=90)
+        _logo_jpeg = (cache_key, buffer.getvalue())
+    return BytesIO(_logo_jpeg[1])
+
+class ReportPDF(FPDF):
+    """
+    A4 report page layout. Text is laid out in logical (typing) order and each
+    line is reordered for display with the bidi algorithm, like the chart labels
+    in chart_utils; charts are drawn as vector shapes.
+    """
+
+    def __init__(self):
+        super().__init__(format="A4")
+        self.set_margins(20, 20, 20)
+        self.set_auto_page_break(True, margin=20)
+        for style, file_name in PDF_FONT_FILES.items():
+            self.add_font(PDF_FONT_FAMILY, style, subset_font_path(file_name))
+
+    def use_style(self, style):
+        """
+        Sets the font and colour of one of the report styles (see report_styles).
+        """
+        spec = REPORT_STYLES[style]
+        font_style = ("B" if spec.get("bold") else "") + ("U" if spec.get("underline") else "")
+        self.set_font(PDF_FONT_FAMILY, font_style, spec["size"])
+        self.set_text_color(*(spec.get("color") or (0, 0, 0)))
+
+    def wrap(self, text, width):
+        """
+        Splits text into lines (still in logical order) that fit in width.
+        Words wider than a whole line, such as long URLs, are broken between characters.
+        """
+        lines = []
+        for paragraph in text.split("\n"):
+            line = ""
+            for word in paragraph.split():
+                candidate = f"{line} {word}" if line else word
+                if self.get_string_width(candidate) <= width:
+                    line = candidate
+                    continue
+                if line:
+                    lines.append(line)
+                line = word
+                while self.get_string_width(line) > width:
+                    cut = len(line) - 1
+                    while cut > 1 and self.get_string_width(line[:cut]) > width:
+                        cut -= 1
+                    lines.append(line[:cut])
+                    line = line[cut:]
+            lines.append(line)
+        return lines
+
+    def paragraph(self, text, style, link=""):
+        """
+        Adds a centered paragraph in the given report style.
+        """
+        self.use_style(style)
+        line_height = self.font_size * LINE_SPACING
+        for line in self.wrap(text, self.epw):
+            self.cell(self.epw, line_height, get_display(line), align="C", new_x="LMARGIN", new_y="NEXT", link=link)
+
+    def contact_line(self, label, value, style, link=""):
+        """
+        Adds a centered "label: value" line with a Hebrew label and a left-to-right
+        value (URL, e-mail or phone number). The parts are placed explicitly, since the
+        bidi algorithm would move the value's leading/trailing symbols ('+', '/') to the
+        wrong end of the line.
+        """
+        self.use_style(style)
+        line_height = self.font_size * LINE_SPACING
+        visual_label = get_display(f"{label}:")
+        line = f"{value} {visual_label}"
+        lines = [line] if self.get_string_width(line) <= self.epw else [visual_label, value]
+        for line in lines:
+            self.cell(self.epw, line_height, line, align="C", new_x="LMARGIN", new_y="NEXT", link=link)
+
+    def blank_line(self):
+        self.ln(REPORT_STYLES["Report Body"]["size"] * 0.35 * LINE_SPACING)
+
+    def chart_height(self, max_items):
+        """
+        Height of a chart; same proportions as the matplotlib charts (8 x max_items * 0.5 + 1).
+        """
+        return self.epw * (max_items * 0.5 + 1) / 8
+
+    def bar_chart(self, labels, values, title, axis_title, color, max_items):
+        """
+        Draws a horizontal bar chart (0-10 scale) laid out like the matplotlib charts
+        of chart_utils: the first label at the top, the value next to each bar and the
+        height proportional to max_items so all charts of a report line up.
+        """
+        width = self.epw
+        height = self.chart_height(max_items)
+        if self.will_page_break(height):
+            self.add_page()
+        left, top = self.l_margin, self.get_y()
+
+        title_height, axis_height = 9, 13
+        label_width = width * 0.35
+        plot_left = left + label_width + 2
+        plot_width = width - label_width - 10
+        plot_top = top + title_height
+        plot_height = height - title_height - axis_height
+
+        self.set_text_color(0, 0, 0)
+        self.set_font(PDF_FONT_FAMILY, "", 12)
+        self.set_xy(left, top)
+        self.cell(width, title_height - 2, get_display(title), align="C")
+
+        # Axes, ticks and vertical grid positions every 2 points
+        self.set_draw_color(0, 0, 0)
+        self.set_line_width(0.2)
+        self.line(plot_left, plot_top, plot_left, plot_top + plot_height)
+        self.line(plot_left, plot_top + plot_height, plot_left + plot_width, plot_top + plot_height)
+        self.set_font(PDF_FONT_FAMILY, "", 8)
+        for tick in range(0, 11, 2):
+            x = plot_left + plot_width * tick / 10
+            self.line(x, plot_top + plot_height, x, plot_top + plot_height + 1)
+            self.set_xy(x - 5, plot_top + plot_height + 1)
+            self.cell(10, 4, str(tick), align="C")
+        self.set_font(PDF_FONT_FAMILY, "", 10)
+        self.set_xy(plot_left, plot_top + plot_height + 6)
+        self.cell(plot_width, 5, get_display(axis_title), align="C")
+
+        # Bars, value labels and category labels
+        slot = plot_height / len(labels)
+        bar_height = slot * 0.4
+        self.set_fill_color(*_rgb(color))
+        for index, (label, value) in enumerate(zip(labels, values)):
+            center = plot_top + slot * (index + 0.5)
+            self.rect(plot_left, center - bar_height / 2, plot_width * min(value, 10) / 10, bar_height, style="F")
+
+            self.set_font(PDF_FONT_FAMILY, "", 8)
+            self.set_xy(plot_left + plot_width * min(value, 10) / 10 + 0.5, center - 2)
+            self.cell(8, 4, f"{value}")
+
+            label_lines = self.wrap(label, label_width)[:2]
+            line_height = 3.5
+            for line_index, line in enumerate(label_lines):
+                self.set_xy(left, center - line_height * len(label_lines) / 2 + line_height * line_index)
+                self.cell(label_width, line_height, get_display(line), align="R")
+
+        self.set_xy(left, top + height)
+
+def _add_grades(pdf, grades_data):
+    """
+    Adds the grades page(s): a chart and comment per part and the final grade chart.
+    """
+    pdf.add_page()
+    pdf.paragraph('דוח ציונים', "Report Section Heading")
+
+    parts = [part_name for part_name in grades_data if part_name != 'final_grade']
+    max_items = max(len(grades_data[part_name]['items']) for part_name in parts)
+    for part_name in parts:
+        part_data = grades_data[part_name]
+        # Keep the part heading on the same page as its chart
+        heading_height = REPORT_STYLES["Report Part Heading"]["size"] * 0.35 * LINE_SPACING
+        if pdf.will_page_break(heading_height + pdf.chart_height(max_items)):
+            pdf.add_page()
+        pdf.paragraph(part_name, "Report Part Heading")
+        items = part_data['items']
+        pdf.bar_chart(list(items.keys()), list(items.values()), part_name, "ציון", PART_CHART_COLOR, max_items)
+        if part_data.get('comment'):
+            pdf.paragraph(part_data['comment'], "Report Comment")
+
+    pdf.paragraph(f"ציון סופי: {grades_data['final_grade']}", "Report Final Grade")
+    averages = [grades_data[part_name]['average'] for part_name in parts]
+    pdf.bar_chart(parts, averages, 'ציון ממוצע לכל חלק', "ציון ממוצע", FINAL_CHART_COLOR, max_items)
+
+def _add_final_page(pdf):
+    """
+    Adds the static final page (thank-you message, contact links and logo).
+    """
+    pdf.add_page()
+    pdf.paragraph(CLOSING_TITLE, "Report Closing Title")
+    pdf.paragraph(CLOSING_MESSAGE, "Report Closing Message")
+    for label, info in CONTACT_INFO.items():
+        if label != "טלפון":
+            link = f"mailto:{info}" if "@" in info else info
+            pdf.contact_line(label, info, "Report Hyperlink", link=link)
+        else:
+            pdf.contact_line(label, info, "Report Contact")
+
+    if os.path.exists(LOGO2_PATH):
+        pdf.blank_line()
+        pdf.image(_logo_image(), x=pdf.l_margin, w=pdf.epw)
+    else:
+        print(f"Warning: Logo file '{LOGO2_PATH}' not found. Skipping logo.")
+
+def build_report_pdf(sections, date="", signature="", title="", grades_data=None):
+    """
+    Builds the report as a PDF with the same content as document_generator.build_report_document.
+    """
+    pdf = ReportPDF()
+    pdf.set_title(title or DEFAULT_TITLE)
+    pdf.add_page()
+
+    pdf.paragraph(title or DEFAULT_TITLE, "Report Title")
+    pdf.blank_line()
+
+    for section_title, hebrew_title in report_section_titles(sections):
+        if sections.get(section_title):
+            pdf.paragraph(hebrew_title, "Report Section Heading")
+            content = sections[section_title].replace('#', '').replace('*', '')
+            pdf.paragraph(content, "Report Body")
+
+    if grades_data:
+        _add_grades(pdf, grades_data)
+
+    _add_final_page(pdf)
+
+    if signature:
+        pdf.blank_line()
+        pdf.paragraph(signature, "Report Signature")
+    return pdf
+
+def generate_pdf_report(sections, output_path, date="", signature="", title="", grades_data=None):
+    """
+    Generates the report PDF and saves it to output_path (a file path or a writable binary stream).
+    """
+    data = generate_pdf_report_bytes(sections, date=date, signature=signature, title=title, grades_data=grades_data)
+    if hasattr(output_path, "write"):
+        output_path.write(data)
+    else:
+        with open(output_path, "wb") as file:
+            file.write(data)
+
+@traced("generate_pdf_report")
+def generate_pdf_report_bytes(sections, date="", signature="", title="", grades_data=None):
+    """
+    Generates the report PDF and returns it as bytes.
+    """
+    with span("pdf.build", sections=len(sections)):
+        pdf = build_report_pdf(sections, date=date, signature=signature, title=title, grades_data=grades_data)
+    with span("pdf.output") as current:
+        data = bytes(pdf.output())
+        current.set(pages=pdf.pages_count, bytes=len(data))
+    return data
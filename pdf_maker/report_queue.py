@@ -0,0 +1,212 @@
+# report_queue.py
+
+"""
+Queue of report builds for the bot, run on a pool of worker processes.
+
+    job = report_queue.submit(user_id, build_function, *args)   # may raise QueueFullError / UserLimitError
+    position = report_queue.position(job)                       # 0 once a worker has it
+    report_bytes = await job.future
+
+Building a document is CPU-bound (charts, pictures, document.save); on worker
+processes it neither blocks the event loop nor competes with it for the GIL.
+Jobs start in the order they were submitted. At most REPORT_QUEUE_SIZE jobs wait
+at a time, and each user may have at most REPORT_JOBS_PER_USER jobs waiting or
+running, so one user cannot fill the queue for everyone else.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from tracing import span
+
+load_dotenv()
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", "20"))  # jobs waiting for a worker
+REPORT_JOBS_PER_USER = int(os.getenv("REPORT_JOBS_PER_USER", "1"))  # jobs waiting or running, 0 = no limit
+
+class QueueFullError(Exception):
+    """
+    Raised by submit() when REPORT_QUEUE_SIZE jobs are already waiting.
+    """
+
+class UserLimitError(Exception):
+    """
+    Raised by submit() when the user already has REPORT_JOBS_PER_USER jobs waiting or running.
+    """
+
+class ReportJob:
+    """
+    A submitted build. Await job.future for the function's result (or its exception);
+    it is cancelled if the job is cancelled before a worker takes it.
+    """
+
+    def __init__(self, user_id, function, args):
+        self.user_id = user_id
+        self.function = function
+        self.args = args
+        self.future = asyncio.get_running_loop().create_future()
+        self.submitted = time.monotonic()
+
+class ReportQueue:
+    """
+    FIFO queue of ReportJobs run by `workers` worker tasks, each handing one job at a
+    time to a process pool of the same size. Use it from one event loop.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, max_queued=REPORT_QUEUE_SIZE, per_user=REPORT_JOBS_PER_USER, initializer=None):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.initializer = initializer
+        self.pending = deque()
+        self.running = 0
+        self._jobs_per_user = {}
+        self._available = None
+        self._tasks = []
+        self._pool = None
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected_full": 0, "rejected_user": 0}
+
+    def _new_pool(self):
+        # Spawned, not forked: the bot process already runs threads (HTTP clients, the preload)
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=self.initializer
+        )
+
+    def start(self):
+        """
+        Starts the worker tasks on the running loop and the process pool.
+        """
+        if self._tasks:
+            return
+        self._available = asyncio.Semaphore(0)
+        self._pool = self._new_pool()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def warm_up(self):
+        """
+        Starts every worker process now (running the initializer) instead of on the first jobs.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, os.getpid) for _ in range(self.workers)))
+
+    async def shutdown(self):
+        """
+        Stops the worker tasks, cancels the waiting jobs and shuts the process pool down.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self.pending:
+            self.pending.popleft().future.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def submit(self, user_id, function, *args):
+        """
+        Queues function(*args) for a worker process; function must be picklable (defined
+        at module level). Returns the ReportJob, or raises QueueFullError or UserLimitError.
+        """
+        self.start()
+        if self.per_user and self._jobs_per_user.get(user_id, 0) >= self.per_user:
+            self.counts["rejected_user"] += 1
+            raise UserLimitError(f"User {user_id} already has {self.per_user} report(s) in progress")
+        # Jobs that an idle worker is about to take are not waiting
+        waiting = max(0, len(self.pending) - (self.workers - self.running))
+        if waiting >= self.max_queued:
+            self.counts["rejected_full"] += 1
+            raise QueueFullError(f"{waiting} reports are already waiting")
+
+        job = ReportJob(user_id, function, args)
+        self._jobs_per_user[user_id] = self._jobs_per_user.get(user_id, 0) + 1
+        self.pending.append(job)
+        self.counts["submitted"] += 1
+        self._available.release()
+        return job
+
+    def position(self, job):
+        """
+        Returns how many jobs, this one included, have to wait for a busy worker before
+        this one starts: 0 if it is running (or about to, on an idle worker) or done.
+        """
+        try:
+            index = self.pending.index(job)
+        except ValueError:
+            return 0
+        return max(0, index + 1 - (self.workers - self.running))
+
+    def cancel(self, job):
+        """
+        Cancels a job. A waiting job is removed from the queue; a running one still
+        finishes on its worker, but its result is dropped.
+        """
+        if job in self.pending:
+            self.pending.remove(job)
+            self._finish(job)
+        if not job.future.done():
+            job.future.cancel()
+            self.counts["cancelled"] += 1
+
+    def user_jobs(self, user_id):
+        """
+        Returns the number of the user's jobs waiting or running.
+        """
+        return self._jobs_per_user.get(user_id, 0)
+
+    def stats(self):
+        return {"queued": len(self.pending), "running": self.running, "workers": self.workers, **self.counts}
+
+    def _finish(self, job):
+        remaining = self._jobs_per_user.get(job.user_id, 1) - 1
+        if remaining > 0:
+            self._jobs_per_user[job.user_id] = remaining
+        else:
+            self._jobs_per_user.pop(job.user_id, None)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._available.acquire()
+            if not self.pending:
+                continue  # The job it was released for was cancelled
+            job = self.pending.popleft()
+            self.running += 1
+            waited = time.monotonic() - job.submitted
+            try:
+                with span("report_queue.job", waited=round(waited, 3)) as current:
+                    start = time.monotonic()
+                    pool = self._pool
+                    try:
+                        result = await loop.run_in_executor(pool, job.function, *job.args)
+                    except BrokenProcessPool:
+                        # A worker process died (e.g. out of memory): replace the pool for the next
+                        # jobs, unless another worker task already has
+                        if self._pool is pool:
+                            pool.shutdown(wait=False)
+                            self._pool = self._new_pool()
+                        raise
+                    current.set(build=round(time.monotonic() - start, 3))
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                self.counts["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.counts["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.running -= 1
+                self._finish(job)
@@ -0,0 +1,81 @@
+# report_styles.py
+
+import weakref
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor
+
+# Font used for all report text (must support Hebrew)
+REPORT_FONT = 'Arial'
+
+# Named report styles: style name -> formatting.
+# Headings are based on the built-in heading styles so they keep their outline level.
+REPORT_STYLES = {
+    "Report Title": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 18, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Section Heading": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Heading 1", "size": 14, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Part Heading": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Heading 2", "size": 12, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Body": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 10, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Comment": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 10, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Final Grade": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 14, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Closing Title": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Title", "size": 24, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Closing Message": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 14, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Contact": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 12, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Signature": {"type": WD_STYLE_TYPE.PARAGRAPH, "base": "Normal", "size": 12, "bold": True, "align": WD_ALIGN_PARAGRAPH.CENTER},
+    "Report Hyperlink": {"type": WD_STYLE_TYPE.CHARACTER, "size": 12, "underline": True, "color": RGBColor(0x00, 0x00, 0xFF)},
+}
+
+# Style name -> style id for each document part, so adding a paragraph does not
+# search the whole styles part for the style by name every time
+_style_ids = weakref.WeakKeyDictionary()
+
+def _set_font(font, size=None, bold=None, underline=None, color=None):
+    """
+    Sets the report font on a style's font.
+    """
+    font.name = REPORT_FONT
+    font._element.rPr.rFonts.set(qn('w:eastAsia'), REPORT_FONT)  # Fix for Hebrew characters
+    if size is not None:
+        font.size = Pt(size)
+    if bold is not None:
+        font.bold = bold
+    if underline is not None:
+        font.underline = underline
+    if color is not None:
+        font.color.rgb = color
+
+def register_report_styles(document):
+    """
+    Adds the report styles to the document (once) so content can refer to them by name
+    instead of formatting every run.
+    """
+    styles = document.styles
+    existing = {style.name for style in styles}
+    for name, spec in REPORT_STYLES.items():
+        if name in existing:
+            continue
+        style = styles.add_style(name, spec["type"])
+        if spec["type"] == WD_STYLE_TYPE.PARAGRAPH:
+            # Fall back to Normal if the template lacks the built-in base style
+            style.base_style = styles[spec["base"] if spec["base"] in existing else "Normal"]
+            style.next_paragraph_style = styles["Normal"]
+            style.paragraph_format.alignment = spec["align"]
+        style.quick_style = True
+        _set_font(style.font, spec.get("size"), spec.get("bold"), spec.get("underline"), spec.get("color"))
+
+def _style_id(document, style):
+    """
+    Returns the style id of the named style, resolved once per document.
+    """
+    ids = _style_ids.setdefault(document.part, {})
+    if style not in ids:
+        ids[style] = document.styles[style].style_id
+    return ids[style]
+
+def add_styled_paragraph(document, text, style):
+    """
+    Appends a paragraph with the given text that is formatted only through the named style.
+    """
+    paragraph = document.add_paragraph(text)
+    paragraph._p.style = _style_id(document, style)
+    return paragraph
@@ -0,0 +1,52 @@
+# startup.py
+
+"""
+Background loading of the modules that are only needed to build a report.
+
+main.py and the bot show their first prompt without waiting for matplotlib,
+python-docx and fpdf: those are imported on first use, or ahead of it by
+preload_report_modules() while the user types.
+`python benchmarks.py startup` measures the import time of the entry points.
+"""
+
+import importlib
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set to 0 to import the report modules only when the first report is built
+PRELOAD_REPORT_MODULES = os.getenv("PRELOAD_REPORT_MODULES", "1") != "0"
+
+# Modules imported on first use by gpt_integration, main.py and the bot
+REPORT_MODULES = ("document_generator", "pdf_generator", "analytics")
+
+def load_report_modules(modules=REPORT_MODULES, warm_up=True):
+    """
+    Imports the report modules and, with warm_up, loads the chart fonts.
+    Also used to start the bot's report worker processes (see report_queue).
+    """
+    try:
+        for module in modules:
+            importlib.import_module(module)
+        if warm_up:
+            from chart_fonts import warm_up_fonts
+            warm_up_fonts()
+    except Exception as e:
+        # The report build imports them again and reports the error where it matters
+        print(f"Warning: Preloading the report modules failed: {e}")
+
+def preload_report_modules(modules=REPORT_MODULES, warm_up=True):
+    """
+    Imports the report modules (and with warm_up, loads the chart fonts) on a daemon
+    thread and returns the thread, or None if PRELOAD_REPORT_MODULES is off.
+    A report built before it finishes waits for the imports in progress instead of
+    starting them again.
+    """
+    if not PRELOAD_REPORT_MODULES:
+        return None
+    thread = threading.Thread(target=load_report_modules, args=(modules, warm_up), name="preload-report-modules", daemon=True)
+    thread.start()
+    return thread
@@ -1,12 +1,23 @@
 # bot.py
 
 import os
+import time
+import asyncio
+import uuid
+from datetime import datetime
 from telegram import Update, InputMediaDocument
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, ConversationHandler, filters,
 )
-from gpt_integration import improve_text, create_combat_report_from_text
+from gpt_integration import improve_text_async, create_combat_report_bytes, parse_completed_sections, close_http_session, SECTION_NAMES
 from grades import collect_grades_via_bot
+from grades_store import save_session
+from startup import load_report_modules
+from report_queue import ReportQueue, QueueFullError, UserLimitError
+from bot_state import BotStatePersistence, BOT_STATE_PATH
+from llm_cache import llm_cache
+from tracing import traced, current_span
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,48 +25,351 @@ load_dotenv()
 # Constants for conversation states
 INPUT_TEXT, COLLECT_GRADES = range(2)
 
+# Report details
+MANAGER_NAME = "יואב סמיפור"  # Replace with actual manager name if needed
+FORCE_NAME = "כוח האימון"    # Replace with the actual force name
+LOCATION = "מיקום האימון"    # Replace with the actual location
+
+# Minimum seconds between edits of a streamed message (Telegram rate limits message edits)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+# Telegram's maximum message length
+MAX_MESSAGE_LENGTH = 4096
+
+# Documents are built on worker processes (REPORT_WORKERS, REPORT_QUEUE_SIZE and
+# REPORT_JOBS_PER_USER configure the queue), each with the report modules loaded
+report_queue = ReportQueue(initializer=load_report_modules)
+# Tasks sending finished reports, kept referenced until they are done
+_deliveries = set()
+# Running LLM requests by user id, and report jobs by user id and report id. They stay
+# out of user_data, which is persisted (see bot_state): after a restart a conversation
+# resumes from its input_text, improved_text and grades, and every report not sent yet
+# is built again from its entry in user_data['reports'].
+_llm_tasks = {}
+_report_jobs = {}
+# user_data keys of the conversation in progress, cleared when it is over
+CONVERSATION_KEYS = ('input_text', 'date', 'improved_text', 'grades_data', 'grade_step', 'grade_items', 'grade_comments')
+
+class StreamingMessage:
+    """
+    Shows a streamed LLM response by editing a single Telegram message,
+    at most once every `interval` seconds.
+    """
+
+    def __init__(self, message, interval=STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self._last_edit = 0.0
+        self._last_text = message.text
+
+    async def _edit(self, text):
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH - 3] + "..."
+        if text == self._last_text:
+            return
+        try:
+            await self.message.edit_text(text)
+            self._last_text = text
+        except TelegramError as e:
+            print(f"Warning: Could not update streamed message: {e}")
+
+    async def update(self, partial_text):
+        """
+        Called with the text received so far; edits the message if the interval has passed.
+        """
+        now = time.monotonic()
+        if now - self._last_edit < self.interval:
+            return
+        self._last_edit = now
+        ready = len(parse_completed_sections(partial_text).keys() & SECTION_NAMES.keys())
+        await self._edit(f"משפר את הטקסט... ({ready}/{len(SECTION_NAMES)} סעיפים מוכנים)\n\n{partial_text}")
+
+    async def finish(self, text):
+        """
+        Replaces the message with the final text.
+        """
+        await self._edit(text)
+
+def _clear_conversation(user_data):
+    for key in CONVERSATION_KEYS:
+        user_data.pop(key, None)
+
+@traced("bot.start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if report_queue.per_user and report_queue.user_jobs(update.effective_user.id) >= report_queue.per_user:
+        # Don't start another paid LLM request for a report that would be refused
+        await update.message.reply_text("הדוח הקודם שלך עדיין בהכנה ויישלח בקרוב. ניתן להתחיל דוח חדש אחרי שיתקבל.")
+        return ConversationHandler.END
+    # A new report replaces one that was not finished
+    llm_task = _llm_tasks.pop(update.effective_user.id, None)
+    if llm_task is not None:
+        llm_task.cancel()
+    _clear_conversation(context.user_data)
     await update.message.reply_text(
         "ברוכים הבאים לבוט יצירת דוח סיכום קרב!\n"
         "שלח לי את הטקסט שברצונך לשפר ולכלול בדוח."
     )
     return INPUT_TEXT
 
+async def _improve_in_background(update, context, input_text, date, streaming_message):
+    """
+    Runs the LLM request of a conversation while its grades are collected.
+    The answer is streamed into the status message and kept in user_data; a failure
+    is reported right away so the user does not have to finish the grades first.
+    """
+    user_id = update.effective_user.id
+    improved_text = await improve_text_async(input_text, date, MANAGER_NAME, FORCE_NAME, LOCATION, on_delta=streaming_message.update)
+    if improved_text:
+        if _llm_tasks.get(user_id) is asyncio.current_task():
+            # Saved with the conversation, so a restart does not lose the paid-for text
+            context.user_data['improved_text'] = improved_text
+            context.application.mark_data_for_update_persistence(user_ids=user_id)
+        await streaming_message.finish(improved_text)
+    else:
+        await update.message.reply_text("שיפור הטקסט נכשל. ניתן לנסות שוב עם /start.")
+    return improved_text
+
+async def _start_improving(update, context, status_text="משפר את הטקסט ברקע..."):
+    """
+    Starts the LLM request for the conversation's input_text as a task, so that /cancel
+    can abort it, with the answer streamed into a new status message. Returns the task.
+    """
+    status_message = await update.message.reply_text(status_text)
+    llm_task = asyncio.create_task(_improve_in_background(
+        update, context, context.user_data['input_text'], context.user_data['date'], StreamingMessage(status_message)
+    ))
+    _llm_tasks[update.effective_user.id] = llm_task
+    return llm_task
+
+def _llm_failed(llm_task):
+    return llm_task.done() and not llm_task.cancelled() and not llm_task.result()
+
+@traced("bot.receive_text")
 async def receive_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    input_text = update.message.text
-    context.user_data['input_text'] = input_text
+    context.user_data['input_text'] = update.message.text
+    context.user_data['date'] = datetime.now().strftime('%d/%m/%Y')
 
-    # Improve the text using GPT-4
-    await update.message.reply_text("משפר את הטקסט, אנא המתן...")
-    improved_text = improve_text(input_text)
-    context.user_data['improved_text'] = improved_text
+    # Improve the text using GPT-4 in the background while the grades are collected,
+    # so the instructor does not wait for the LLM
+    await _start_improving(update, context)
 
     await update.message.reply_text(
-        "הטקסט שופר בהצלחה.\n"
-        "עכשיו נתחיל באיסוף ציונים.\n"
+        "בינתיים נתחיל באיסוף ציונים.\n"
         "הזן ציון בין 1 ל-10 עבור כל פריט."
     )
 
     # Start collecting grades
     context.user_data['grades_data'] = {}
-    return await collect_grades_via_bot(update, context)
+    await collect_grades_via_bot(update, context)
+    return COLLECT_GRADES
+
+def _build_report(improved_text, date, grades_data):
+    """
+    Returns the .docx bytes of the report, with the force's progress since its earlier sessions.
+    Runs on a report_queue worker process.
+    """
+    from analytics import report_trends
+    trends = report_trends(grades_data, FORCE_NAME, date)
+    return create_combat_report_bytes(improved_text, date=date, grades_data=grades_data, signature=MANAGER_NAME, trends=trends)
+
+@traced("bot.receive_grade")
+async def receive_grade(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    llm_task = _llm_tasks.get(user_id)
+    if llm_task is None and 'improved_text' not in context.user_data:
+        if 'input_text' not in context.user_data:
+            await update.message.reply_text("לא נמצא טקסט לדוח. ניתן להתחיל מחדש עם /start.")
+            return ConversationHandler.END
+        # The bot restarted before the text was improved: request it again, and go on
+        # with the grades entered so far
+        llm_task = await _start_improving(update, context, "הבוט הופעל מחדש, ממשיכים מאותה נקודה. משפר את הטקסט שוב ברקע...")
+    if llm_task is not None and _llm_failed(llm_task):
+        # Already reported by _improve_in_background
+        _llm_tasks.pop(user_id, None)
+        _clear_conversation(context.user_data)
+        return ConversationHandler.END
 
+    if not await collect_grades_via_bot(update, context):
+        return COLLECT_GRADES
+
+    # Join the LLM request started when the text arrived (unless it finished before a restart)
+    waiting = llm_task is not None and not llm_task.done()
+    if llm_task is not None:
+        if waiting:
+            await update.message.reply_text("כל הציונים נאספו. ממתין לסיום שיפור הטקסט...")
+        try:
+            improved_text = await llm_task
+        except asyncio.CancelledError:
+            if not llm_task.cancelled():
+                raise
+            return ConversationHandler.END
+        finally:
+            if _llm_tasks.get(user_id) is llm_task:
+                _llm_tasks.pop(user_id)
+        if not improved_text:
+            _clear_conversation(context.user_data)
+            return ConversationHandler.END
+        context.user_data['improved_text'] = improved_text
+    else:
+        improved_text = context.user_data['improved_text']
+
+    # Queue the document build; _deliver_report sends it when it is ready, and the
+    # conversation ends now
+    date, grades_data = context.user_data['date'], context.user_data['grades_data']
+    try:
+        job = report_queue.submit(user_id, _build_report, improved_text, date, grades_data)
+    except UserLimitError:
+        await update.message.reply_text("הדוח הקודם שלך עדיין בהכנה, ולכן הדוח הזה לא נוצר. ניתן לנסות שוב עם /start אחרי שיתקבל.")
+        _clear_conversation(context.user_data)
+        return ConversationHandler.END
+    except QueueFullError:
+        await update.message.reply_text("המערכת עמוסה כרגע ולא ניתן ליצור את הדוח. אנא נסו שוב בעוד מספר דקות עם /start.")
+        _clear_conversation(context.user_data)
+        return ConversationHandler.END
+
+    position = report_queue.position(job)
+    current_span().set(queue_position=position)
+    if position:
+        await update.message.reply_text(f"הדוח נכנס לתור (מקום {position}) ויישלח אליך כשיהיה מוכן.")
+    else:
+        await update.message.reply_text("יוצר את הדוח..." if waiting else "כל הציונים נאספו. יוצר את הדוח...")
+    # The report keeps what it is built from until it is sent, to build it again after a
+    # restart; the conversation is over, and the user may start the next one
+    report = {"chat_id": update.effective_chat.id, "improved_text": improved_text, "date": date, "grades_data": grades_data}
+    report_id = uuid.uuid4().hex
+    context.user_data.setdefault('reports', {})[report_id] = report
+    _clear_conversation(context.user_data)
+    _start_delivery(context.application, user_id, report_id, report, job)
+    return ConversationHandler.END
+
+def _start_delivery(application, user_id, report_id, report, job):
+    _report_jobs.setdefault(user_id, {})[report_id] = job
+    delivery = asyncio.create_task(_deliver_report(application, user_id, report_id, report, job))
+    _deliveries.add(delivery)
+    delivery.add_done_callback(_deliveries.discard)
+
+def _forget_report(application, user_id, report_id):
+    """
+    Removes a report's job and its entry in user_data['reports'].
+    """
+    jobs = _report_jobs.get(user_id, {})
+    jobs.pop(report_id, None)
+    if not jobs:
+        _report_jobs.pop(user_id, None)
+    user_data = application.user_data[user_id]
+    reports = user_data.get('reports', {})
+    reports.pop(report_id, None)
+    if not reports:
+        user_data.pop('reports', None)
+    application.mark_data_for_update_persistence(user_ids=user_id)
+
+@traced("bot.deliver_report")
+async def _deliver_report(application, user_id, report_id, report, job):
+    """
+    Sends the report once its queued build is done, saves the session's grades and
+    removes the report's entry from user_data.
+    """
+    chat_id, date, grades_data = report["chat_id"], report["date"], report["grades_data"]
+    try:
+        report_bytes = await job.future
+    except asyncio.CancelledError:
+        return  # Cancelled with /cancel, or the bot is shutting down (and builds it again after the restart)
+    except Exception as e:
+        print(f"Error: Building the report failed: {e}")
+        report_bytes = None
+
+    _forget_report(application, user_id, report_id)
+    try:
+        if report_bytes is None:
+            await application.bot.send_message(chat_id, "יצירת הדוח נכשלה. ניתן לנסות שוב עם /start.")
+            return
+        current_span().set(bytes=len(report_bytes))
+        await application.bot.send_document(chat_id, report_bytes, filename="combat_report.docx")
+    except TelegramError as e:
+        print(f"Error: Could not send the report: {e}")
+        return
+
+    # Keep the session's grades for tracking the force's progress
+    await asyncio.to_thread(save_session, grades_data, FORCE_NAME, date, LOCATION, MANAGER_NAME)
+
+async def _resume_reports(application):
+    """
+    Queues again the reports that were not sent when the bot stopped.
+    """
+    for user_id, user_data in list(application.user_data.items()):
+        for report_id, report in list(user_data.get('reports', {}).items()):
+            try:
+                job = report_queue.submit(user_id, _build_report, report["improved_text"], report["date"], report["grades_data"])
+                message = "הבוט הופעל מחדש. הדוח שלך נוצר שוב ויישלח אליך כשיהיה מוכן."
+            except (QueueFullError, UserLimitError):
+                job = None
+                _forget_report(application, user_id, report_id)
+                message = "הבוט הופעל מחדש ולא ניתן היה ליצור את הדוח שלך. ניתן לנסות שוב עם /start."
+            try:
+                await application.bot.send_message(report["chat_id"], message)
+            except TelegramError as e:
+                print(f"Warning: Could not notify user {user_id} of the restart: {e}")
+            if job is not None:
+                _start_delivery(application, user_id, report_id, report, job)
+
+@traced("bot.busy")
+async def busy(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Answers a message sent while receive_grade still handles the previous one of the
+    conversation (after the last grade it waits for the LLM request).
+    """
+    if context.user_data.get('grades_data'):
+        await update.message.reply_text("כל הציונים נאספו. הדוח ייווצר כשהטקסט המשופר יהיה מוכן. לביטול: /cancel.")
+    else:
+        await update.message.reply_text("ההודעה הקודמת עדיין בטיפול. שלח את התשובה שוב בעוד רגע.")
+
+@traced("bot.cancel")
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Abort a pending LLM request for this conversation, if any
+    user_id = update.effective_user.id
+    llm_task = _llm_tasks.pop(user_id, None)
+    if llm_task is not None:
+        llm_task.cancel()
+    # And the queued reports (a report already being built is still built, but not sent)
+    for report_job in _report_jobs.pop(user_id, {}).values():
+        report_queue.cancel(report_job)
+    context.user_data.pop('reports', None)
+    _clear_conversation(context.user_data)
     await update.message.reply_text("הפעולה בוטלה. ניתן להתחיל מחדש עם /start.")
     return ConversationHandler.END
 
+async def post_init(application):
+    # Start the report worker processes while the bot starts polling, so the first
+    # report after a restart is as fast as the others
+    application.create_task(report_queue.warm_up())
+    await _resume_reports(application)
+
+async def shutdown(application):
+    # Stop the report workers and close the HTTP session shared by the LLM requests
+    await report_queue.shutdown()
+    await close_http_session()
+    print(llm_cache.summary())
+
 def main():
     # Get the bot token from environment variables
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    application = ApplicationBuilder().token(bot_token).build()
+    builder = ApplicationBuilder().token(bot_token).post_init(post_init).post_shutdown(shutdown)
+    if BOT_STATE_PATH:
+        # Conversations survive a restart (BOT_STATE_PATH and BOT_STATE_SAVE_INTERVAL configure it)
+        builder = builder.persistence(BotStatePersistence())
+    application = builder.build()
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
         states={
             INPUT_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_text)],
-            COLLECT_GRADES: [MessageHandler(filters.TEXT & ~filters.COMMAND, collect_grades_via_bot)],
+            # Non-blocking, so other chats are handled while the last grade waits for the LLM;
+            # meanwhile the messages of this conversation go to the WAITING handlers
+            COLLECT_GRADES: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_grade, block=False)],
+            ConversationHandler.WAITING: [CommandHandler('cancel', cancel), MessageHandler(filters.TEXT, busy)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name="report",
+        persistent=bool(BOT_STATE_PATH),
     )
 
     application.add_handler(conv_handler)
@@ -0,0 +1,37 @@
+# test_analytics.py
+
+import numpy as np
+
+from analytics import GradesMatrix, default_items, report_trends
+from grades import GRADING_PARTS, summarize_grades
+from grades_store import GradesStore
+
+def _grades_data(grade):
+    parts = {part: dict.fromkeys(items, grade) for part, items in GRADING_PARTS.items()}
+    return summarize_grades(parts, {})
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "grades.db")
+    with GradesStore(path) as store:
+        matrix = GradesMatrix.from_store(store)
+    assert matrix.grades.shape == (0, 0)
+    assert len(matrix) == 0
+    assert report_trends(_grades_data(7), "כוח א", "01/01/2024", path=path) is None
+
+def test_no_records():
+    matrix = GradesMatrix.from_records([])
+    assert matrix.grades.shape == (0, len(default_items()))
+    assert np.isnan(matrix.item_means()).all()
+
+def test_store_matches_records(tmp_path):
+    records = [
+        {"grades_data": _grades_data(grade), "force_name": force_name, "date": date}
+        for grade, force_name, date in [(6, "כוח א", "01/01/2024"), (8, "כוח ב", "2024-02-01"), (9, "כוח א", "01/03/2024")]
+    ]
+    with GradesStore(str(tmp_path / "grades.db")) as store:
+        store.add_sessions(records)
+        from_store = GradesMatrix.from_store(store)
+    from_records = GradesMatrix.from_records(records, from_store.items)
+    np.testing.assert_array_equal(from_store.grades, from_records.grades)
+    assert from_store.force_names == from_records.force_names
+    np.testing.assert_array_equal(from_store.dates, from_records.dates)
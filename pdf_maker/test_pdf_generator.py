@@ -0,0 +1,11 @@
+# test_pdf_generator.py
+
+from grades import GRADING_PARTS, summarize_grades
+from pdf_generator import generate_pdf_report_bytes
+
+def test_report_pdf_with_default_fonts():
+    # With the fonts the package ships in FONTS_DIR (or matplotlib's if those can't be read)
+    sections = {"Introduction": "הקדמה לאימון", "Exercise 1": "תרגיל ראשון", "Summary": "סיכום האימון"}
+    grades_data = summarize_grades({part: dict.fromkeys(items, 8) for part, items in GRADING_PARTS.items()}, {})
+    data = generate_pdf_report_bytes(sections, date="01/01/2024", signature="מפקד", title="דוח", grades_data=grades_data)
+    assert data.startswith(b"%PDF")
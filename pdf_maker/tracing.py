@@ -0,0 +1,225 @@
+# tracing.py
+
+"""
+Lightweight timing spans for the report pipeline.
+
+    with span("docx.save") as current:
+        document.save(path)
+        current.set(bytes=os.path.getsize(path))
+
+    @traced("bot.receive_text")
+    async def receive_text(update, context): ...
+
+Tracing is off unless REPORT_TRACE=1 (or enable_tracing() is called); while off,
+span() returns a shared no-op object and traced functions only check one flag.
+When on, every finished span is logged as one JSON line (to REPORT_TRACE_LOG or
+stderr) with its duration, parent span and attributes, and durations are aggregated
+per span name for trace_report(). REPORT_TRACE_SUMMARY=1 prints that report at exit.
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_ENABLED = os.getenv("REPORT_TRACE", "").lower() in ("1", "true", "yes")
+TRACE_LOG = os.getenv("REPORT_TRACE_LOG", "")
+TRACE_SUMMARY = os.getenv("REPORT_TRACE_SUMMARY", "").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("combat_report.trace")
+logger.propagate = False
+
+_enabled = False
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Span name -> [count, total seconds, max seconds]
+_stats = {}
+_stats_lock = threading.Lock()
+
+class _NoopSpan:
+    """
+    Returned by span() while tracing is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    A timed section of work. Attributes (token counts, byte sizes, ...) can be added
+    with set() until the span ends.
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        self.parent_id = None
+        self._start = 0.0
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _record(self.name, duration)
+        _log({
+            "span": self.name,
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "duration_ms": round(duration * 1000, 3),
+            **self.attributes
+        })
+        return False
+
+def span(name, **attributes):
+    """
+    Returns a context manager timing the enclosed block as a span called `name`.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+def current_span():
+    """
+    Returns the innermost running span, so a traced function can add attributes to it.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _current_span.get() or _NOOP_SPAN
+
+def event(name, **attributes):
+    """
+    Logs a point-in-time event (e.g. the raw LLM response) inside the current span.
+    """
+    if not _enabled:
+        return
+    parent = _current_span.get()
+    _log({"event": name, "parent": parent.span_id if parent is not None else None, **attributes})
+
+def traced(name=None):
+    """
+    Decorator that runs every call of the function (sync or async) in a span.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                with Span(span_name, {}):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _record(name, duration):
+    with _stats_lock:
+        stats = _stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+def _log(record):
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+def enable_tracing(log_path=None):
+    """
+    Turns tracing on, logging spans to log_path (stderr if not given).
+    """
+    global _enabled
+    logger.handlers.clear()
+    handler = logging.FileHandler(log_path, encoding="utf-8") if log_path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    _enabled = True
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+
+def tracing_enabled():
+    return _enabled
+
+def trace_stats():
+    """
+    Returns {span name: {"count", "total_ms", "mean_ms", "max_ms"}} for the spans so far.
+    """
+    with _stats_lock:
+        return {
+            name: {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3),
+                "max_ms": round(maximum * 1000, 3)
+            }
+            for name, (count, total, maximum) in _stats.items()
+        }
+
+def reset_trace_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def trace_report():
+    """
+    Returns the aggregated span durations as a table, slowest total first.
+    """
+    stats = trace_stats()
+    lines = [f"{'span':<32} {'count':>6} {'total':>11} {'mean':>10} {'max':>10}"]
+    for name, row in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"{name:<32} {row['count']:>6} {row['total_ms']:>9.1f}ms {row['mean_ms']:>8.1f}ms {row['max_ms']:>8.1f}ms"
+        )
+    return "\n".join(lines)
+
+def _print_trace_report():
+    if _stats:
+        print(trace_report(), file=sys.stderr)
+
+if TRACE_ENABLED:
+    enable_tracing(TRACE_LOG or None)
+if TRACE_SUMMARY:
+    atexit.register(_print_trace_report)